@@ -0,0 +1,6 @@
+"""
+Benchmarks for the extraction pipeline. Each module
+is runnable on its own, e.g.
+
+    python -m bench.tokenizer
+"""
@@ -0,0 +1,200 @@
+"""
+Synthetic TREC style corpus generator, so the pipeline can
+be measured without the licensed datasets.
+
+    python -m bench.corpus <root> [--size N] [--seed S]
+                                  [--mix plain=4,html=3,multipart=2,original=1]
+                                  [--spam RATIO]
+
+writes <root>/trec05p-1, <root>/trec06p (data/NNN/NNN and
+full/index) and <root>/trec07p (data/inmail.N and full/index),
+the layout sanitize.py expects in data/trec-raw. The same
+arguments always produce the same bytes.
+"""
+import random
+import argparse
+from pathlib import Path
+
+
+KINDS = ["plain", "html", "multipart", "original"]
+default_mix = {"plain": 4, "html": 3, "multipart": 2, "original": 1}
+
+# Targets per data/NNN directory of the 05/06 layouts.
+targets_per_corpus = 300
+
+_SPAM_WORDS = ["free", "money", "viagra", "click", "offer", "limited", "winner",
+               "cash", "cheap", "pills", "unsubscribe", "guaranteed", "$$$", "!!!"]
+_HAM_WORDS = ["meeting", "tomorrow", "project", "report", "attached", "thanks",
+              "schedule", "review", "draft", "lunch", "café", "résumé", "naïve"]
+_PUNCTUATION = ["", "", "", ",", ".", "!", "?", ":", "'s"]
+
+
+def parse_mix(text):
+    """Parses plain=4,html=3,... into a kind -> weight dict."""
+    mix = {}
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        if kind not in KINDS:
+            raise RuntimeError(f"Unknown email kind {kind}, expected one of {', '.join(KINDS)}")
+        mix[kind] = float(weight) if weight != "" else 1.0
+    return mix
+
+
+class EmailGenerator:
+    """Generates emails from a zipf distributed vocabulary."""
+
+    def __init__(self, seed=0, mix=default_mix, vocabulary=5000):
+        self.rng = random.Random(seed)
+        rng = self.rng
+        letters = "abcdefghijklmnopqrstuvwxyz"
+        self.words = sorted({"".join(rng.choice(letters) for _ in range(rng.randint(2, 10)))
+                             for _ in range(vocabulary)})
+        rng.shuffle(self.words)
+        self.weights = [1 / (rank + 1) for rank in range(len(self.words))]
+        self.kinds = [kind for kind in KINDS if mix.get(kind, 0) > 0]
+        self.kind_weights = [mix[kind] for kind in self.kinds]
+        if len(self.kinds) == 0:
+            raise RuntimeError("The email mix is empty")
+
+    def text(self, count, is_spam):
+        rng = self.rng
+        flavour = _SPAM_WORDS if is_spam else _HAM_WORDS
+        words = rng.choices(self.words, self.weights, k=count)
+        for i in range(len(words)):
+            r = rng.random()
+            if r < 0.08:
+                words[i] = rng.choice(flavour)
+            elif r < 0.1:
+                words[i] = words[i].capitalize()
+            elif is_spam and r < 0.11:
+                words[i] = f"http://www.{words[i]}.com/?id={rng.randint(0, 99999)}"
+            words[i] += rng.choice(_PUNCTUATION)
+        lines = []
+        for i in range(0, len(words), 12):
+            lines.append(" ".join(words[i:i + 12]))
+        return "\n".join(lines) + "\n"
+
+    def headers(self, i, content_type):
+        rng = self.rng
+        sender = rng.choice(self.words)
+        return (f"Received: from mail{rng.randint(1, 99)}.example.com ([10.0.{rng.randint(0, 255)}.{rng.randint(0, 255)}])\n"
+                f"\tby mx.example.org; Mon, 2 Apr 2007 {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00 +0000\n"
+                f"From: {sender.capitalize()} <{sender}@example.com>\n"
+                f"To: user{rng.randint(0, 999)}@example.org\n"
+                f"Subject: {self.text(rng.randint(2, 8), False).strip()}\n"
+                f"Message-ID: <{i}.{rng.randint(0, 1 << 30)}@example.com>\n"
+                f"Content-Type: {content_type}\n"
+                "\n")
+
+    def html(self, count, is_spam):
+        rng = self.rng
+        parts = ["<html><head><style>p { color: red; }</style></head><body>"]
+        for paragraph in self.text(count, is_spam).split("\n"):
+            if paragraph == "":
+                continue
+            tag = rng.choice(["p", "div", "b", "font color=\"#ff0000\""])
+            parts.append(f"<{tag}>{paragraph} &amp; &nbsp;&#169;</{tag.split()[0]}>")
+        parts.append("</body></html>\n")
+        return "\n".join(parts)
+
+    def base64(self, lines):
+        rng = self.rng
+        alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+        return "".join("".join(rng.choice(alphabet) for _ in range(76)) + "\n" for _ in range(lines))
+
+    def email(self, i, is_spam):
+        """Returns the latin-1 bytes of the |i|th email."""
+        rng = self.rng
+        kind = rng.choices(self.kinds, self.kind_weights)[0]
+        length = min(int(rng.paretovariate(1.5) * 60), 5000)
+
+        if kind == "plain":
+            message = self.headers(i, "text/plain; charset=iso-8859-1") + self.text(length, is_spam)
+        elif kind == "html":
+            message = self.headers(i, "text/html; charset=iso-8859-1") + self.html(length, is_spam)
+        elif kind == "multipart":
+            boundary = f"----=_NextPart_{i:06d}_{rng.randint(0, 1 << 30):08X}"
+            message = (self.headers(i, f"multipart/alternative;\n\tboundary=\"{boundary}\"")
+                       + "This is a multi-part message in MIME format.\n\n"
+                       + f"--{boundary}\nContent-Type: text/plain; charset=iso-8859-1\n\n"
+                       + self.text(length, is_spam)
+                       + f"\n--{boundary}\nContent-Type: text/html; charset=iso-8859-1\n\n"
+                       + self.html(length, is_spam))
+            if is_spam and rng.random() < 0.3:
+                message += (f"\n--{boundary}\nContent-Type: application/octet-stream\n"
+                            "Content-Transfer-Encoding: base64\n\n" + self.base64(rng.randint(5, 40)))
+            message += f"\n--{boundary}--\n"
+        else:
+            sender = rng.choice(self.words)
+            message = (self.headers(i, "text/plain; charset=iso-8859-1")
+                       + self.text(length // 2 + 1, is_spam)
+                       + "\n-----Original Message-----\n"
+                       + f"From: {sender.capitalize()} <{sender}@example.com>\n"
+                       + "Sent: Monday, April 02, 2007 10:00 AM\n"
+                       + f"Subject: RE: {self.text(3, False).strip()}\n\n"
+                       + self.text(length // 2 + 1, is_spam))
+        return message.encode("latin-1")
+
+
+def _label(rng, spam_ratio):
+    return rng.random() < spam_ratio
+
+
+def write_standard(directory, generator, count, spam_ratio, first=0):
+    """Writes a TREC 05/06 layout: data/NNN/NNN and full/index."""
+    lines = []
+    for k in range(count):
+        corpus, target = divmod(k, targets_per_corpus)
+        path = directory.joinpath("data", f"{corpus:03d}", f"{target:03d}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        is_spam = _label(generator.rng, spam_ratio)
+        path.write_bytes(generator.email(first + k, is_spam))
+        lines.append(f"{'spam' if is_spam else 'ham'} ../data/{corpus:03d}/{target:03d}\n")
+    directory.joinpath("full").mkdir(parents=True, exist_ok=True)
+    directory.joinpath("full", "index").write_text("".join(lines))
+
+
+def write_trec7(directory, generator, count, spam_ratio, first=0):
+    """Writes a TREC 07 layout: data/inmail.N (from 1) and full/index."""
+    lines = []
+    directory.joinpath("data").mkdir(parents=True, exist_ok=True)
+    for k in range(count):
+        is_spam = _label(generator.rng, spam_ratio)
+        directory.joinpath("data", f"inmail.{k + 1}").write_bytes(generator.email(first + k, is_spam))
+        lines.append(f"{'spam' if is_spam else 'ham'} ../data/inmail.{k + 1}\n")
+    directory.joinpath("full").mkdir(parents=True, exist_ok=True)
+    directory.joinpath("full", "index").write_text("".join(lines))
+
+
+def generate(root, size, seed=0, mix=default_mix, spam_ratio=0.5):
+    """
+    Writes |size| emails split evenly over the three datasets
+    under |root| (a data/trec-raw directory).
+    """
+    root = Path(root)
+    generator = EmailGenerator(seed, mix)
+    counts = [size // 3, size // 3, size - 2 * (size // 3)]
+    write_standard(root.joinpath("trec05p-1"), generator, counts[0], spam_ratio)
+    write_standard(root.joinpath("trec06p"), generator, counts[1], spam_ratio, counts[0])
+    write_trec7(root.joinpath("trec07p"), generator, counts[2], spam_ratio, counts[0] + counts[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic TREC style corpus.")
+    parser.add_argument("root", type=Path, help="directory to write the datasets to, e.g. data/trec-raw")
+    parser.add_argument("--size", type=int, default=1000, help="number of emails")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", default="plain=4,html=3,multipart=2,original=1",
+            help="relative weights of the email kinds")
+    parser.add_argument("--spam", type=float, default=0.5, help="ratio of spam")
+    args = parser.parse_args()
+
+    try:
+        generate(args.root, args.size, args.seed, parse_mix(args.mix), args.spam)
+        print(f"Generated {args.size} emails in {args.root}")
+    except RuntimeError as e:
+        print(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Checks and benchmarks the body extraction engines of
+HttpEmail against each other.
+
+    python -m bench.htmlstrip [--repeat N] [--size N] [--show N] [files...]
+
+Without files a synthetic corpus (see bench.corpus) is used,
+otherwise every file (e.g. data/trec targets) is read as an
+email. Three things are compared:
+
+    strip_html      udax.htmlstrip against HTMLParser, over the
+                    whole of every email as if it were HTML, for
+                    the words each yields
+    malformed       the same over a fuzz set of broken markup:
+                    unclosed tags, quotes, comments, declarations,
+                    marked sections and script elements, stray '<'
+                    and entities
+    engines         the words of HttpEmail with the fast engine
+                    against those of the htmlparser engine; these
+                    also differ where a text/plain part holds
+                    something that looks like markup, which only
+                    the htmlparser engine strips
+"""
+import timeit
+import random
+import argparse
+from pathlib import Path
+
+from bench.corpus import EmailGenerator
+from udax.httpemail import HttpEmail, ConcatParser
+from udax.htmlstrip import strip_html
+from udax.tokenizer import translate_tokenize
+
+
+def synthetic_buffers(count, seed=0):
+    generator = EmailGenerator(seed)
+    return [generator.email(i, i % 2 == 0) for i in range(count)]
+
+
+# Pieces of broken (and some well formed) markup that
+# malformed_texts strings together.
+MALFORMED_FRAGMENTS = [
+    "word", " text ", "<b>", "</b>", "<i", "</i", "<p class='a>b'>", "<a href=x>",
+    "<!--", "-->", "--!>", "<!-- note -->", "<!doctype html>", "<!x", "<?pi", "?>",
+    "<![CDATA[", "]]>", "<script>", "</script>", "<style>", "</style>", "<", ">",
+    "&amp;", "&#65;", "&#x42;", "&lt", "&", "&bogus;", "</", "<br/>", "=", "\"",
+    "<![if x]>", "<![endif]>", "<p a='b", "<p a'b>", "<a title=\"x>y\">", "'",
+]
+
+
+def malformed_texts(count, seed=0):
+    rng = random.Random(seed)
+    # The case of a comment never closed, which the parser keeps
+    # as data up to the next '>', leads the set.
+    texts = ["<!--world&amp;</script>", "a <!-- b <i>c</i> d"]
+    while len(texts) < count:
+        texts.append("".join(rng.choice(MALFORMED_FRAGMENTS) for _ in range(rng.randint(1, 12))))
+    return texts
+
+
+def parser_words(text):
+    parser = ConcatParser()
+    parser.feed(text)
+    parser.close()
+    return parser.words
+
+
+def strip_words(text):
+    return translate_tokenize(" ".join(strip_html(text)))
+
+
+def check_strip(texts, show, name="strip_html", what="emails"):
+    mismatches = [i for i, text in enumerate(texts) if strip_words(text) != parser_words(text)]
+    print("%-11s %d/%d %s yield the words of HTMLParser (%.2f%%)" % \
+            (name + ":",                                              \
+             len(texts) - len(mismatches),                            \
+             len(texts),                                              \
+             what,                                                    \
+             100 * (len(texts) - len(mismatches)) / max(1, len(texts))))
+    for i in mismatches[:show]:
+        print(f"  {what[:-1]} {i} {texts[i]!r}: {describe(parser_words(texts[i]), strip_words(texts[i]))}")
+
+
+def check_engines(names, buffers, show):
+    mismatches = []
+    for name, buffer in zip(names, buffers):
+        fast = HttpEmail(name, buffer=buffer, engine="fast").words
+        reference = HttpEmail(name, buffer=buffer, engine="htmlparser").words
+        if fast != reference:
+            mismatches.append((name, reference, fast))
+    print("engines:    %d/%d emails yield the words of the htmlparser engine (%.2f%%)" % \
+            (len(buffers) - len(mismatches),                                          \
+             len(buffers),                                                            \
+             100 * (len(buffers) - len(mismatches)) / max(1, len(buffers))))
+    for name, reference, fast in mismatches[:show]:
+        print(f"  {name}: {describe(reference, fast)}")
+
+
+def describe(expected, actual):
+    """A short account of how two word lists differ."""
+    k = 0
+    while k < min(len(expected), len(actual)) and expected[k] == actual[k]:
+        k += 1
+    return "%d words expected, %d found, first difference at word %d: %r vs %r" % \
+           (len(expected), len(actual), k, expected[k:k + 3], actual[k:k + 3])
+
+
+def bench(name, fn, inputs, repeat, size):
+    def run():
+        for x in inputs:
+            fn(x)
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    print("%-26s %9.2fms %8.1f MB/s" % (name, best * 1e3, size / best / 1e6))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks and benchmarks the HttpEmail body extraction engines.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--size", type=int, default=1000, help="synthetic emails without files")
+    parser.add_argument("--show", type=int, default=5, help="differences to print")
+    parser.add_argument("files", nargs="*", type=Path)
+    args = parser.parse_args()
+
+    if args.files:
+        names = [str(path) for path in args.files]
+        buffers = [path.read_bytes() for path in args.files]
+    else:
+        names = [f"synthetic-{i}" for i in range(args.size)]
+        buffers = synthetic_buffers(args.size)
+    texts = [buffer.decode("latin-1") for buffer in buffers]
+    size = sum(len(buffer) for buffer in buffers)
+    print(f"{len(buffers)} emails, {size} bytes")
+
+    check_strip(texts, args.show)
+    check_strip(malformed_texts(args.size), args.show, "malformed", "texts")
+    check_engines(names, buffers, args.show)
+
+    base = bench("HTMLParser", parser_words, texts, args.repeat, size)
+    best = bench("strip_html", strip_words, texts, args.repeat, size)
+    print("%-26s %9.1fx" % ("", base / best))
+
+    base = bench("HttpEmail htmlparser", lambda b: HttpEmail("-", buffer=b, engine="htmlparser"),
+                 buffers, args.repeat, size)
+    best = bench("HttpEmail fast", lambda b: HttpEmail("-", buffer=b, engine="fast"),
+                 buffers, args.repeat, size)
+    print("%-26s %9.1fx" % ("", base / best))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+End to end benchmark of the pipeline over synthetic corpora
+(see bench.corpus) of several sizes.
+
+    python -m bench.pipeline [--sizes 300,3000] [--repeat N] [--seed S]
+                             [--output results.json] [--compare old.json]
+                             [--workdir DIR]
+
+For every size a corpus is generated, then timed, best of
+|repeat| runs:
+
+    sanitize            sanitize.py copying the raw datasets
+    httpemail           HttpEmail end to end, from the target path,
+                        with the default engine
+    httpemail.read      reading the target
+    httpemail.scan      udax.mime.scan_message
+    httpemail.parse.*   parsing and tokenizing the body, with every
+                        engine of udax.httpemail in turn
+    httpemail.count     the word frequencies
+    emailcounts         EmailCounts end to end, the counts only
+                        variant extract.py uses
+    merge               extract.py folding every word table into
+                        the global tables
+    filter_data         filter_data.py over the email bodies
+                        (skipped without the nltk stopwords)
+    nb.train            udax.bayes training from the global tables
+    nb.batch            udax.bayes scoring every email in one batch
+    nb.compiled         udax.model scoring every email one by one
+
+Results are written as json, one record per benchmark and
+size, and |compare| prints the speedup against an earlier
+results file.
+"""
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from collections import Counter
+
+from bench import corpus
+from udax.mime import scan_message
+from udax.httpemail import HttpEmail, EmailCounts, ConcatParser, ENGINES, default_engine, \
+                           _parse_scan, _bytes_tokenizer
+
+
+default_sizes = [300, 3000]
+
+
+def measure(fn, repeat):
+    """Runs |fn| |repeat| times, returning the duration of each run in seconds."""
+    runs = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - begin)
+    return runs
+
+
+def record(results, name, size, runs, items, size_bytes=0):
+    best = min(runs)
+    results.append({
+        "benchmark": name,
+        "size": size,
+        "items": items,
+        "bytes": size_bytes,
+        "best_s": best,
+        "mean_s": sum(runs) / len(runs),
+        "runs": runs,
+        "items_per_s": items / best if best > 0 else None,
+        "mb_per_s": size_bytes / best / 1e6 if best > 0 and size_bytes > 0 else None,
+    })
+    print("%-26s %7d %10.2fms %12.1f items/s %s" % \
+            (name,                                  \
+             size,                                  \
+             best * 1e3,                            \
+             items / best if best > 0 else 0,       \
+             "%8.1f MB/s" % (size_bytes / best / 1e6) if best > 0 and size_bytes > 0 else ""))
+
+
+# -------------------------------------
+# HttpEmail stages
+# -------------------------------------
+
+def parse_stage(scan, engine):
+    """The parsing part of HttpEmail with |engine|, over a finished scan."""
+    parser = ConcatParser()
+    words, body = _parse_scan(scan, engine, parser, _bytes_tokenizer(parser.tokenizer))
+    return words
+
+
+# -------------------------------------
+# Benchmarks
+# -------------------------------------
+
+def bench_sanitize(results, size, raw, work, repeat):
+    import sanitize
+    sanitize.source_dir = raw
+    counter = [0]
+
+    def run():
+        sanitize.target_dir = work.joinpath(f"trec-{counter[0]}")
+        sanitize.count = 0
+        counter[0] += 1
+        sanitize.verify()
+        sanitize.copy_trec5()
+        sanitize.copy_trec6()
+        sanitize.copy_trec7()
+        sanitize.drain()
+
+    runs = measure(run, repeat)
+    target_dir = work.joinpath("trec")
+    sanitize.target_dir.rename(target_dir)
+    for i in range(counter[0] - 1):
+        shutil.rmtree(work.joinpath(f"trec-{i}"))
+    targets = sorted(target_dir.iterdir())
+    total_bytes = sum(target.stat().st_size for target in targets)
+    record(results, "sanitize", size, runs, len(targets), total_bytes)
+    return targets
+
+
+def bench_httpemail(results, size, targets, repeat):
+    total_bytes = sum(target.stat().st_size for target in targets)
+    emails = []
+    runs = measure(lambda: emails.append([HttpEmail(target) for target in targets]), repeat)
+    record(results, "httpemail", size, runs, len(targets), total_bytes)
+
+    buffers = []
+    runs = measure(lambda: buffers.append([target.read_bytes() for target in targets]), repeat)
+    record(results, "httpemail.read", size, runs, len(targets), total_bytes)
+
+    scans = []
+    runs = measure(lambda: scans.append([scan_message(buffer) for buffer in buffers[-1]]), repeat)
+    record(results, "httpemail.scan", size, runs, len(targets), total_bytes)
+
+    # Every engine, the default one last so its words are counted.
+    for engine in sorted(ENGINES, key=lambda engine: engine == default_engine):
+        words = []
+        runs = measure(lambda: words.append([parse_stage(scan, engine) for scan in scans[-1]]), repeat)
+        record(results, f"httpemail.parse.{engine}", size, runs, len(targets), total_bytes)
+
+    runs = measure(lambda: [Counter(email_words) for email_words in words[-1]], repeat)
+    record(results, "httpemail.count", size, runs, len(targets))
+
+    runs = measure(lambda: [EmailCounts(target) for target in targets], repeat)
+    record(results, "emailcounts", size, runs, len(targets), total_bytes)
+    return emails[-1]
+
+
+def bench_merge(results, size, targets, emails, repeat):
+    import extract
+    tables = []
+
+    def run():
+        spam_table = {}
+        ham_table = {}
+        for target, email in zip(targets, emails):
+            if target.name.endswith(".spam"):
+                extract.merge_word_table(spam_table, email.word_table)
+            else:
+                extract.merge_word_table(ham_table, email.word_table)
+        tables.append((spam_table, ham_table))
+
+    runs = measure(run, repeat)
+    record(results, "merge", size, runs, len(emails))
+    return tables[-1]
+
+
+def bench_filter_data(results, size, emails, repeat):
+    try:
+        import filter_data
+    except (ImportError, LookupError) as e:
+        print("%-26s %7d skipped: %s" % ("filter_data", size, str(e).strip().split("\n")[0]))
+        return
+    bodies = [email.body for email in emails if email.body is not None]
+
+    def run():
+        filter_data.stem.cache_clear()
+        for body in bodies:
+            filter_data.filter_data(body)
+
+    runs = measure(run, repeat)
+    record(results, "filter_data", size, runs, len(bodies), sum(len(body) for body in bodies))
+
+
+def bench_bayes(results, size, targets, emails, tables, work, repeat):
+    try:
+        from udax.bayes import NaiveBayes, count_matrix
+        from udax.model import CompiledModel, compile_model
+    except ImportError as e:
+        print("%-26s %7d skipped: %s" % ("nb", size, e))
+        return
+    spam_table, ham_table = tables
+    if len(spam_table) == 0 or len(ham_table) == 0:
+        print("%-26s %7d skipped: needs both spam and ham" % ("nb", size))
+        return
+
+    models = []
+    runs = measure(lambda: models.append(NaiveBayes.from_tables(spam_table, ham_table)), repeat)
+    record(results, "nb.train", size, runs, len(spam_table.keys() | ham_table.keys()))
+    model = models[-1]
+
+    messages = [" ".join(email.words) for email in emails]
+    runs = measure(lambda: model.predict(count_matrix(messages, vocab=model.word_ids)[0]), repeat)
+    record(results, "nb.batch", size, runs, len(messages))
+
+    model_path = work.joinpath("spam.model")
+    compile_model(model, model_path)
+    with CompiledModel(model_path) as compiled:
+        word_tables = [email.word_table for email in emails]
+        runs = measure(lambda: [compiled.is_spam(word_table) for word_table in word_tables], repeat)
+    record(results, "nb.compiled", size, runs, len(word_tables))
+
+
+def run_size(results, size, seed, repeat, workdir):
+    work = workdir.joinpath(str(size))
+    raw = work.joinpath("trec-raw")
+    if work.exists():
+        shutil.rmtree(work)
+    work.mkdir(parents=True)
+
+    print(f"Generating {size} emails...")
+    corpus.generate(raw, size, seed)
+
+    targets = bench_sanitize(results, size, raw, work, repeat)
+    emails = bench_httpemail(results, size, targets, repeat)
+    tables = bench_merge(results, size, targets, emails, repeat)
+    bench_filter_data(results, size, emails, repeat)
+    bench_bayes(results, size, targets, emails, tables, work, repeat)
+
+
+# -------------------------------------
+# Results
+# -------------------------------------
+
+def describe_run(args):
+    commit = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": args.sizes,
+        "seed": args.seed,
+        "repeat": args.repeat,
+    }
+
+
+def compare(results, path):
+    with Path(path).open() as handle:
+        previous = json.load(handle)
+    before = {(r["benchmark"], r["size"]): r["best_s"] for r in previous["results"]}
+    print(f"Against {path} ({previous['meta'].get('commit') or 'unknown commit'}):")
+    for r in results:
+        old = before.get((r["benchmark"], r["size"]))
+        if old is None or r["best_s"] == 0:
+            continue
+        print("%-26s %7d %10.2fms -> %10.2fms %7.2fx" % \
+                (r["benchmark"], r["size"], old * 1e3, r["best_s"] * 1e3, old / r["best_s"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the pipeline over synthetic TREC style corpora.")
+    parser.add_argument("--sizes", default=",".join(map(str, default_sizes)),
+            help="comma separated corpus sizes")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=Path("bench-results.json"),
+            help="where to write the json results")
+    parser.add_argument("--compare", type=Path, default=None,
+            help="earlier results to print the speedups against")
+    parser.add_argument("--workdir", type=Path, default=None,
+            help="where to generate the corpora (kept), a temporary directory by default")
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(",")]
+    args.repeat = max(1, args.repeat)
+
+    results = []
+    try:
+        if args.workdir is not None:
+            for size in args.sizes:
+                run_size(results, size, args.seed, args.repeat, args.workdir)
+        else:
+            with tempfile.TemporaryDirectory(prefix="udax-bench-") as workdir:
+                for size in args.sizes:
+                    run_size(results, size, args.seed, args.repeat, Path(workdir))
+    except RuntimeError as e:
+        print(str(e))
+        sys.exit(1)
+
+    with args.output.open(mode="w") as handle:
+        json.dump({"meta": describe_run(args), "results": results}, handle, indent=2)
+        handle.write("\n")
+    print(f"Results written to {args.output}")
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Micro-benchmark of the udax tokenizers against the
+original surjective_map implementation.
+
+    python -m bench.tokenizer [--repeat N] [files...]
+
+Without files a synthetic sample is used, otherwise
+every file (e.g. data/trec targets) is read as latin-1
+and tokenized as a whole.
+"""
+import timeit
+import random
+import argparse
+from pathlib import Path
+
+from udax.tokenizer import (
+    surjective_tokenize,
+    translate_tokenize,
+    translate_tokenize_bytes,
+)
+
+
+def synthetic_payloads(count=200, seed=0):
+    rng = random.Random(seed)
+    # Every latin-1 character shows up so the engines are
+    # compared on more than plain ascii.
+    alphabet = [chr(c) for c in range(256)]
+    words = ["Free", "MONEY", "click", "here", "Meeting", "tomorrow",
+             "café", "RÉSUMÉ", "naïve", "http://www.example.com/?a=1&b=2",
+             "$$$", "!!!", "1234", "re:", "--", "\xa0", "\x85", "\x1c"]
+    payloads = []
+    for _ in range(count):
+        chunk = []
+        for _ in range(rng.randint(50, 2000)):
+            if rng.random() < 0.1:
+                chunk.append(rng.choice(alphabet))
+            else:
+                chunk.append(rng.choice(words))
+            chunk.append(rng.choice([" ", "  ", "\n", "\t", ", ", ". "]))
+        payloads.append("".join(chunk).encode("latin-1"))
+    return payloads
+
+
+# Character references unescaped by the HTML parser can
+# produce text outside of latin-1.
+UNICODE_SAMPLES = [
+    "\u201cQuoted\u201d \u2014 \u20ac100 \uff21\uff22\uff23 \u0130stanbul \ufb01le",
+    "\u2028line\u3000wide space\u00a0nbsp \u0660\u0661 DIGITS 42",
+]
+
+
+def check(payloads):
+    """Checks that every engine yields the reference tokens."""
+    for text in UNICODE_SAMPLES:
+        if translate_tokenize(text) != surjective_tokenize(text):
+            raise RuntimeError(f"translate_tokenize differs on {text!r}")
+    for i, payload in enumerate(payloads):
+        text = payload.decode("latin-1")
+        expected = surjective_tokenize(text)
+        if translate_tokenize(text) != expected:
+            raise RuntimeError(f"translate_tokenize differs on payload {i}")
+        if translate_tokenize_bytes(payload) != expected:
+            raise RuntimeError(f"translate_tokenize_bytes differs on payload {i}")
+
+
+def bench(name, fn, inputs, repeat):
+    def run():
+        for x in inputs:
+            fn(x)
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    size = sum(len(x) for x in inputs)
+    print("%-26s %9.2fms %8.1f MB/s" % (name, best * 1e3, size / best / 1e6))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the udax tokenizers.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("files", nargs="*", type=Path)
+    args = parser.parse_args()
+
+    if args.files:
+        payloads = [path.read_bytes() for path in args.files]
+    else:
+        payloads = synthetic_payloads()
+    texts = [payload.decode("latin-1") for payload in payloads]
+
+    print("Checking engines against surjective_map...")
+    check(payloads)
+    print(f"{len(payloads)} payloads, {sum(len(p) for p in payloads)} bytes")
+
+    base = bench("surjective_tokenize", surjective_tokenize, texts, args.repeat)
+    for name, fn, inputs in [
+        ("translate_tokenize", translate_tokenize, texts),
+        ("translate_tokenize_bytes", translate_tokenize_bytes, payloads),
+    ]:
+        best = bench(name, fn, inputs, args.repeat)
+        print("%-26s %9.1fx" % ("", base / best))
+
+
+if __name__ == "__main__":
+    main()
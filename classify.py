@@ -0,0 +1,212 @@
+import sys
+import time
+import argparse
+from pathlib import Path
+from udax.httpemail import EmailCounts
+from udax.model import CompiledModel, compile_model
+from udax.online import OnlineNaiveBayes
+from udax.features import load_vocab
+
+
+# -------------------------------------
+# Constants
+# -------------------------------------
+
+trec_cache = Path("data/trec-cache")
+default_model_path = Path("data/spam.model")
+default_counts_path = Path("data/spam.counts")
+
+
+# -------------------------------------
+# Compile
+# -------------------------------------
+
+def load_counts(cache_dir, counts_path=None):
+    """
+    Loads the word counts of the model, from |counts_path| when
+    it is given and exists, otherwise from the global TABLE.spam
+    and TABLE.ham that extract.py left in |cache_dir|, or failing
+    that from its per-email tables.
+    """
+    if counts_path is not None and counts_path.exists():
+        return OnlineNaiveBayes.load(counts_path)
+
+    spam_path = cache_dir.joinpath("TABLE.spam")
+    ham_path = cache_dir.joinpath("TABLE.ham")
+    if spam_path.exists() and ham_path.exists():
+        return OnlineNaiveBayes.from_tables(spam_path, ham_path)
+    if cache_dir.is_dir():
+        return OnlineNaiveBayes.from_cache(cache_dir)
+    raise RuntimeError(f"No word tables in {cache_dir}, run extract.py first")
+
+
+def compile_counts(counts, model_path, vocab_path=None):
+    """
+    Compiles |counts| into |model_path|, pruned to the vocabulary
+    of select_vocab.py at |vocab_path| when given: the model then
+    drops the words outside of it when classifying.
+    """
+    selected = None
+    if vocab_path is not None:
+        if not vocab_path.exists():
+            raise RuntimeError(f"{vocab_path} is missing, run select_vocab.py first")
+        selected = set(load_vocab(vocab_path))
+    count = compile_model(counts.to_model(selected), model_path)
+    print(f"Compiled {count} words into {model_path}{' (pruned)' if selected is not None else ''}")
+
+
+def update_counts(cache_dir, counts_path, model_path, paths, is_spam, remove=False, vocab_path=None):
+    """
+    Adds the emails at |paths| to the model counts with the given
+    label (or takes them back out with |remove|), then saves the
+    counts and recompiles the model, pruned to |vocab_path| if
+    given. Only the counting is per word of the emails: every call
+    still reads and rewrites the whole counts file and recompiles
+    the whole model, so emails are best passed in one call (on
+    stdin, say) rather than one call each.
+    """
+    counts = load_counts(cache_dir, counts_path)
+    label = "spam" if is_spam else "ham"
+    count = 0
+    for path in iterate_paths(paths):
+        # Nothing is saved unless every email could be read.
+        try:
+            email = EmailCounts(path)
+        except OSError as e:
+            raise RuntimeError(f"Failed to read {path}: {e.strerror}, the model is left unchanged")
+        if remove:
+            counts.remove(email.counts, is_spam)
+        else:
+            counts.add(email.counts, is_spam)
+        count += 1
+
+    counts.save(counts_path)
+    print(f"{'Removed' if remove else 'Added'} {count} {label} emails, "
+          f"the model now counts {counts.totals[0]} ham and {counts.totals[1]} spam words")
+    compile_counts(counts, model_path, vocab_path)
+
+
+# -------------------------------------
+# Classify
+# -------------------------------------
+
+def iterate_paths(paths):
+    if len(paths) > 0:
+        yield from paths
+    else:
+        for line in sys.stdin:
+            line = line.rstrip("\n")
+            if line != "":
+                yield line
+
+
+def classify(model_path, paths):
+    if not model_path.exists():
+        raise RuntimeError(f"{model_path} is missing, run classify.py compile first")
+
+    start = time.perf_counter_ns()
+    model = CompiledModel(model_path)
+    elapsed = time.perf_counter_ns() - start
+    print(f"Loaded {len(model)} words from {model_path} in {elapsed / 1e6:.3f} ms", file=sys.stderr)
+
+    latencies = []
+    spam_count = 0
+    with model:
+        for path in iterate_paths(paths):
+            start = time.perf_counter_ns()
+            try:
+                email = EmailCounts(path)
+            except OSError as e:
+                print(f"{path}\terror\t{e.strerror}")
+                continue
+            ham, spam = model.log_scores(email.counts)
+            elapsed = time.perf_counter_ns() - start
+
+            is_spam = spam > ham
+            latencies.append(elapsed)
+            spam_count += is_spam
+            print("%s\t%s\t%.3f\t%.3f ms" % \
+                    (path,                        \
+                     "spam" if is_spam else "ham", \
+                     spam - ham,                   \
+                     elapsed / 1e6),               \
+                  flush=True)
+
+    if len(latencies) > 1:
+        latencies.sort()
+        print("Classified %d messages (%d spam): mean %.3f ms, p50 %.3f ms, p99 %.3f ms, max %.3f ms" % \
+                (len(latencies),                                                              \
+                 spam_count,                                                                   \
+                 sum(latencies) / len(latencies) / 1e6,                                        \
+                 latencies[len(latencies) // 2] / 1e6,                                         \
+                 latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] / 1e6,        \
+                 latencies[-1] / 1e6),                                                         \
+              file=sys.stderr)
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "compile":
+        parser = argparse.ArgumentParser(prog="classify.py compile",
+                description="Compiles the word counts of the model into a model file.")
+        parser.add_argument("--tables", type=Path, default=trec_cache,
+                help="directory holding the TABLE.spam and TABLE.ham of extract.py")
+        parser.add_argument("--counts", type=Path, default=None,
+                help="compile the counts saved by 'classify.py update' instead")
+        parser.add_argument("--model", type=Path, default=default_model_path,
+                help="model file to write")
+        parser.add_argument("--vocab", type=Path, default=None,
+                help="prune the model to this vocabulary of select_vocab.py")
+        args = parser.parse_args(sys.argv[2:])
+    elif command == "update":
+        parser = argparse.ArgumentParser(prog="classify.py update",
+                description="Adds labelled emails to the model counts, or removes "
+                            "them, then saves the counts and recompiles the model.")
+        label = parser.add_mutually_exclusive_group(required=True)
+        label.add_argument("--spam", action="store_true", help="the emails are spam")
+        label.add_argument("--ham", action="store_true", help="the emails are ham")
+        parser.add_argument("--remove", action="store_true",
+                help="take the emails back out of the counts, e.g. when they "
+                     "were added with the wrong label")
+        parser.add_argument("--tables", type=Path, default=trec_cache,
+                help="word tables of extract.py to start from when there are "
+                     "no saved counts yet")
+        parser.add_argument("--counts", type=Path, default=default_counts_path,
+                help="saved model counts")
+        parser.add_argument("--model", type=Path, default=default_model_path,
+                help="model file to write")
+        parser.add_argument("--vocab", type=Path, default=None,
+                help="prune the model to this vocabulary of select_vocab.py")
+        parser.add_argument("paths", nargs="*",
+                help="emails to add, read one per line from stdin when none are given")
+        args = parser.parse_args(sys.argv[2:])
+    else:
+        command = None
+        parser = argparse.ArgumentParser(
+                description="Classifies emails as spam or ham with a compiled model. "
+                            "Prints one line per email: path, label, spam - ham log "
+                            "score and latency. Use 'classify.py compile' to build the "
+                            "model and 'classify.py update' to train it further.")
+        parser.add_argument("--model", type=Path, default=default_model_path,
+                help="compiled model file")
+        parser.add_argument("paths", nargs="*",
+                help="emails to classify, read one per line from stdin when none are given")
+        args = parser.parse_args()
+
+    try:
+        if command == "compile":
+            if args.counts is not None and not args.counts.exists():
+                raise RuntimeError(f"{args.counts} is missing")
+            compile_counts(load_counts(args.tables, args.counts), args.model, args.vocab)
+        elif command == "update":
+            update_counts(args.tables, args.counts, args.model, args.paths,
+                          is_spam=args.spam, remove=args.remove, vocab_path=args.vocab)
+        else:
+            classify(args.model, args.paths)
+    except RuntimeError as e:
+        print(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
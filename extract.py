@@ -1,10 +1,35 @@
+import io
 import os
 import sys
+import csv
+import pickle
+import tempfile
 import shutil
 import time
+import argparse
 from pathlib import Path
 from html.parser import HTMLParser
-<<<<<<< HEAD
+from functools import partial
+from multiprocessing import Pool
+from udax.httpemail import EmailCounts, ENGINES, default_engine
+from udax.tablecache import TableCacheWriter, read_text_table
+from udax.manifest import Manifest, file_digest, stat_target, is_same_target
+from udax.atomic import atomic_open
+from udax.corpus import PackedCorpus, target_name
+from udax.trecindex import load_index, STANDARD, TREC7
+from udax.hashing import HashedTable
+from udax.spill import SpillingTable
+from udax.instrument import ExtractStats, Progress, profile_targets
+from udax.prefetch import Prefetcher, AsyncWriter, StallStats
+from udax.columnar import ColumnWriter, default_rows_per_group
+from udax.tablecache import TableCache
+from udax.tokenizer import TOKENIZER_VERSION
+from udax.shard import ShardManifest, parse_shard, shard_range, shard_dirname, check_shards
+from udax.docterm import export_cache
+from udax.tablecache import iterate_cache
+from udax.invindex import build_index
+from udax.features import load_vocab
+
 
 class DataStruct():
     """
@@ -23,20 +48,20 @@ class Trec:
     """
     def __init__(self, root):
         self.root = Path(root)
-    
+
     def iterate_targets(self, corpus_limit: int = None, target_limit: int = None):
         """
         Iterates over target data files in the dataset. The
         return is in the form
-        
+
             (corpus: Path, target: Path, is_spam: bool)
-        
+
         where the paths are relative to the root specified in
         the constructor.
-        
+
         :param corpus_limit
             The maximum number of corpi to recurse into.
-        
+
         :param target_limit
             The maximum number of targets to iterate over per
             corpus.
@@ -48,142 +73,84 @@ class Trec5_6(Trec):
     """trec05p-1 & trec06p specific implementation of the dataset."""
     def __init__(self, root):
         super().__init__(root)
-        
-        # The index is structured as a 2D boolean
-        # vector space where (corpus: int, target: int)
-        # yields true or false depending on if the target
-        # within the corpus is a spam email or not.
-        self.spam_index = []
-        
-        # Actually load in the index.
-        index_stream = self.root.joinpath("full/index").open(mode="r", encoding="latin-1")
-        for line in index_stream:
-            
-            entry = line.split(' ')
-            is_spam = "spam" == entry[0]
-            
-            identity = entry[1].split('/')
-            corpus = int(identity[2])
-            target = int(identity[3])
-            
-            while len(self.spam_index) <= corpus:
-                self.spam_index.append([])
-            
-            corpus_index = self.spam_index[corpus]
-            while len(corpus_index) <= target:
-                corpus_index.append(False)
-            
-            corpus_index[target] = is_spam
-        index_stream.close()
-    
+
+        # The index is a udax.trecindex.TrecIndex where
+        # is_spam(corpus: int, target: int) yields true
+        # or false depending on if the target within the
+        # corpus is a spam email or not.
+        self.spam_index = load_index(self.root.joinpath("full/index"), STANDARD)
+
     def iterate_targets(self, corpus_limit: int = None, target_limit: int = None):
         # copy limits to keep a reference.
         # these will be decremented.
         l_corpus_limit = corpus_limit
         l_target_limit = target_limit
-        
+
         data = self.root.joinpath("data")
-        
+
         for corpus in data.iterdir():
-            
+
             if l_corpus_limit is not None:
                 if l_corpus_limit <= 0:
                     break
                 l_corpus_limit -= 1
-                
+
             l_target_limit = target_limit
-            
+
             for target in corpus.iterdir():
-                
+
                 if l_target_limit is not None:
                     if l_target_limit <= 0:
                         break
                     l_target_limit -= 1
-                
+
                 corpus_id = int(target.parts[-2])
                 target_id = int(target.parts[-1])
-                
-                yield (corpus, target, self.spam_index[corpus_id][target_id])
+
+                yield (corpus, target, self.spam_index.is_spam(corpus_id, target_id))
 
 class Trec7(Trec):
     """trec07p specific implementation of the dataset. """
     def __init__(self, root):
         super().__init__(root)
-        
+
         # Unlike Trec5_6, this index is single
-        # dimensional with boolean values that indicate
-        # whether a file with the index of the boolean
-        # is spam or not.
-        self.spam_index = []
-
-        index_stream = self.root.joinpath("full/index").open(mode="r", encoding="latin-1")
-        for line in index_stream:
-            
-            entry = line.split(' ')
-            is_spam = "spam" == entry[0]
-            
-            target = int(entry[1].split('.')[-1])
-            while len(self.spam_index) <= target:
-                self.spam_index.append(False)
-                
-            self.spam_index[target] = is_spam
-        index_stream.close()
+        # dimensional: is_spam(target: int) indicates
+        # whether the file with that number is spam
+        # or not.
+        self.spam_index = load_index(self.root.joinpath("full/index"), TREC7)
 
     def iterate_targets(self, corpus_limit: int = None, target_limit: int = None):
         if corpus_limit is not None and corpus_limit <= 0:
             return
-        
+
         data = self.root.joinpath("data")
         for target in data.iterdir():
-            
+
             if target_limit is not None:
                 if target_limit <= 0:
                     break
                 target_limit -= 1
-            
+
             target_id = int(target.parts[-1].split('.')[-1])
-            
-            yield (data, target, self.spam_index[target_id])
-
-
-# The assumed directory structure is as follows:
-#
-# data
-# -- TREC
-# -- -- trec05p-1
-# -- -- trec06p
-# -- -- trec07p
-# Extract.ipynb
-#
-data = DataStruct()
-data.root = Path("data").resolve()
-
-data.trec  = data.root.joinpath("TREC")
-data.trec5 = Trec5_6(data.trec.joinpath("trec05p-1"))
-data.trec6 = Trec5_6(data.trec.joinpath("trec06p"))
-data.trec7 = Trec7(data.trec.joinpath("trec07p"))
-data.trec_list = [
-    data.trec5,
-    data.trec6,
-    data.trec7,
-]
 
+            yield (data, target, self.spam_index.is_spam(target_id))
 
 
 class MyHTMLParser(HTMLParser):
     def __init__ (self):
         super(MyHTMLParser, self).__init__()
         self.current_email = ""
-        
+
     def handle_starttag(self, tag, attrs):
         pass
-    
+
     def handle_endtag(self, tag):
         pass
-    
+
     def handle_data(self, data):
         self.current_email += data + " "
-        
+
     def error(self, message):
         print('---------------')
         print('ERROR: ' + message)
@@ -209,11 +176,11 @@ def extract_metadata(encoded_message):
     content_type = ""
     boundary = None
     body_index = None
-    
+
     # [0] = body start
     # [-1] = file end
     split_indices = []
-    
+
     for i, line in enumerate(encoded_message):
         sline = line.decode('latin-1')
         if str.encode("From: ") in line:
@@ -232,105 +199,113 @@ def extract_metadata(encoded_message):
     split_indices.append(len(encoded_message)-1)
     return (sender, content_type, boundary, split_indices)
 
-spam_senders = []
-spam_bodies = []
 
-ham_senders = []
-ham_bodies = []
+def read_labeled_message(target):
+    """
+    Returns the (sender, body) of a raw TREC target, the body
+    being the text of its last part.
+    """
+    with target.open(mode="rb") as handle:
+        encoded_message = filter_message_headers(handle.readlines())
+    sender, content_type, boundary, split_indices = extract_metadata(encoded_message)
+    charset = "latin-1"
+    body = ""
 
-for trec in data.trec_list:
-    for corpus, target, is_spam in trec.iterate_targets():
-        with target.open(mode="rb") as handle:
-            encoded_message = filter_message_headers(handle.readlines())
-            sender, content_type, boundary, split_indices = extract_metadata(encoded_message)
-            charset = "latin-1"
+    if len(split_indices) > 2:
+        for i in range(len(split_indices) - 1):
+            x = split_indices[i]
+            y = split_indices[i + 1]
+            j = x + 1
+            while j < y:
+                line = encoded_message[j].decode(charset).strip()
+                if len(line) == 0:
+                    break
+                j += 1
+            parser = MyHTMLParser()
+            parser.feed(b"".join(encoded_message[j+1:y]).decode(charset))
+            body = parser.current_email
+    else:
+        try:
+            parser = MyHTMLParser()
+            parser.feed(b"".join(encoded_message[split_indices[0]:split_indices[1]]).decode(charset))
+            body = parser.current_email
+        except:
             body = ""
+    return (sender, body)
+
+
+LABELED_COLUMNS = [("message", "str"), ("sender", "str"), ("label", "bool")]
+LABELED_FORMATS = ["csv", "columnar"]
+
+
+class LabeledCsvWriter:
+    """
+    Writes the labeled rows a row at a time, as pandas'
+    DataFrame.to_csv would have: a leading index column
+    numbered from 0 and minimally quoted fields.
+    """
+    def __init__(self, path):
+        self.handle = open(path, mode="w", newline="")
+        self.writer = csv.writer(self.handle, lineterminator=os.linesep)
+        self.writer.writerow([""] + [name for name, kind in LABELED_COLUMNS])
+        self.rows = 0
+
+    def add(self, row):
+        self.writer.writerow((self.rows, *row))
+        self.rows += 1
+
+    def close(self):
+        self.handle.close()
+
+
+def open_labeled_writer(path, labeled_format="csv", rows_per_group=default_rows_per_group):
+    if labeled_format == "csv":
+        return LabeledCsvWriter(path)
+    if labeled_format == "columnar":
+        return ColumnWriter(path, LABELED_COLUMNS, rows_per_group)
+    raise RuntimeError(f"Unknown labeled data format {labeled_format}, expected one of {', '.join(LABELED_FORMATS)}")
+
+
+def export_labeled_data(trec_list, path, labeled_format="csv", rows_per_group=default_rows_per_group):
+    """
+    Walks the raw TREC datasets and saves every message
+    body and sender, labeled as spam or ham, into a single
+    file for filter_data.py to consume: csv, or the chunked
+    columnar format of udax.columnar with |rows_per_group|
+    rows per group.
+
+    Rows are written as messages are read, so memory does not
+    grow with the corpus. The ham rows come first, then the
+    spam rows, which are spooled to a temporary file until
+    every message has been read.
+    """
+    writer = open_labeled_writer(path, labeled_format, rows_per_group)
+    ham_count = 0
+    spam_count = 0
+
+    with tempfile.TemporaryFile() as spool:
+        for trec in trec_list:
+            for corpus, target, is_spam in trec.iterate_targets():
+                print("--- EMAIL: --- ", target, is_spam)
+                sender, body = read_labeled_message(target)
+                if len(body) <= 1:
+                    continue
+
+                if is_spam:
+                    pickle.dump((body, sender), spool)
+                    spam_count += 1
+                else:
+                    writer.add((body, sender, False))
+                    ham_count += 1
+
+        spool.seek(0)
+        for _ in range(spam_count):
+            body, sender = pickle.load(spool)
+            writer.add((body, sender, True))
+    writer.close()
+
+    print(f"Exported {ham_count} ham and {spam_count} spam messages to {path}")
 
-            if len(split_indices) > 2:
-                for i in range(len(split_indices) - 1):
-                    x = split_indices[i]
-                    y = split_indices[i + 1]
-                    j = x + 1
-                    while j < y:
-                        line = encoded_message[j].decode(charset).strip()
-                        if len(line) == 0:
-                            break
-                        j += 1
-                    print("--- EMAIL: --- ", target, is_spam)
-                    parser = MyHTMLParser()
-                    parser.feed(b"".join(encoded_message[j+1:y]).decode(charset))
-                    body = parser.current_email
-            else:
-                try:
-                    print("--- EMAIL: --- ", target, is_spam)
-                    parser = MyHTMLParser()   
-                    parser.feed(b"".join(encoded_message[split_indices[0]:split_indices[1]]).decode(charset))
-                    body = parser.current_email
-                except:
-                    body = ""
-                
-            
-            if len(body) <= 1:
-                continue
-
-            if is_spam:
-                spam_bodies.append(body)
-                spam_senders.append(sender)
-            else:
-                ham_bodies.append(body)
-                ham_senders.append(sender)
-            
-# displaying most common ham and spam words
-
-# from collections import Counter
-# import string
-
-# extraneous = string.punctuation + "\t\n\r1234567890"
-
-# import nltk
-# from nltk.corpus import stopwords
-# eng_stopwords = stopwords.words('english')
-
-# def is_stopword (x):
-#     if x in eng_stopwords or x == '':
-#         return False
-#     else:
-#         return True
-
-# # Most common words for ham emails
-# all_ham = " ".join(ham_bodies).lower()
-# filtered_ham = " ".join(list(filter(is_stopword, all_ham.translate(str.maketrans('', '', extraneous)).split(" "))))
-# most_common_ham = Counter(filtered_ham.translate(str.maketrans('', '', extraneous)).split(" ")).most_common()
-
-# all_spam = " ".join(spam_bodies).lower()
-# filtered_spam = " ".join(list(filter(is_stopword, all_spam.translate(str.maketrans('', '', extraneous)).split(" "))))
-# most_common_spam = Counter(filtered_spam.translate(str.maketrans('', '', extraneous)).split(" ")).most_common()
-
-# print("Most common ham words")
-# fout = open('most_common_ham.txt', "w+")
-# for word, count in most_common_ham:
-#     fout.write(f"{word} {count}\n")
-# fout.close()
-
-# print("Most common spam words")
-# fout = open('most_common_spam.txt', "w+")
-# for word, count in most_common_spam:
-#     fout.write(f"{word} {count}\n")
-# fout.close()
-
-# Saving all data into one csv file using pandas
-from pandas import DataFrame
-
-true_list = [True for i in range(len(spam_bodies))]
-false_list = [False for i in range(len(ham_bodies))]
-
-zipped_list = list(zip(ham_bodies + spam_bodies, ham_senders + spam_senders, false_list + true_list))
-
-print(len(ham_bodies + spam_bodies), len(ham_senders + spam_senders), len(false_list + true_list))
-df = DataFrame(zipped_list, columns=['message', 'sender', 'label'])
-df.to_csv('labeled_data.csv')
-=======
-from udax.httpemail import HttpEmail
 
 # -------------------------------------
 # Constant definitions and setup to
@@ -338,47 +313,124 @@ from udax.httpemail import HttpEmail
 # -------------------------------------
 
 trec = Path("data/trec")
+trec_pack = Path("data/trec.pack")
+trec_pack_index = Path("data/trec.index")
 trec_cache = Path("data/trec-cache")
 trec_raw = Path("data/trec-raw")
 spam_table_path = trec_cache.joinpath("TABLE.spam")
 ham_table_path = trec_cache.joinpath("TABLE.ham")
+spam_hashed_path = trec_cache.joinpath("TABLE.spam.hashed")
+ham_hashed_path = trec_cache.joinpath("TABLE.ham.hashed")
+manifest_path = trec_cache.joinpath("MANIFEST")
+
+# Where every shard of a --shard run writes its outputs, in
+# a directory of its own (see udax.shard).
+default_shard_root = Path("data/trec-shards")
+
+# Where 'extract.py docterm' writes the document-term matrix.
+default_docterm_dir = Path("data/docterm")
+
+# Where 'extract.py index' writes the inverted index.
+default_index_path = Path("data/trec.inverted")
 
-if not trec_raw.exists():
-    raise RuntimeError(f"Please download the trec05, trec06, and trec07 datasets into {trec_raw}")
+# The number of targets handed to a worker at
+# a time when running with more than one worker.
+default_batch_size = 256
 
-if not trec.exists():
-    raise RuntimeError(f"Please run sanitize.py before executing extract.py")
+# The number of targets extracted between two
+# checkpoints of an incremental run.
+default_checkpoint = 5000
 
-if not trec_cache.exists():
-    print(f"{trec_cache} does not exist, creating...")
-    trec_cache.mkdir(parents=True)
-elif len(os.listdir(trec_cache)) > 0:
-    desire = None
-    while desire is None or (desire != 'y' and desire != 'n'):
-        desire = input(f"{trec_cache} is not empty, do you want to clear it? [y/n]: ").lower()
-    if desire == 'n':
-        print(f"Refusing to clear {trec_cache}, aborting...")
-        sys.exit(0)
-    print(f"Clearing {trec_cache}...")
-    shutil.rmtree(trec_cache)
-    trec_cache.mkdir()
+# The queue depths of a --pipelined run: targets read ahead of
+# the one being parsed, and cache files waiting to be written.
+default_prefetch = 64
+default_read_threads = 4
+default_write_queue = 256
+
+
+def use_cache_dir(directory):
+    """Points the cache, and the files kept in it, at |directory|."""
+    global trec_cache, spam_table_path, ham_table_path, spam_hashed_path, ham_hashed_path, manifest_path
+    trec_cache = Path(directory)
+    spam_table_path = trec_cache.joinpath("TABLE.spam")
+    ham_table_path = trec_cache.joinpath("TABLE.ham")
+    spam_hashed_path = trec_cache.joinpath("TABLE.spam.hashed")
+    ham_hashed_path = trec_cache.joinpath("TABLE.ham.hashed")
+    manifest_path = trec_cache.joinpath("MANIFEST")
+
+
+def clear_cache_dir():
+    """Creates the cache, or empties it once the user agrees to."""
+    if not trec_cache.exists():
+        print(f"{trec_cache} does not exist, creating...")
+        trec_cache.mkdir(parents=True)
+    elif len(os.listdir(trec_cache)) > 0:
+        desire = None
+        while desire is None or (desire != 'y' and desire != 'n'):
+            desire = input(f"{trec_cache} is not empty, do you want to clear it? [y/n]: ").lower()
+        if desire == 'n':
+            print(f"Refusing to clear {trec_cache}, aborting...")
+            sys.exit(0)
+        print(f"Clearing {trec_cache}...")
+        shutil.rmtree(trec_cache)
+        trec_cache.mkdir()
+
+
+def prepare_cache(incremental=False, packed=False):
+    if not trec_raw.exists():
+        raise RuntimeError(f"Please download the trec05, trec06, and trec07 datasets into {trec_raw}")
+
+    if packed and not trec_pack.exists():
+        raise RuntimeError(f"Please run sanitize.py --pack before executing extract.py --packed")
+
+    if not packed and not trec.exists():
+        raise RuntimeError(f"Please run sanitize.py before executing extract.py")
+
+    if incremental and trec_cache.exists():
+        return
+    clear_cache_dir()
 
 
 # -------------------------------------
-# Generate cache 
+# Generate cache
 # -------------------------------------
 
-# Unlike in the HttpEmail class, these 
+# Unlike in the HttpEmail class, these
 # tables are simplified to word -> count
 # instead of word -> (count, relative-freq)
 spam_table = {}
 ham_table = {}
 
 
+def use_hashed_tables(buckets, top=0):
+    """
+    Makes the global tables fixed size udax.hashing.HashedTables
+    of |buckets| buckets, keeping their |top| words by name.
+    """
+    global spam_table, ham_table
+    spam_table = HashedTable(buckets, top)
+    ham_table = HashedTable(buckets, top)
+
+
+def use_spilling_tables(budget):
+    """
+    Makes the global tables udax.spill.SpillingTables sharing a
+    memory budget of |budget| bytes, spilling into the cache. They
+    are exported sorted by word.
+    """
+    global spam_table, ham_table
+    spam_table = SpillingTable(trec_cache, budget // 2)
+    ham_table = SpillingTable(trec_cache, budget // 2)
+
+
 def merge_word_table(global_table, httpemail_table):
     gt = global_table
     ht = httpemail_table
 
+    if isinstance(gt, (HashedTable, SpillingTable)):
+        gt.add_table(ht)
+        return
+
     for word, statistic in ht.items():
         if word in gt:
             gt[word] = gt[word] + statistic[0]
@@ -386,17 +438,225 @@ def merge_word_table(global_table, httpemail_table):
             gt[word] = statistic[0]
 
 
+def merge_count_table(global_table, count_table):
+    """
+    Same as merge_word_table, except that |count_table| is
+    already simplified to word -> count like the global tables.
+    Words new to |global_table| are appended in the order they
+    appear in |count_table|.
+    """
+    gt = global_table
+
+    if isinstance(gt, (HashedTable, SpillingTable)):
+        gt.add_table(count_table)
+        return
+
+    for word, count in count_table.items():
+        if word in gt:
+            gt[word] = gt[word] + count
+        else:
+            gt[word] = count
+
+
+def unmerge_count_table(global_table, count_table):
+    """
+    Takes the counts of |count_table| back out of |global_table|,
+    dropping the words that are left with a count of zero.
+    """
+    gt = global_table
+
+    for word, count in count_table.items():
+        remaining = gt[word] - count
+        if remaining == 0:
+            del gt[word]
+        else:
+            gt[word] = remaining
+
+
 def print_word_table(global_table, fd=sys.stdout):
     for word, count in global_table.items():
         fd.write(f"{word} {count}\n")
 
 
-print("Processing targets...")
-target_total = len(os.listdir(trec))
-target_count = 0
-begin = time.monotonic_ns()
+def load_word_table(path):
+    """Reads a global table written by print_word_table back into word -> count."""
+    table = {}
+    with path.open(mode="r") as handle:
+        for line in handle:
+            word, count = line.rsplit(' ', 1)
+            table[word] = int(count)
+    return table
+
+
+def export_word_tables(manifest=None):
+    """
+    Writes the global tables out. With a |manifest|, the tables
+    are replaced atomically and the manifest is saved last with
+    their digests, so a later run can tell whether the tables on
+    disk are the ones the manifest describes.
+    """
+    if isinstance(spam_table, HashedTable):
+        spam_table.save(spam_hashed_path)
+        ham_table.save(ham_hashed_path)
+        return
+
+    if isinstance(spam_table, SpillingTable):
+        for path, table, name in [(spam_table_path, spam_table, "spam"), (ham_table_path, ham_table, "ham")]:
+            with path.open(mode="w") as handle:
+                print_word_table(table, handle)
+            table.report(name)
+            table.close()
+        return
+
+    if manifest is None:
+        with spam_table_path.open(mode="w") as handle:
+            print_word_table(spam_table, handle)
+
+        with ham_table_path.open(mode="w") as handle:
+            print_word_table(ham_table, handle)
+        return
+
+    for path, table in [(spam_table_path, spam_table), (ham_table_path, ham_table)]:
+        with atomic_open(path) as handle:
+            print_word_table(table, handle)
+        manifest.tables[path.name] = file_digest(path)
+    manifest.save(manifest_path)
+
+
+def reconcile_manifest(targets, use_hash=False):
+    """
+    Loads the manifest of an earlier run along with the global
+    tables it describes, and takes the targets that changed or
+    disappeared since then back out of the tables and the cache.
+
+    When the tables on disk are not the ones the manifest was
+    saved with (a run was interrupted while exporting them) they
+    are recounted from the cached tables of the manifest targets.
+
+    Returns the manifest, the fresh entries of every target and
+    the targets that have yet to be extracted.
+    """
+    manifest = Manifest.load(manifest_path)
+    entries = {target.name: stat_target(target, use_hash) for target in targets}
+
+    if len(manifest.targets) > 0:
+        in_sync = all(path.exists() and manifest.tables.get(path.name) == file_digest(path)
+                      for path in [spam_table_path, ham_table_path])
+        if in_sync:
+            spam_table.update(load_word_table(spam_table_path))
+            ham_table.update(load_word_table(ham_table_path))
+        else:
+            print("Global tables do not match the manifest, recounting them from the cache...")
+            for name in sorted(manifest.targets):
+                table = spam_table if "spam" == name.split('.')[1] else ham_table
+                merge_count_table(table, read_text_table(trec_cache.joinpath(f"{name}.table")))
+
+    stale = [name for name, entry in manifest.targets.items()
+             if name not in entries or not is_same_target(entry, entries[name])]
+    if len(stale) > 0:
+        print(f"Retracting {len(stale)} changed or removed targets...")
+        for name in stale:
+            table = spam_table if "spam" == name.split('.')[1] else ham_table
+            unmerge_count_table(table, read_text_table(trec_cache.joinpath(f"{name}.table")))
+            del manifest.targets[name]
+        # The retraction is checkpointed before any cached table
+        # goes away, otherwise an interrupted run could no longer
+        # recount the tables the manifest still refers to.
+        export_word_tables(manifest)
+        for name in stale:
+            trec_cache.joinpath(f"{name}.table").unlink(missing_ok=True)
+
+    todo = [target for target in targets if target.name not in manifest.targets]
+    print(f"{len(targets) - len(todo)} targets up to date, {len(todo)} to extract")
+    return (manifest, entries, todo)
+
 
-for target in trec.iterdir():
+def list_targets(directory):
+    """
+    Lists the targets of |directory| sorted by name, which
+    for sanitized targets is also their numeric id order. The
+    global tables are built in this order so their contents
+    are reproducible regardless of how the work is split.
+    """
+    return sorted(directory.iterdir())
+
+
+class PackedTarget:
+    """
+    A message of the packed corpus, standing in for the loose
+    target file it would otherwise have been.
+    """
+    def __init__(self, numeric_id, name):
+        self.numeric_id = numeric_id
+        self.name = name
+
+
+# Opened on first use, once per process.
+_packed_corpus = None
+
+
+def packed_corpus():
+    global _packed_corpus
+    if _packed_corpus is None:
+        _packed_corpus = PackedCorpus(trec_pack, trec_pack_index)
+    return _packed_corpus
+
+
+def list_packed_targets():
+    """Same as list_targets, for the messages of the packed corpus."""
+    return [PackedTarget(numeric_id, target_name(numeric_id, is_spam))
+            for numeric_id, is_spam, dataset in packed_corpus()]
+
+
+def read_target(target):
+    """The raw bytes of a target."""
+    if isinstance(target, PackedTarget):
+        return packed_corpus().message(target.numeric_id)
+    return target.read_bytes()
+
+
+def open_email(target, instrument=False, engine=default_engine, buffer=None):
+    if isinstance(target, PackedTarget):
+        if buffer is None:
+            buffer = read_target(target)
+        return EmailCounts(target.name, buffer=buffer, instrument=instrument, engine=engine)
+    return EmailCounts(target, buffer=buffer, instrument=instrument, engine=engine)
+
+
+def iterate_targets(targets, prefetch=0, read_threads=default_read_threads, stalls=None):
+    """
+    Yields (target, raw bytes) for every target, the bytes read
+    ahead on |read_threads| threads when |prefetch| > 0, or None
+    for the target to be read when it is opened.
+    """
+    if prefetch <= 0:
+        return ((target, None) for target in targets)
+    if len(targets) > 0 and isinstance(targets[0], PackedTarget):
+        # Opened here rather than raced for by the readers.
+        packed_corpus()
+    return Prefetcher(read_target, targets, prefetch, read_threads, stalls)
+
+
+def process_target(target, spam_table, ham_table, cache_format="text", instrument=False,
+                   engine=default_engine, buffer=None, writer=None, vocab=None):
+    """
+    Extracts a single target, writes its word table into the
+    cache and folds it into the matching global table.
+
+    The target is read from |buffer| when given, and its table
+    handed to the udax.prefetch.AsyncWriter |writer| if any. With
+    a |vocab| (a set) the words outside of it are dropped before
+    anything is written or counted.
+
+    With the binary cache format nothing is written here, the
+    target's word -> count table is returned instead for the
+    caller to hand to the TableCacheWriter, in target order.
+
+    Returns the target's name data, the elapsed time in ns, the
+    word -> count table (None for the text format) and, with
+    |instrument|, the (stage timings, size, token count) of the
+    target's EmailCounts (None otherwise).
+    """
     t_begin = time.monotonic_ns()
     # The target filename is embossed with
     # a numeric id in the order it was processed
@@ -406,34 +666,570 @@ for target in trec.iterdir():
     numeric_id = int(name_data[0])
     is_spam = "spam" == name_data[1]
 
-    email = HttpEmail(target)
-    word_table = email.word_table
+    email = open_email(target, instrument, engine, buffer)
+    if vocab is not None:
+        email.prune(vocab)
 
-    with trec_cache.joinpath(f"{target.name}.table").open(mode="w") as handle:
-        email.print_word_table(handle)
+    doc_table = None
+    if cache_format == "text":
+        path = trec_cache.joinpath(f"{target.name}.table")
+        if writer is None:
+            with path.open(mode="w") as handle:
+                email.print_word_table(handle)
+        else:
+            handle = io.StringIO()
+            email.print_word_table(handle)
+            writer.write(path, handle.getvalue())
+    else:
+        doc_table = email.counts
 
     if is_spam:
-        merge_word_table(spam_table, word_table)
+        merge_count_table(spam_table, email.counts)
     else:
-        merge_word_table(ham_table, word_table)
+        merge_count_table(ham_table, email.counts)
+
+    profile = None
+    if instrument:
+        profile = (email.timings, email.size, email.total)
 
-    target_count += 1
     t_end = time.monotonic_ns()
+    return (name_data, t_end - t_begin, doc_table, profile)
+
+
+def process_batch(targets, cache_format="text", instrument=False, engine=default_engine,
+                  prefetch=0, read_threads=default_read_threads, write_queue=0, vocab=None):
+    """
+    Worker entry point. Processes a contiguous run of targets
+    into partial spam and ham tables which are returned to the
+    parent to be reduced into the global tables, along with the
+    StallStats of the batch.
+    """
+    partial_spam = {}
+    partial_ham = {}
+    timings = []
+    stalls = StallStats()
+    writer = None
+    if write_queue > 0 and cache_format == "text":
+        writer = AsyncWriter(write_queue, stalls)
+    for target, buffer in iterate_targets(targets, prefetch, read_threads, stalls):
+        timings.append(process_target(target, partial_spam, partial_ham, cache_format, instrument,
+                                      engine, buffer, writer, vocab))
+    if writer is not None:
+        writer.close()
+    return (partial_spam, partial_ham, timings, stalls)
+
+
+def print_progress(name_data, elapsed, target_count, target_total):
     print("%4s %s elapsed: %6.2fms (%.1f%%)" % \
             (name_data[1],                     \
              name_data[0],                     \
-             (t_end - t_begin) * 1e-6,         \
+             elapsed * 1e-6,                   \
              100 * target_count / target_total))
 
-end = time.monotonic_ns()
-sec = int((end - begin) * 1e-9)
-print("Processing targets elapsed: %dm %ds" % (sec // 60, sec % 60))
 
-print("Exporting global word tables...")
-with spam_table_path.open(mode="w") as handle:
-    print_word_table(spam_table, handle)
+def generate_cache(workers=1, batch_size=default_batch_size, cache_format="text",
+                   incremental=False, use_hash=False, checkpoint=default_checkpoint,
+                   packed=False, buckets=None, top=0, instrument=False, slowest=10,
+                   profile_slowest=0, verbose=False, engine=default_engine,
+                   memory_budget=None, prefetch=0, read_threads=default_read_threads,
+                   write_queue=0, shard=None, vocab_path=None):
+    """
+    Extracts every target into the cache and builds the global
+    spam and ham tables.
+
+    :param workers
+        The number of processes to spread the targets over. With
+        a single worker everything is done in this process.
+
+    :param batch_size
+        The number of consecutive targets given to a worker at
+        a time.
+
+    :param cache_format
+        "text" for one {target}.table file per target, "binary"
+        for the udax.tablecache format.
+
+    :param incremental
+        Only extract the targets that are new or changed since the
+        run that wrote the cache manifest, and update the global
+        tables from there. The manifest and tables are saved every
+        |checkpoint| targets, so an interrupted run resumes where
+        the last checkpoint left off.
+
+    :param use_hash
+        Tell changed targets apart by their content digest rather
+        than by their modification time.
+
+    :param packed
+        Read the targets out of the packed corpus written by
+        sanitize.py --pack rather than from loose files.
+
+    :param buckets
+        Hash the global tables into this many buckets instead of
+        keeping every word (see udax.hashing), so their size stays
+        fixed however large the vocabulary grows.
+
+    :param top
+        With |buckets|, the number of words with the highest counts
+        to keep by name alongside the buckets.
+
+    :param instrument
+        Time every stage of every target (see udax.instrument) and
+        report histograms, percentiles, throughput and the |slowest|
+        targets at the end.
+
+    :param profile_slowest
+        With |instrument|, extract this many of the slowest targets
+        once more under cProfile and print where their time went.
+
+    :param verbose
+        Print a line per target rather than a progress line every
+        second.
+
+    :param engine
+        The udax.httpemail engine to extract the bodies with, one of
+        udax.httpemail.ENGINES.
+
+    :param memory_budget
+        Keep the global tables within about this many bytes, spilling
+        sorted runs into the cache beyond it (see udax.spill), and
+        merge them into TABLE files sorted by word at the end.
+
+    :param prefetch
+        Read this many targets ahead of the one being extracted, on
+        |read_threads| threads (see udax.prefetch).
+
+    :param write_queue
+        Write the text cache on a background thread, through a queue
+        of this many files.
+
+    :param shard
+        (i, N) to only extract shard i of N (see udax.shard) into the
+        cache, which is then that shard's directory, along with its
+        partial tables and ShardManifest. See merge_shards.
+
+    :param vocab_path
+        Drop the words outside this vocabulary of select_vocab.py
+        (see udax.features) from every target, so neither the cache
+        nor the global tables hold them.
+    """
+    if shard is not None and (incremental or buckets is not None or memory_budget is not None):
+        raise RuntimeError("Sharded runs are only supported with exact, in-memory global tables "
+                           "and without --incremental")
+    if memory_budget is not None and buckets is not None:
+        raise RuntimeError("A memory budget does not apply to hashed global tables")
+    if incremental and memory_budget is not None:
+        raise RuntimeError("Incremental runs are only supported with in-memory global tables")
+    if incremental and buckets is not None:
+        raise RuntimeError("Incremental runs are only supported with exact global tables")
+    if incremental and cache_format != "text":
+        raise RuntimeError("Incremental runs are only supported with the text cache format")
+    if incremental and packed:
+        raise RuntimeError("Incremental runs are only supported with loose target files")
+    if incremental and engine != default_engine:
+        # The manifest only tells targets apart by tokenizer version.
+        raise RuntimeError("Incremental runs are only supported with the default engine")
+    if incremental and vocab_path is not None:
+        raise RuntimeError("Incremental runs are only supported without a vocabulary")
+
+    vocab = None
+    if vocab_path is not None:
+        if not vocab_path.exists():
+            raise RuntimeError(f"{vocab_path} is missing, run select_vocab.py first")
+        vocab = frozenset(load_vocab(vocab_path))
+        print(f"Keeping the {len(vocab)} words of {vocab_path}")
+
+    if buckets is not None:
+        use_hashed_tables(buckets, top)
+    if memory_budget is not None:
+        use_spilling_tables(memory_budget)
+
+    print("Processing targets...")
+    targets = list_packed_targets() if packed else list_targets(trec)
+    manifest = None
+    if incremental:
+        manifest, entries, targets = reconcile_manifest(targets, use_hash)
+    if shard is not None:
+        shard_manifest, targets = select_shard(targets, shard)
+        print(f"Shard {shard[0]}/{shard[1]}: ids [{shard_manifest.first_id}, "
+              f"{shard_manifest.end_id}), {len(targets)} targets")
+    target_total = len(targets)
+    target_count = 0
+    since_checkpoint = 0
+    begin = time.monotonic_ns()
+
+    table_writer = None
+    if cache_format == "binary":
+        table_writer = TableCacheWriter(trec_cache)
+
+    pipelined = prefetch > 0 or write_queue > 0
+    stalls = StallStats()
+    writer = None
+    if write_queue > 0 and cache_format == "text" and workers <= 1:
+        writer = AsyncWriter(write_queue, stalls)
+
+    stats = ExtractStats(slowest=max(slowest, profile_slowest)) if instrument else None
+    progress = Progress(target_total)
+
+    def save_checkpoint():
+        nonlocal since_checkpoint
+        if writer is not None:
+            writer.flush()
+        export_word_tables(manifest)
+        since_checkpoint = 0
+
+    def record(name_data, elapsed, doc_table, profile):
+        nonlocal target_count, since_checkpoint
+        if table_writer is not None:
+            table_writer.add(int(name_data[0]), "spam" == name_data[1], doc_table)
+        target_count += 1
+        if verbose:
+            print_progress(name_data, elapsed, target_count, target_total)
+        else:
+            progress.update(target_count)
+        if stats is not None:
+            stats.add('.'.join(name_data), elapsed, *profile)
+
+        # By now the target's table is cached and its counts are
+        # in the global tables, so it can go into the manifest.
+        if manifest is not None:
+            name = '.'.join(name_data)
+            manifest.targets[name] = entries[name]
+            since_checkpoint += 1
+            # The workers merge the counts of a whole batch at once,
+            # so they only checkpoint once every target of the batch
+            # is in the manifest.
+            if since_checkpoint >= checkpoint and workers <= 1:
+                save_checkpoint()
+
+    if workers <= 1:
+        for target, buffer in iterate_targets(targets, prefetch, read_threads, stalls):
+            record(*process_target(target, spam_table, ham_table, cache_format, instrument,
+                                   engine, buffer, writer, vocab))
+        if writer is not None:
+            writer.close()
+    else:
+        # Batches are contiguous slices of the sorted targets and
+        # imap hands the results back in submission order, so
+        # reducing the partial tables in that order inserts every
+        # word exactly where the serial run would have.
+        batches = [targets[i:i + batch_size] for i in range(0, target_total, batch_size)]
+        # The initializer carries the cache directory of a shard
+        # over to workers that do not fork.
+        with Pool(processes=workers, initializer=use_cache_dir, initargs=(trec_cache,)) as pool:
+            work = partial(process_batch, cache_format=cache_format, instrument=instrument,
+                           engine=engine, prefetch=prefetch, read_threads=read_threads,
+                           write_queue=write_queue, vocab=vocab)
+            for partial_spam, partial_ham, timings, batch_stalls in pool.imap(work, batches):
+                stalls.merge(batch_stalls)
+                merge_count_table(spam_table, partial_spam)
+                merge_count_table(ham_table, partial_ham)
+                for timing in timings:
+                    record(*timing)
+                if manifest is not None and since_checkpoint >= checkpoint:
+                    save_checkpoint()
+
+    if table_writer is not None:
+        table_writer.close()
+
+    if not verbose:
+        progress.finish(target_count)
+    end = time.monotonic_ns()
+    sec = int((end - begin) * 1e-9)
+    print("Processing targets elapsed: %dm %ds" % (sec // 60, sec % 60))
+    if pipelined:
+        stalls.report()
+
+    if stats is not None:
+        stats.report()
+        if profile_slowest > 0:
+            by_name = {target.name: target for target in targets}
+            slowest_targets = [by_name[name] for elapsed, name in stats.slowest_targets()[:profile_slowest]]
+            print(f"Profiling the {len(slowest_targets)} slowest targets...")
+            profile_targets(partial(open_email, engine=engine), slowest_targets)
+
+    print("Exporting global word tables...")
+    export_word_tables(manifest)
+    if shard is not None:
+        shard_manifest.cache_format = cache_format
+        shard_manifest.engine = engine
+        shard_manifest.vocab = "none" if vocab_path is None else file_digest(vocab_path)
+        shard_manifest.tables = {spam_table_path.name: None, ham_table_path.name: None}
+        shard_manifest.save(trec_cache)
+    print("Done")
+
+
+# -------------------------------------
+# Shards
+# -------------------------------------
+
+def select_shard(targets, shard):
+    """
+    Returns a ShardManifest for shard (i, N) of |targets|, along
+    with the targets that belong to it.
+    """
+    index, count = shard
+    ids = [int(target.name.split('.')[0]) for target in targets]
+    id_total = max(ids) + 1 if len(ids) > 0 else 0
+    first_id, end_id = shard_range(index, count, id_total)
+    selected = [target for target, numeric_id in zip(targets, ids) if first_id <= numeric_id < end_id]
+    manifest = ShardManifest(index=index, count=count, first_id=first_id, end_id=end_id,
+                             id_total=id_total, targets=len(selected),
+                             tokenizer_version=TOKENIZER_VERSION)
+    return (manifest, selected)
+
+
+def find_shards(shard_root):
+    if not shard_root.exists():
+        raise RuntimeError(f"{shard_root} does not exist, run extract.py --shard i/N first")
+    return sorted(path for path in shard_root.iterdir() if path.is_dir() and path.name.startswith("shard-"))
+
+
+def merge_shards(directories):
+    """
+    Combines the outputs of every shard of a run, found in
+    |directories|, into the cache: the per target tables (linked
+    when the storage allows it, copied otherwise) or the binary
+    cache, and the global tables, just as a single run would have
+    written them.
+    """
+    shards = check_shards([ShardManifest.load(directory) for directory in directories])
+    for manifest in shards:
+        manifest.verify()
+    cache_format = shards[0].cache_format
+    print(f"Merging {len(shards)} shards, {sum(manifest.targets for manifest in shards)} targets...")
+
+    clear_cache_dir()
+    table_writer = TableCacheWriter(trec_cache) if cache_format == "binary" else None
+    spam = {}
+    ham = {}
+    for manifest in shards:
+        directory = manifest.directory
+        if table_writer is not None:
+            with TableCache(directory) as cache:
+                for doc_id in cache.doc_ids:
+                    table_writer.add(doc_id, cache.is_spam(doc_id), cache.word_table(doc_id))
+        else:
+            for path in sorted(directory.glob("*.table")):
+                try:
+                    os.link(path, trec_cache.joinpath(path.name))
+                except OSError:
+                    shutil.copyfile(path, trec_cache.joinpath(path.name))
+        merge_count_table(spam, load_word_table(directory.joinpath(spam_table_path.name)))
+        merge_count_table(ham, load_word_table(directory.joinpath(ham_table_path.name)))
+        print(f"  {manifest}: ids [{manifest.first_id}, {manifest.end_id}), {manifest.targets} targets")
+    if table_writer is not None:
+        table_writer.close()
+
+    with spam_table_path.open(mode="w") as handle:
+        print_word_table(spam, handle)
+    with ham_table_path.open(mode="w") as handle:
+        print_word_table(ham, handle)
+    print("Done")
+
+
+def merge_main():
+    parser = argparse.ArgumentParser(prog="extract.py merge",
+            description="Combines the outputs of the shards of an extract.py --shard "
+                        "run into the cache and its global tables.")
+    parser.add_argument("--shard-root", type=Path, default=default_shard_root,
+            help="where to look for the shard directories when none are given")
+    parser.add_argument("shards", nargs="*", type=Path,
+            help="shard directories to merge, every shard-* of --shard-root by default")
+    args = parser.parse_args(sys.argv[2:])
+
+    try:
+        merge_shards(args.shards if len(args.shards) > 0 else find_shards(args.shard_root))
+    except RuntimeError as e:
+        print(str(e))
+
+
+def docterm_main():
+    parser = argparse.ArgumentParser(prog="extract.py docterm",
+            description="Exports the per-email cache as a memory mappable sparse "
+                        "document-term matrix (see udax.docterm).")
+    parser.add_argument("--cache", type=Path, default=trec_cache,
+            help="the per-email cache to export, text or binary")
+    parser.add_argument("--output", type=Path, default=default_docterm_dir,
+            help="directory to write the matrix to")
+    parser.add_argument("--shuffle", type=int, default=None, metavar="SEED",
+            help="write the rows in an order shuffled with SEED rather than by "
+                 "numeric id, so contiguous train/test splits are random")
+    parser.add_argument("--vocab", type=Path, default=None,
+            help="only keep the words of this vocabulary of select_vocab.py, as "
+                 "the columns of the matrix")
+    args = parser.parse_args(sys.argv[2:])
+
+    try:
+        if not args.cache.exists():
+            raise RuntimeError(f"{args.cache} does not exist, please run extract.py first")
+        begin = time.monotonic_ns()
+        vocab = None
+        if args.vocab is not None:
+            if not args.vocab.exists():
+                raise RuntimeError(f"{args.vocab} is missing, run select_vocab.py first")
+            vocab = load_vocab(args.vocab)
+        rows = export_cache(args.cache, args.output, args.shuffle, vocab)
+        print("Exported %d rows to %s in %.2fs" % (rows, args.output, (time.monotonic_ns() - begin) / 1e9))
+    except RuntimeError as e:
+        print(str(e))
+
+
+def index_main():
+    parser = argparse.ArgumentParser(prog="extract.py index",
+            description="Builds the inverted index of the per-email cache, which "
+                        "query.py answers word lookups from (see udax.invindex).")
+    parser.add_argument("--cache", type=Path, default=trec_cache,
+            help="the per-email cache to index, text or binary")
+    parser.add_argument("--output", type=Path, default=default_index_path,
+            help="file to write the index to")
+    args = parser.parse_args(sys.argv[2:])
+
+    try:
+        if not args.cache.exists():
+            raise RuntimeError(f"{args.cache} does not exist, please run extract.py first")
+        begin = time.monotonic_ns()
+        words, documents = build_index(iterate_cache(args.cache), args.output)
+        print("Indexed %d words of %d emails into %s in %.2fs" % \
+              (words, documents, args.output, (time.monotonic_ns() - begin) / 1e9))
+    except RuntimeError as e:
+        print(str(e))
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "merge":
+        merge_main()
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "docterm":
+        docterm_main()
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "index":
+        index_main()
+        return
+
+    parser = argparse.ArgumentParser(description="Extracts word tables from the sanitized TREC targets. "
+                                                 "Use 'extract.py merge' to combine the outputs of --shard runs "
+                                                 "'extract.py docterm' to export the cache as a sparse matrix "
+                                                 "and 'extract.py index' to build its inverted index.")
+    parser.add_argument("--workers", type=int, default=1,
+            help="number of worker processes to extract targets with")
+    parser.add_argument("--batch-size", type=int, default=default_batch_size,
+            help="number of targets handed to a worker at a time")
+    parser.add_argument("--cache-format", choices=["text", "binary"], default="text",
+            help="write one text table per target, or a single binary "
+                 "cache (see udax.tablecache)")
+    parser.add_argument("--packed", action="store_true",
+            help="read the targets from the packed corpus written by "
+                 "sanitize.py --pack")
+    parser.add_argument("--incremental", action="store_true",
+            help="only extract new or changed targets, keeping track of "
+                 "them in the cache manifest; resumes interrupted runs")
+    parser.add_argument("--hash", action="store_true",
+            help="with --incremental, detect changed targets by content "
+                 "digest instead of modification time")
+    parser.add_argument("--checkpoint", type=int, default=default_checkpoint,
+            help="with --incremental, targets extracted between checkpoints")
+    parser.add_argument("--buckets", type=int, default=None,
+            help="hash the global tables into this many buckets, written "
+                 "to TABLE.spam.hashed and TABLE.ham.hashed")
+    parser.add_argument("--top", type=int, default=0,
+            help="with --buckets, the number of most frequent words to "
+                 "also keep by name")
+    parser.add_argument("--memory-budget", type=float, default=None, metavar="MB",
+            help="keep the global tables within about this many megabytes, "
+                 "spilling sorted runs to disk, and write them sorted by word")
+    parser.add_argument("--pipelined", action="store_true",
+            help="read targets ahead and write the cache on background "
+                 "threads, so extracting never waits on the disk")
+    parser.add_argument("--prefetch", type=int, default=default_prefetch,
+            help="with --pipelined, the number of targets read ahead")
+    parser.add_argument("--read-threads", type=int, default=default_read_threads,
+            help="with --pipelined, the number of threads reading ahead")
+    parser.add_argument("--write-queue", type=int, default=default_write_queue,
+            help="with --pipelined, the number of cache files queued for writing")
+    parser.add_argument("--stats", action="store_true",
+            help="time every stage of every target and report histograms, "
+                 "percentiles, throughput and the slowest targets")
+    parser.add_argument("--slowest", type=int, default=10,
+            help="with --stats, the number of slowest targets to report")
+    parser.add_argument("--profile-slowest", type=int, default=0, metavar="N",
+            help="with --stats, profile the N slowest targets again under cProfile")
+    parser.add_argument("--verbose", action="store_true",
+            help="print a line per target instead of a progress line")
+    parser.add_argument("--engine", choices=ENGINES, default=default_engine,
+            help="extract plain text parts directly and strip html with "
+                 "udax.htmlstrip (fast), or run every part through "
+                 "HTMLParser as before (htmlparser)")
+    parser.add_argument("--vocab", type=Path, default=None,
+            help="only keep the words of this vocabulary of select_vocab.py, "
+                 "in the cache and the global tables")
+    parser.add_argument("--shard", metavar="i/N", default=None,
+            help="only extract shard i of N, by numeric id, into a directory "
+                 "of its own under --shard-root")
+    parser.add_argument("--shard-root", type=Path, default=default_shard_root,
+            help="with --shard, where the shard directories go")
+    parser.add_argument("--labeled-csv", metavar="PATH",
+            help="instead of building the cache, export the raw TREC "
+                 "datasets into a labeled csv file (labeled_data.csv)")
+    parser.add_argument("--labeled-format", choices=LABELED_FORMATS, default="csv",
+            help="with --labeled-csv, write csv or the chunked columnar "
+                 "format of udax.columnar")
+    parser.add_argument("--rows-per-group", type=int, default=default_rows_per_group,
+            help="with --labeled-format columnar, the rows per row group")
+    args = parser.parse_args()
+
+    try:
+        if args.labeled_csv is not None:
+            # The assumed directory structure is as follows:
+            #
+            # data
+            # -- trec-raw
+            # -- -- trec05p-1
+            # -- -- trec06p
+            # -- -- trec07p
+            #
+            data = DataStruct()
+            data.trec5 = Trec5_6(trec_raw.joinpath("trec05p-1"))
+            data.trec6 = Trec5_6(trec_raw.joinpath("trec06p"))
+            data.trec7 = Trec7(trec_raw.joinpath("trec07p"))
+            data.trec_list = [
+                data.trec5,
+                data.trec6,
+                data.trec7,
+            ]
+            export_labeled_data(data.trec_list, args.labeled_csv, args.labeled_format,
+                                max(1, args.rows_per_group))
+            return
+
+        shard = None
+        if args.shard is not None:
+            shard = parse_shard(args.shard)
+            use_cache_dir(args.shard_root.joinpath(shard_dirname(*shard)))
+
+        prepare_cache(incremental=args.incremental, packed=args.packed)
+        generate_cache(workers=args.workers,
+                       batch_size=max(1, args.batch_size),
+                       cache_format=args.cache_format,
+                       incremental=args.incremental,
+                       use_hash=args.hash,
+                       checkpoint=max(1, args.checkpoint),
+                       packed=args.packed,
+                       buckets=args.buckets,
+                       top=max(0, args.top),
+                       instrument=args.stats,
+                       slowest=max(0, args.slowest),
+                       profile_slowest=max(0, args.profile_slowest),
+                       verbose=args.verbose,
+                       engine=args.engine,
+                       memory_budget=None if args.memory_budget is None else int(args.memory_budget * 1e6),
+                       prefetch=max(0, args.prefetch) if args.pipelined else 0,
+                       read_threads=max(1, args.read_threads),
+                       write_queue=max(0, args.write_queue) if args.pipelined else 0,
+                       shard=shard,
+                       vocab_path=args.vocab)
+    except RuntimeError as e:
+        print(str(e))
+
 
-with ham_table_path.open(mode="w") as handle:
-    print_word_table(ham_table, handle)
-print("Done")
->>>>>>> a7e2edbb8fbc266fa695722b895243a01dcab7f3
+if __name__ == "__main__":
+    main()
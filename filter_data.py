@@ -1,41 +1,136 @@
 import nltk
+import argparse
 import pandas as pd
+from collections import deque
+from functools import lru_cache
+from multiprocessing import Pool
 from string import punctuation
 import nltk
 from nltk.corpus import stopwords
-from nltk.stem import PorterStemmer 
-from nltk.tokenize import word_tokenize 
+from nltk.stem import PorterStemmer
+from nltk.tokenize import word_tokenize
+from udax.columnar import ColumnReader, is_column_file
 
-df = pd.read_csv('labeled_data.csv', dtype={'message': 'string'}, index_col=0)
 ps = PorterStemmer()
 
-eng_stopwords = stopwords.words('english')
+eng_stopwords = frozenset(stopwords.words('english'))
+
+# The vocabulary repeats heavily from one message to the
+# next, so each distinct token is only stemmed once.
+# Every worker process keeps its own cache.
+stem_cache_size = 1 << 20
 
 def is_stopword (x):
     if x in eng_stopwords or x == '':
         return False
     else:
         return True
-    
-i = 0
 
-def filter_data (x):
-    global i
+@lru_cache(maxsize=stem_cache_size)
+def stem (word):
+    return ps.stem(word)
 
+extraneous_table = str.maketrans('','',punctuation+'\t\n\r')
+
+def filter_data (x):
     try:
-        x = x.translate(str.maketrans('','',punctuation+'\t\n\r'))
+        x = x.translate(extraneous_table)
         tokenized = filter(is_stopword, x.lower().split(' '))
-        answer = " ".join(ps.stem(word) for word in tokenized)
+        answer = " ".join(stem(word) for word in tokenized)
     except:
         return x
     # tokenized = filter(is_stopword, word_tokenize(x.lower()))
     # ans = [ps.stem(word) for word in tokenized]
-    print(f"{i/df.shape[0] * 100}")
-    i += 1
-    
+
     return answer
 
-curr = df['message'].apply(filter_data)
-df['message'] = curr
+def filter_chunk (chunk, header):
+    """
+    Worker entry point. Filters a chunk of rows and renders it
+    as csv text, along with the stem cache hits and misses it
+    took.
+    """
+    before = stem.cache_info()
+    chunk['message'] = chunk['message'].apply(filter_data)
+    after = stem.cache_info()
+    return (chunk.to_csv(header=header), after.hits - before.hits, after.misses - before.misses)
+
+def read_chunks (source, chunksize):
+    """
+    Yields the rows of |source| as DataFrames of |chunksize| rows,
+    or of one row group each when |source| is in the columnar
+    format of udax.columnar (extract.py --labeled-format columnar).
+    """
+    if not is_column_file(source):
+        yield from pd.read_csv(source, dtype={'message': 'string'}, index_col=0, chunksize=chunksize)
+        return
+    with ColumnReader(source) as reader:
+        for start, columns in reader.iter_row_groups():
+            rows = len(columns['message'])
+            columns['message'] = pd.array(columns['message'], dtype='string')
+            yield pd.DataFrame(columns, index=pd.RangeIndex(start, start + rows))
+
+def filter_chunked (source, destination, chunksize, workers):
+    """
+    Streams |source| through a pool of |workers| processes,
+    |chunksize| rows at a time, and writes the filtered rows to
+    |destination| in their original order as chunks complete.
+    Only a few chunks per worker are ever in flight, so memory
+    is bounded by the chunk size rather than the corpus size.
+
+    Returns the stem cache (hits, misses) of all workers.
+    """
+    hits = 0
+    misses = 0
+    window = 2 * workers
+    pending = deque()
+    chunks = read_chunks(source, chunksize)
 
-df.to_csv('filtered_data.csv')
\ No newline at end of file
+    with Pool(processes=workers) as pool, open(destination, 'w', newline='') as fout:
+        def write_oldest():
+            nonlocal hits, misses
+            text, chunk_hits, chunk_misses = pending.popleft().get()
+            fout.write(text)
+            hits += chunk_hits
+            misses += chunk_misses
+
+        for i, chunk in enumerate(chunks):
+            pending.append(pool.apply_async(filter_chunk, (chunk, i == 0)))
+            if len(pending) >= window:
+                write_oldest()
+        while len(pending) > 0:
+            write_oldest()
+    return (hits, misses)
+
+def report_stem_cache (hits, misses):
+    lookups = hits + misses
+    print("Stem cache: %d hits, %d misses (%.1f%% hit rate)" % \
+            (hits,                                             \
+             misses,                                           \
+             100 * hits / lookups if lookups > 0 else 0))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Filters stopwords and stems the messages of labeled_data.csv into filtered_data.csv.")
+    parser.add_argument("--workers", type=int, default=1,
+            help="number of worker processes; more than one implies --chunksize")
+    parser.add_argument("--chunksize", type=int, default=None,
+            help="stream the csv through the workers this many rows at a time")
+    parser.add_argument("--input", default='labeled_data.csv',
+            help="the labeled data, csv or columnar (which is always streamed "
+                 "a row group at a time)")
+    args = parser.parse_args()
+
+    if args.workers <= 1 and args.chunksize is None and not is_column_file(args.input):
+        df = pd.read_csv(args.input, dtype={'message': 'string'}, index_col=0)
+
+        curr = df['message'].apply(filter_data)
+        df['message'] = curr
+
+        df.to_csv('filtered_data.csv')
+
+        info = stem.cache_info()
+        report_stem_cache(info.hits, info.misses)
+    else:
+        hits, misses = filter_chunked(args.input, 'filtered_data.csv',
+                                      args.chunksize or 10000, max(1, args.workers))
+        report_stem_cache(hits, misses)
@@ -0,0 +1,120 @@
+import sys
+import time
+import argparse
+from pathlib import Path
+from udax.invindex import InvertedIndex
+
+
+# -------------------------------------
+# Constants
+# -------------------------------------
+
+default_index_path = Path("data/trec.inverted")
+
+
+# -------------------------------------
+# Queries
+# -------------------------------------
+
+def email_name(index, doc_id):
+    """The sanitized name of an email, e.g. 000000123.spam."""
+    return "%09d.%s" % (doc_id, "spam" if index.is_spam(doc_id) else "ham")
+
+
+def print_breakdown(index, doc_ids, elapsed, fd=sys.stderr):
+    ham, spam = index.label_counts(doc_ids)
+    print("%d emails: %d ham (%.2f%% of ham), %d spam (%.2f%% of spam) in %.3f ms" % \
+            (len(doc_ids),                                              \
+             ham,                                                       \
+             100 * ham / max(1, index.ham_documents),                  \
+             spam,                                                      \
+             100 * spam / max(1, index.spam_documents),                \
+             elapsed / 1e6),                                            \
+          file=fd)
+
+
+def match(index, words, every=True, label=None, count_only=False):
+    """
+    Prints the emails holding every one of |words|, or any of them,
+    keeping only the |label| ("spam" or "ham") emails when given,
+    followed by their label breakdown.
+    """
+    start = time.perf_counter_ns()
+    doc_ids = index.all_of(words) if every else index.any_of(words)
+    if label is not None:
+        doc_ids = [doc_id for doc_id in doc_ids if index.is_spam(doc_id) == (label == "spam")]
+    elapsed = time.perf_counter_ns() - start
+
+    if not count_only:
+        for doc_id in doc_ids:
+            print(email_name(index, doc_id))
+    print_breakdown(index, doc_ids, elapsed)
+
+
+def frequencies(index, words, top=None, label=None):
+    """
+    Prints the document frequency of |words|, or of the |top| most
+    frequent words (in |label| emails when given): the number of
+    emails holding the word, how many of them are ham and spam, and
+    the share of the spam emails that hold it.
+    """
+    start = time.perf_counter_ns()
+    if len(words) > 0:
+        rows = [(word,) + index.doc_frequency(word) for word in words]
+    else:
+        rows = index.top_frequencies(top, label)
+    elapsed = time.perf_counter_ns() - start
+
+    for word, df, spam_df in rows:
+        print("%s\t%d\t%d\t%d\t%.4f" % \
+                (word,                                      \
+                 df,                                        \
+                 df - spam_df,                              \
+                 spam_df,                                   \
+                 spam_df / max(1, index.spam_documents)))
+    print("%d words of %d, over %d emails (%d spam) in %.3f ms" % \
+            (len(rows), len(index), index.documents, index.spam_documents, elapsed / 1e6),
+          file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Looks words up in the inverted index of 'extract.py index'. "
+                        "'all' and 'any' print the emails holding every, or any, of "
+                        "the words, 'df' their document frequencies, or those of the "
+                        "most frequent words. Timings and label breakdowns go to stderr.")
+    parser.add_argument("--index", type=Path, default=default_index_path,
+            help="inverted index file")
+    parser.add_argument("--label", choices=["spam", "ham"], default=None,
+            help="only count, or rank by, the emails of this label")
+    parser.add_argument("--count", action="store_true",
+            help="only print the breakdown of the matching emails, not their names")
+    parser.add_argument("--top", type=int, default=20,
+            help="number of words 'df' ranks when no words are given")
+    parser.add_argument("command", choices=["all", "any", "df"])
+    parser.add_argument("words", nargs="*")
+    args = parser.parse_args()
+
+    try:
+        if not args.index.exists():
+            raise RuntimeError(f"{args.index} is missing, run extract.py index first")
+        words = [word.lower() for word in args.words]
+        if args.command != "df" and len(words) == 0:
+            raise RuntimeError(f"'{args.command}' needs at least one word")
+
+        start = time.perf_counter_ns()
+        index = InvertedIndex(args.index)
+        elapsed = time.perf_counter_ns() - start
+        print(f"Opened {args.index} ({len(index)} words) in {elapsed / 1e6:.3f} ms", file=sys.stderr)
+
+        with index:
+            if args.command == "df":
+                frequencies(index, words, args.top, args.label)
+            else:
+                match(index, words, args.command == "all", args.label, args.count)
+    except RuntimeError as e:
+        print(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
 import os
 import os.path
+import errno
 import shutil
+import argparse
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from udax.corpus import PackedCorpusWriter
+from udax.trecindex import load_index, STANDARD, TREC7
 
 
 numeric_id_limit = 9
@@ -13,17 +19,126 @@ ham_indicator = "ham"
 source_dir = Path("./data/trec-raw/")
 target_dir = Path("./data/trec/")
 
+# Where the packed corpus goes instead of target_dir
+# when packing (see udax.corpus).
+pack_file = Path("./data/trec.pack")
+pack_index_file = Path("./data/trec.index")
+
 # Maintains a count reference for each file
 # added to the targets directory for renaming and
 # indexing.
 count = 0
 
+# When packing, the targets are appended to this
+# PackedCorpusWriter instead of being copied.
+packer = None
+
+# How a target file is put in place, one of
+# copy, hardlink or reflink (see copy_file).
+copy_mode = "copy"
+
+# With more than one thread the copies (or the reads
+# when packing) are handed to this executor, and the
+# pending futures are kept in submission order.
+executor = None
+pending = deque()
+pending_limit = 1024
+
+# linux/fs.h
+FICLONE = 0x40049409
+
+
+def copy_file_range(source, destination):
+    """
+    Copies |source| into |destination| within the kernel, which
+    on filesystems that support it shares the extents instead.
+    Falls back to shutil.copyfile where copy_file_range is not
+    available.
+    """
+    if not hasattr(os, "copy_file_range"):
+        shutil.copyfile(source, destination)
+        return
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        remaining = os.fstat(src.fileno()).st_size
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL):
+                raise
+            src.seek(0)
+            dst.seek(0)
+            dst.truncate()
+            shutil.copyfileobj(src, dst)
+
+
+def reflink(source, destination):
+    """Clones |source| into |destination| (btrfs, xfs, ...)."""
+    # Imported here, fcntl is not there on every platform.
+    try:
+        import fcntl
+    except ImportError:
+        copy_file_range(source, destination)
+        return
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return
+        except OSError:
+            pass
+    copy_file_range(source, destination)
+
+
+def copy_file(source, destination):
+    """
+    Puts |source| in place at |destination| according to
+    copy_mode. Hard links fall back to a copy when the source
+    is on another filesystem, reflinks fall back to
+    copy_file_range when the filesystem cannot clone.
+    """
+    if copy_mode == "hardlink":
+        try:
+            os.link(source, destination)
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+        copy_file_range(source, destination)
+    elif copy_mode == "reflink":
+        reflink(source, destination)
+    else:
+        shutil.copyfile(source, destination)
+
+
+def drain(limit=0):
+    """Waits on pending work, oldest first, until at most |limit| remain."""
+    while len(pending) > limit:
+        future, is_spam, dataset = pending.popleft()
+        result = future.result()
+        if packer is not None:
+            packer.add(result, is_spam, dataset)
+
+
+def verify_pack():
+    if not os.path.exists(source_dir):
+        raise RuntimeError(f"Source directory {source_dir} does not exist")
+    if pack_file.exists() or pack_index_file.exists():
+        desire = None
+        while desire is None or (desire != "y" and desire != "n"):
+            desire = input(f"Packed corpus {pack_file} already exists, overwrite it? [y/n]: ").lower()
+        if desire != "y":
+            raise RuntimeError(f"Packed corpus exists and overwrite request is denied")
+    pack_file.parent.mkdir(parents=True, exist_ok=True)
+
 
 def verify():
     if not os.path.exists(source_dir):
         raise RuntimeError(f"Source directory {source_dir} does not exist")
     if not os.path.exists(target_dir):
-        target_dir.mkdirs(parents=True)
+        target_dir.mkdir(parents=True)
     else:
         is_target_dir_empty = len(os.listdir(target_dir)) == 0
         if not is_target_dir_empty:
@@ -38,54 +153,53 @@ def verify():
                 raise RuntimeError(f"Target directory is not empty and delete request is denied")
 
 
-def copy_target_standard(target, is_spam):
+def copy_target_standard(target, is_spam, dataset=0):
     global count
+    if packer is not None:
+        if executor is None:
+            packer.add(target.read_bytes(), is_spam, dataset)
+        else:
+            pending.append((executor.submit(target.read_bytes), is_spam, dataset))
+            drain(pending_limit)
+        count += 1
+        return
+
     target_name = str(count)
     padded_name = "0" * (numeric_id_limit - len(target_name)) + target_name
 
     target_postfix = "spam" if is_spam else "ham"
     target_file = target_dir.joinpath(f"{padded_name}.{target_postfix}")
 
-    shutil.copyfile(target, target_file) 
+    if executor is None:
+        copy_file(target, target_file)
+    else:
+        pending.append((executor.submit(copy_file, target, target_file), is_spam, dataset))
+        drain(pending_limit)
     count += 1
 
 
-
-def copy_trec_standard(trec_dir):
+def copy_trec_standard(trec_dir, dataset=0):
     global count
     data_dir = trec_dir.joinpath("data")
     index_file = trec_dir.joinpath("full/index")
 
     print(f"Reading index for {str(trec_dir)}")
-    spam = []
-    with index_file.open(mode="r", encoding="latin-1") as ind:
-        for line in ind:
-            entry = line.split(' ')
-            is_spam = "spam" == entry[0]
-            elements = entry[1].split('/')
-            corpi = int(elements[-2])
-            target = int(elements[-1])
-            while len(spam) <= corpi:
-                spam.append([])
-            target_list = spam[corpi]
-            while len(target_list) <= target:
-                target_list.append(False)
-            target_list[target] = is_spam
-    
+    spam = load_index(index_file, STANDARD)
+
     print(f"Copying existing targets in {trec_dir}")
     for corpi in data_dir.iterdir():
         for target in corpi.iterdir():
             i_corpus = int(corpi.parts[-1])
             i_target = int(target.parts[-1])
-            copy_target_standard(target, spam[i_corpus][i_target])
+            copy_target_standard(target, spam.is_spam(i_corpus, i_target), dataset)
 
 
 def copy_trec5():
-    copy_trec_standard(source_dir.joinpath("trec05p-1"))
+    copy_trec_standard(source_dir.joinpath("trec05p-1"), 5)
     
 
 def copy_trec6():
-    copy_trec_standard(source_dir.joinpath("trec06p"))
+    copy_trec_standard(source_dir.joinpath("trec06p"), 6)
 
 
 def copy_trec7():
@@ -95,29 +209,46 @@ def copy_trec7():
     index_file = trec_dir.joinpath("full/index")
 
     print(f"Reading index for {str(trec_dir)}")
-    spam = []
-    with index_file.open(mode="r", encoding="latin-1") as ind:
-        for line in ind:
-            entry = line.split(' ')
-            is_spam = "spam" == entry[0]
-            target = int(entry[1].split('.')[-1])
-            while len(spam) <= target:
-                spam.append(False)
-            spam[target] = is_spam
+    spam = load_index(index_file, TREC7)
 
     print(f"Copying existing targets in {trec_dir}")
     for target in data_dir.iterdir():
         i_target = int(target.parts[-1].split('.')[-1])
-        copy_target_standard(target, spam[i_target])
+        copy_target_standard(target, spam.is_spam(i_target), 7)
 
 
 if __name__ == "__main__": 
+    parser = argparse.ArgumentParser(description="Copies the raw TREC datasets into a single, uniformly named set of targets.")
+    parser.add_argument("--pack", action="store_true",
+            help=f"write one packed corpus ({pack_file} and {pack_index_file}) "
+                 f"instead of a file per target in {target_dir}")
+    parser.add_argument("--mode", choices=["copy", "hardlink", "reflink"], default="copy",
+            help="how targets are put in place: full copies, hard links to the "
+                 "raw files, or reflinks (copy_file_range where unsupported)")
+    parser.add_argument("--threads", type=int, default=1,
+            help="number of threads copying (or, when packing, reading) targets")
+    args = parser.parse_args()
+
+    copy_mode = args.mode
+    if args.threads > 1:
+        executor = ThreadPoolExecutor(max_workers=args.threads)
+
     try:
-        verify()
+        if args.pack:
+            verify_pack()
+            packer = PackedCorpusWriter(pack_file, pack_index_file)
+        else:
+            verify()
         copy_trec5()
         copy_trec6()
         copy_trec7()
+        drain()
+        if packer is not None:
+            packer.close()
         print("Ok")
     except RuntimeError as e:
         print(str(e))
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
@@ -0,0 +1,134 @@
+import sys
+import time
+import argparse
+from pathlib import Path
+from udax.features import WordStats, METHODS, rank_words, save_vocab, evaluate_sizes
+
+
+# -------------------------------------
+# Constants
+# -------------------------------------
+
+trec_cache = Path("data/trec-cache")
+default_index_path = Path("data/trec.inverted")
+default_docterm_dir = Path("data/docterm")
+default_vocab_path = Path("data/vocab.txt")
+default_sizes = "100,300,1000,3000,10000,30000,100000"
+
+
+# -------------------------------------
+# Selection
+# -------------------------------------
+
+def select(cache_dir, index_path, vocab_path, method, size, min_count, min_df):
+    """
+    Ranks the words of the extract.py cache with |method| and saves
+    the |size| best of them (all of them when None) that pass the
+    |min_count| and |min_df| thresholds to |vocab_path|.
+    """
+    if not cache_dir.exists():
+        raise RuntimeError(f"{cache_dir} does not exist, please run extract.py first")
+
+    begin = time.monotonic_ns()
+    stats = WordStats.from_cache(cache_dir, index_path)
+    ranked = rank_words(stats, method, min_count, min_df)
+    if size is not None:
+        ranked = ranked[:size]
+    save_vocab(ranked, vocab_path, method)
+    print("Kept %d of %d words (%s) over %d ham and %d spam emails into %s in %.2fs" % \
+            (len(ranked),                                 \
+             len(stats),                                  \
+             method,                                      \
+             stats.ham_documents,                         \
+             stats.spam_documents,                        \
+             vocab_path,                                  \
+             (time.monotonic_ns() - begin) / 1e9))
+
+
+def report(docterm_dir, sizes, method, min_count, min_df, test_fraction):
+    """Prints the held-out accuracy of the models pruned to every size of |sizes|."""
+    if not docterm_dir.exists():
+        raise RuntimeError(f"{docterm_dir} does not exist, please run extract.py docterm --shuffle SEED first")
+
+    results = evaluate_sizes(docterm_dir, sizes, method, min_count, min_df, test_fraction)
+    print("%10s %10s %10s %10s" % ("words", "accuracy", "train ms", "test ms"))
+    for size, accuracy, train_time, test_time in results:
+        print("%10d %10.4f %10.1f %10.1f" % \
+                (size,                     \
+                 accuracy,                 \
+                 train_time * 1e3,         \
+                 test_time * 1e3))
+
+
+def parse_sizes(text):
+    sizes = []
+    for size in text.split(","):
+        if size == "all":
+            sizes.append(None)
+            continue
+        try:
+            value = int(size)
+        except ValueError:
+            value = 0
+        if value < 1:
+            raise RuntimeError(f"Invalid vocabulary size {size}, expected a positive number or 'all'")
+        sizes.append(value)
+    return sizes
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "report":
+        parser = argparse.ArgumentParser(prog="select_vocab.py report",
+                description="Reports the accuracy of the Naive-Bayes model against the size "
+                            "of its vocabulary on a held-out split of the document-term "
+                            "matrix of 'extract.py docterm'. Words are ranked on the "
+                            "training rows only.")
+        parser.add_argument("--docterm", type=Path, default=default_docterm_dir,
+                help="the document-term matrix, exported with --shuffle so the split is random")
+        parser.add_argument("--sizes", default=default_sizes + ",all",
+                help="comma separated vocabulary sizes to try, 'all' for every word")
+        parser.add_argument("--test-fraction", type=float, default=0.25,
+                help="the share of the rows held out")
+        argv = sys.argv[2:]
+    else:
+        command = None
+        parser = argparse.ArgumentParser(
+                description="Ranks the words of the extract.py cache by how well they tell "
+                            "spam from ham and writes the best of them out as a vocabulary, "
+                            "for extract.py --vocab and classify.py compile --vocab. Use "
+                            "'select_vocab.py report' for the accuracy against the size of "
+                            "the vocabulary.")
+        parser.add_argument("--cache", type=Path, default=trec_cache,
+                help="the extract.py cache holding TABLE.spam and TABLE.ham")
+        parser.add_argument("--index", type=Path, default=default_index_path,
+                help="the inverted index of 'extract.py index', for the document "
+                     "frequencies; they are counted from the cache without it")
+        parser.add_argument("--output", type=Path, default=default_vocab_path,
+                help="vocabulary file to write")
+        parser.add_argument("--size", type=int, default=None,
+                help="the number of words to keep, every word passing the thresholds by default")
+        argv = sys.argv[1:]
+
+    parser.add_argument("--method", choices=list(METHODS), default="chi2",
+            help="rank words by chi-square or mutual information with the label, "
+                 "or by count or document frequency")
+    parser.add_argument("--min-count", type=int, default=0,
+            help="drop the words appearing fewer times than this")
+    parser.add_argument("--min-df", type=int, default=0,
+            help="drop the words appearing in fewer emails than this")
+    args = parser.parse_args(argv)
+
+    try:
+        if command == "report":
+            report(args.docterm, parse_sizes(args.sizes), args.method, args.min_count,
+                   args.min_df, args.test_fraction)
+        else:
+            select(args.cache, args.index, args.output, args.method, args.size,
+                   args.min_count, args.min_df)
+    except RuntimeError as e:
+        print(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Helpers to replace files atomically, so a crash never
+leaves a half written file behind.
+"""
+import os
+from pathlib import Path
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_open(path, mode="w", **kwargs):
+    """
+    Opens a temporary file next to |path| for writing and, once
+    the block exits cleanly, flushes it to disk and renames it
+    over |path|. On error the temporary file is removed and
+    |path| is left untouched.
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    handle = tmp.open(mode=mode, **kwargs)
+    try:
+        yield handle
+        handle.flush()
+        os.fsync(handle.fileno())
+        handle.close()
+        os.replace(tmp, path)
+    except BaseException:
+        handle.close()
+        tmp.unlink(missing_ok=True)
+        raise
@@ -0,0 +1,183 @@
+"""
+The Naive-Bayes classifier of the notebook, trained from a
+document-term count matrix and evaluated in log space over
+whole batches of documents.
+
+The notebook scores a message as
+
+    P(c) * prod over distinct words w of ((n(c, w) + 1) / N(c)) * count(w)
+
+where n(c, w) is the training count of w in class c, N(c) the
+number of training words of class c and P(c) = N(c) / N. Words
+never seen in training get 1 / N(c). The product underflows
+to 0.0 on long emails; here it is the equivalent sum of logs,
+so the decision spam > ham is the same wherever the notebook
+did not underflow.
+"""
+from collections import Counter
+
+import numpy as np
+
+from udax.sparse import CsrMatrix, column_sums, row_sums, dot
+from udax.tokenizer import MAX_WORD_LENGTH
+
+
+HAM = 0
+SPAM = 1
+
+
+def count_matrix(messages, vocab=None, max_length=None):
+    """
+    Splits every message on " " and counts its words into a
+    CsrMatrix, one row per message.
+
+    :param messages: an iterable of strings
+    :param vocab: a word -> column dict. When None, a new one
+                  is built from the messages. When given it is
+                  left untouched, and the words it lacks are all
+                  stored (each as its own entry) in one extra
+                  column, len(vocab), which the classifier treats
+                  as never seen.
+    :param max_length: words at least this long are dropped
+    :return: (matrix, vocab)
+    """
+    grow = vocab is None
+    if grow:
+        vocab = {}
+    unseen = len(vocab)
+
+    indptr = [0]
+    indices = []
+    data = []
+    for message in messages:
+        for word, count in Counter(message.split(" ")).items():
+            if max_length is not None and len(word) >= max_length:
+                continue
+            column = vocab.get(word)
+            if column is None:
+                if grow:
+                    column = len(vocab)
+                    vocab[word] = column
+                else:
+                    column = unseen
+            indices.append(column)
+            data.append(count)
+        indptr.append(len(indices))
+
+    columns = len(vocab) if grow else unseen + 1
+    return (CsrMatrix(indptr, indices, np.asarray(data, dtype=np.int64), (len(indptr) - 1, columns)), vocab)
+
+
+class NaiveBayes:
+    """
+    A trained classifier. |vocab| is the list of words, in
+    column order, and |counts| the (2, len(vocab)) array of
+    their training counts in ham (row HAM) and spam (row SPAM).
+
+    A |pruned| model was trained on a selected vocabulary (see
+    udax.features): words outside of it are dropped rather than
+    scored as never seen.
+    """
+
+    def __init__(self, vocab, counts, pruned=False):
+        self.vocab = list(vocab)
+        self.pruned = pruned
+        self.counts = np.asarray(counts, dtype=np.float64)
+        if self.counts.shape != (2, len(self.vocab)):
+            raise RuntimeError(f"Expected (2, {len(self.vocab)}) word counts, got {self.counts.shape}")
+
+        self.totals = self.counts.sum(axis=1)
+        if not (self.totals > 0).all():
+            raise RuntimeError("Both ham and spam need training words")
+        self.log_prior = np.log(self.totals) - np.log(self.totals.sum())
+        self.log_unseen = -np.log(self.totals)
+        self.log_likelihood = np.log1p(self.counts) + self.log_unseen[:, None]
+
+        # Column weights of the score product, the last row being
+        # that of the unseen column of count_matrix.
+        self._weights = np.vstack((self.log_likelihood.T, self.log_unseen))
+        self._word_ids = None
+
+    @staticmethod
+    def train(matrix, labels, vocab):
+        """
+        Trains from a document-term count |matrix| whose columns
+        are the words of |vocab| (a list, or a word -> column
+        dict) and a boolean |labels| vector, True for spam.
+        """
+        if isinstance(vocab, dict):
+            words = [None] * len(vocab)
+            for word, column in vocab.items():
+                words[column] = word
+            vocab = words
+        labels = np.asarray(labels, dtype=bool)
+        if len(labels) != matrix.shape[0]:
+            raise RuntimeError(f"{len(labels)} labels for {matrix.shape[0]} documents")
+        if matrix.shape[1] != len(vocab):
+            raise RuntimeError(f"{matrix.shape[1]} columns for {len(vocab)} words")
+
+        counts = np.vstack((column_sums(matrix, ~labels), column_sums(matrix, labels)))
+        return NaiveBayes(vocab, counts)
+
+    @staticmethod
+    def train_messages(messages, labels):
+        """Trains from raw messages, dropping long words as the notebook does."""
+        matrix, vocab = count_matrix(messages, max_length=MAX_WORD_LENGTH)
+        return NaiveBayes.train(matrix, labels, vocab)
+
+    @staticmethod
+    def from_tables(spam_table, ham_table, max_length=MAX_WORD_LENGTH, selected=None):
+        """
+        Trains from two word -> count tables, such as the global
+        TABLE.spam and TABLE.ham of extract.py, keeping only the
+        words of |selected| (a set) when given, as a pruned model.
+        """
+        vocab = sorted(word for word in spam_table.keys() | ham_table.keys()
+                       if (max_length is None or len(word) < max_length) and
+                          (selected is None or word in selected))
+        counts = np.array([[ham_table.get(word, 0) for word in vocab],
+                           [spam_table.get(word, 0) for word in vocab]], dtype=np.float64)
+        return NaiveBayes(vocab, counts.reshape(2, len(vocab)), pruned=selected is not None)
+
+    @property
+    def word_ids(self):
+        """The word -> column dict of the vocabulary."""
+        if self._word_ids is None:
+            self._word_ids = {word: i for i, word in enumerate(self.vocab)}
+        return self._word_ids
+
+    def log_scores(self, matrix):
+        """
+        Returns the (documents, 2) array of log scores, ham first,
+        of a count |matrix| over this vocabulary (optionally with
+        the unseen column of count_matrix).
+        """
+        columns = matrix.shape[1]
+        if columns != len(self.vocab) and columns != len(self.vocab) + 1:
+            raise RuntimeError(f"{columns} columns for {len(self.vocab)} words")
+
+        data = matrix.data
+        weights = self._weights[:columns]
+        if self.pruned and columns > len(self.vocab):
+            # The unseen words weigh nothing at all: no weight, and a
+            # count of 1 adds log(1) = 0 below.
+            data = np.where(matrix.indices == len(self.vocab), 1, data)
+            weights = weights.copy()
+            weights[-1] = 0
+
+        # Each distinct word weighs in once, whatever its count...
+        presence = CsrMatrix(matrix.indptr, matrix.indices, np.ones(len(data)), matrix.shape)
+        scores = dot(presence, weights)
+        # ... and its count multiplies both scores alike.
+        scores += row_sums(matrix, np.log(data))[:, None]
+        scores += self.log_prior
+        return scores
+
+    def predict(self, matrix):
+        """Returns a boolean vector, True for the documents classified as spam."""
+        scores = self.log_scores(matrix)
+        return scores[:, SPAM] > scores[:, HAM]
+
+    def predict_messages(self, messages):
+        matrix, vocab = count_matrix(messages, vocab=self.word_ids)
+        return self.predict(matrix)
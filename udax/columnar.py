@@ -0,0 +1,212 @@
+"""
+A chunked, columnar file format for tables of text and flags,
+e.g. the labeled dataset of extract.py (message, sender, label),
+which can be written a row at a time and read back a row group
+at a time, so neither side ever holds the whole table.
+
+    header      MAGIC, the column count (uint32), then for every
+                column its type (uint8, STR or BOOL), the length
+                of its name (uint16) and the name (utf-8)
+    row groups  for every column in turn:
+                  STR   the (rows + 1) uint64 offsets of the
+                        values into the utf-8 blob that follows
+                  BOOL  one byte per row
+    footer      for every row group, its offset in the file and
+                row count, then the byte size of every column
+                (uint64 each)
+    trailer     the footer offset and the row group count
+                (uint64 each), then MAGIC again
+
+Everything is little endian. A reader seeks to the trailer,
+reads the footer and can then read any row group, or only some
+of its columns, without touching the others.
+"""
+import struct
+from array import array
+from pathlib import Path
+
+from udax.common import check_byteorder
+
+
+MAGIC = b"UDAXCOL1"
+
+STR = 0
+BOOL = 1
+TYPES = {"str": STR, "bool": BOOL}
+
+TRAILER = struct.Struct("<QQ8s")
+
+default_rows_per_group = 10000
+
+
+def is_column_file(path):
+    """Tells whether |path| starts like a columnar file."""
+    with Path(path).open(mode="rb") as handle:
+        return handle.read(len(MAGIC)) == MAGIC
+
+
+def _encode_str(values):
+    blobs = [value.encode("utf-8") for value in values]
+    offsets = array('Q', [0])
+    position = 0
+    for blob in blobs:
+        position += len(blob)
+        offsets.append(position)
+    return offsets.tobytes() + b"".join(blobs)
+
+
+def _decode_str(data, rows):
+    offsets = array('Q')
+    offsets.frombytes(data[:8 * (rows + 1)])
+    blob = data[8 * (rows + 1):]
+    return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(rows)]
+
+
+class ColumnWriter:
+    """
+    Writes a columnar file at |path| with the columns of |schema|,
+    a list of (name, "str" | "bool"). Rows are buffered and written
+    out every |rows_per_group| rows; the writer must be closed for
+    the footer to be written.
+    """
+
+    def __init__(self, path, schema, rows_per_group=default_rows_per_group):
+        check_byteorder("the columnar format")
+        self.path = Path(path)
+        self.names = [name for name, kind in schema]
+        self.types = []
+        for name, kind in schema:
+            if kind not in TYPES:
+                raise RuntimeError(f"Unknown column type {kind} of column {name}")
+            self.types.append(TYPES[kind])
+        self.rows_per_group = max(1, rows_per_group)
+        self.columns = [[] for _ in schema]
+        self.groups = array('Q')    # offset, rows, column sizes... per group
+        self.rows = 0
+
+        self.handle = self.path.open(mode="wb")
+        header = [MAGIC, struct.pack("<I", len(schema))]
+        for name, kind in zip(self.names, self.types):
+            encoded = name.encode("utf-8")
+            header.append(struct.pack("<BH", kind, len(encoded)))
+            header.append(encoded)
+        self.handle.write(b"".join(header))
+
+    def add(self, row):
+        """Adds a row, one value per column in schema order."""
+        for column, value in zip(self.columns, row):
+            column.append(value)
+        if len(self.columns[0]) >= self.rows_per_group:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered rows out as a row group."""
+        rows = len(self.columns[0])
+        if rows == 0:
+            return
+        self.groups.extend((self.handle.tell(), rows))
+        for column, kind in zip(self.columns, self.types):
+            if kind == STR:
+                data = _encode_str(column)
+            else:
+                data = bytes(1 if value else 0 for value in column)
+            self.handle.write(data)
+            self.groups.append(len(data))
+        self.rows += rows
+        self.columns = [[] for _ in self.columns]
+
+    def close(self):
+        if self.handle is None:
+            return
+        self.flush()
+        footer = self.handle.tell()
+        self.handle.write(self.groups.tobytes())
+        self.handle.write(TRAILER.pack(footer, len(self.groups) // (2 + len(self.types)), MAGIC))
+        self.handle.close()
+        self.handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ColumnReader:
+    """Reads a columnar file written by ColumnWriter, a row group at a time."""
+
+    def __init__(self, path):
+        check_byteorder("the columnar format")
+        self.path = Path(path)
+        self.handle = self.path.open(mode="rb")
+        handle = self.handle
+
+        if handle.read(len(MAGIC)) != MAGIC:
+            handle.close()
+            raise RuntimeError(f"{path} is not a columnar file")
+        count, = struct.unpack("<I", handle.read(4))
+        self.names = []
+        self.types = []
+        for _ in range(count):
+            kind, length = struct.unpack("<BH", handle.read(3))
+            self.types.append(kind)
+            self.names.append(handle.read(length).decode("utf-8"))
+
+        handle.seek(-TRAILER.size, 2)
+        footer, group_count, magic = TRAILER.unpack(handle.read(TRAILER.size))
+        if magic != MAGIC:
+            handle.close()
+            raise RuntimeError(f"{path} is truncated, the columnar file was never closed")
+        handle.seek(footer)
+        width = 2 + len(self.names)
+        groups = array('Q')
+        groups.frombytes(handle.read(8 * width * group_count))
+        self.groups = [groups[i * width:(i + 1) * width] for i in range(group_count)]
+
+        # The first row of every group, and the total.
+        self.starts = [0]
+        for group in self.groups:
+            self.starts.append(self.starts[-1] + group[1])
+
+    def __len__(self):
+        return self.starts[-1]
+
+    @property
+    def row_groups(self):
+        return len(self.groups)
+
+    def read_row_group(self, i, columns=None):
+        """
+        Returns the values of row group |i| as a dict of column
+        name -> list, for every column or only those in |columns|.
+        """
+        group = self.groups[i]
+        offset = group[0]
+        rows = group[1]
+        result = {}
+        for name, kind, size in zip(self.names, self.types, group[2:]):
+            if columns is None or name in columns:
+                self.handle.seek(offset)
+                data = self.handle.read(size)
+                if kind == STR:
+                    result[name] = _decode_str(data, rows)
+                else:
+                    result[name] = [b == 1 for b in data]
+            offset += size
+        return result
+
+    def iter_row_groups(self, columns=None):
+        """Yields (first row, values) of every row group in order."""
+        for i in range(len(self.groups)):
+            yield (self.starts[i], self.read_row_group(i, columns))
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,23 @@
+"""
+Small helpers shared by the udax modules reading and writing
+word tables and binary files.
+"""
+import sys
+
+
+def check_byteorder(what):
+    """
+    Raises a RuntimeError on big endian hosts, which the binary
+    formats of |what| (e.g. "compiled models") do not support.
+    """
+    if sys.byteorder != "little":
+        raise RuntimeError(f"Only little endian hosts are supported for {what}")
+
+
+def word_counts(word_table):
+    """
+    Yields the (word, count) of a word -> count table, or of a
+    word -> (count, relative-freq) table as HttpEmail builds.
+    """
+    for word, statistic in word_table.items():
+        yield (word, statistic if isinstance(statistic, int) else statistic[0])
@@ -0,0 +1,123 @@
+"""
+A packed corpus: every message of the sanitized TREC
+datasets concatenated into a single file, next to a
+fixed width index that locates them.
+
+The index starts with a 16 byte header (8 byte magic
+and padding) followed by one 16 byte entry per message,
+in the order sanitize.py numbered them:
+
+    offset      uint64  where the message starts in the pack
+    length      uint32  size of the message in bytes
+    label       uint8   1 for spam, 0 for ham
+    dataset     uint8   the TREC dataset it came from (5, 6, 7)
+    padding     2 bytes
+
+all little endian. The entry position is the numeric id
+the message would have had as a loose file.
+"""
+import mmap
+import struct
+from pathlib import Path
+
+
+INDEX_MAGIC = b"UDAXPAK1"
+HEADER_SIZE = 16
+ENTRY = struct.Struct("<QIBBxx")
+
+
+def target_name(numeric_id, is_spam, numeric_id_limit=9):
+    """The name the message would have had as a loose file, e.g. 000000123.spam"""
+    return "%0*d.%s" % (numeric_id_limit, numeric_id, "spam" if is_spam else "ham")
+
+
+class PackedCorpusWriter:
+    """Appends messages to a pack and its index."""
+
+    def __init__(self, pack_path, index_path):
+        self.pack = Path(pack_path).open(mode="wb")
+        self.index = Path(index_path).open(mode="wb")
+        self.index.write(INDEX_MAGIC.ljust(HEADER_SIZE, b"\0"))
+        self.offset = 0
+        self.count = 0
+
+    def add(self, payload, is_spam, dataset=0):
+        """Appends |payload| and returns its numeric id."""
+        self.pack.write(payload)
+        self.index.write(ENTRY.pack(self.offset, len(payload), 1 if is_spam else 0, dataset))
+        self.offset += len(payload)
+        self.count += 1
+        return self.count - 1
+
+    def close(self):
+        self.pack.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PackedCorpus:
+    """
+    Read only access to a pack written by PackedCorpusWriter.
+    Both files are memory mapped, so reading a message costs
+    no open/read/close, only a copy out of the page cache.
+    """
+
+    def __init__(self, pack_path, index_path):
+        self.pack_path = Path(pack_path)
+        self.index_path = Path(index_path)
+
+        with self.index_path.open(mode="rb") as handle:
+            self._index = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._index[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            self._index.close()
+            raise RuntimeError(f"{self.index_path} is not a packed corpus index")
+        self.count = (len(self._index) - HEADER_SIZE) // ENTRY.size
+
+        # An empty file cannot be mapped.
+        self._pack = b""
+        if self.pack_path.stat().st_size > 0:
+            with self.pack_path.open(mode="rb") as handle:
+                self._pack = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.count
+
+    def entry(self, numeric_id):
+        """Returns (offset, length, is_spam, dataset) of a message."""
+        if not 0 <= numeric_id < self.count:
+            raise IndexError(numeric_id)
+        offset, length, label, dataset = ENTRY.unpack_from(self._index, HEADER_SIZE + numeric_id * ENTRY.size)
+        return (offset, length, label == 1, dataset)
+
+    def is_spam(self, numeric_id):
+        return self.entry(numeric_id)[2]
+
+    def name(self, numeric_id):
+        return target_name(numeric_id, self.is_spam(numeric_id))
+
+    def message(self, numeric_id):
+        """Returns the raw bytes of a message."""
+        offset, length, is_spam, dataset = self.entry(numeric_id)
+        return self._pack[offset:offset + length]
+
+    def __iter__(self):
+        """Iterates over (numeric_id, is_spam, dataset) of every message."""
+        for numeric_id, (offset, length, label, dataset) in \
+                enumerate(ENTRY.iter_unpack(self._index[HEADER_SIZE:HEADER_SIZE + self.count * ENTRY.size])):
+            yield (numeric_id, label == 1, dataset)
+
+    def close(self):
+        self._index.close()
+        if isinstance(self._pack, mmap.mmap):
+            self._pack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
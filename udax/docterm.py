@@ -0,0 +1,198 @@
+"""
+A document-term count matrix of the extracted emails, in
+compressed sparse row (CSR) form, saved as plain .npy files
+so it can be memory mapped instead of read.
+
+    indptr.npy      int64, rows + 1: row i spans
+                    indices[indptr[i]:indptr[i + 1]]
+    indices.npy     uint32, the word id of every count
+    data.npy        uint32, the counts
+    labels.npy      uint8, 1 for spam, per row
+    doc_ids.npy     int64, the numeric id of the email of
+                    every row
+    vocab.txt       the words, one per line (utf-8), the
+                    line number being the word id
+
+DocTermWriter streams the counts to disk as documents are
+added, from HttpEmail (or EmailCounts) word tables or the
+per-email cache, without numpy. DocTermMatrix maps the files
+back (numpy only) and slices rows out of them without copying
+the counts, so a train/test split of a matrix larger than
+memory is only the split of two views.
+"""
+import struct
+from array import array
+from pathlib import Path
+
+from udax.common import check_byteorder, word_counts
+from udax.tablecache import iterate_cache
+
+
+INDPTR_NAME = "indptr.npy"
+INDICES_NAME = "indices.npy"
+DATA_NAME = "data.npy"
+LABELS_NAME = "labels.npy"
+DOC_IDS_NAME = "doc_ids.npy"
+VOCAB_NAME = "vocab.txt"
+
+_NPY_MAGIC = b"\x93NUMPY\x01\x00"
+# Room for any length in the header, so it can be written
+# once the length is known without moving the data.
+_NPY_HEADER_SIZE = 128
+
+
+def _npy_header(descr, length):
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, length)
+    padding = _NPY_HEADER_SIZE - len(_NPY_MAGIC) - 2 - len(header) - 1
+    return _NPY_MAGIC + struct.pack("<H", _NPY_HEADER_SIZE - len(_NPY_MAGIC) - 2) + \
+           (header + " " * padding + "\n").encode("latin-1")
+
+
+def _write_npy(path, descr, values):
+    with Path(path).open(mode="wb") as handle:
+        handle.write(_npy_header(descr, len(values)))
+        handle.write(values.tobytes())
+
+
+class DocTermWriter:
+    """
+    Writes a document-term matrix into |directory|, a document
+    (row) at a time. With a |vocab| (a list of words) the columns
+    are fixed and the words outside of it dropped, otherwise
+    every new word gets the next column. The writer must be closed
+    for the matrix to be complete.
+    """
+
+    def __init__(self, directory, vocab=None):
+        check_byteorder("the document-term matrix")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.grow = vocab is None
+        self.vocab = {} if vocab is None else {word: i for i, word in enumerate(vocab)}
+        self.indptr = array('q', [0])
+        self.labels = array('B')
+        self.doc_ids = array('q')
+
+        self.indices = self.directory.joinpath(INDICES_NAME).open(mode="wb")
+        self.data = self.directory.joinpath(DATA_NAME).open(mode="wb")
+        self.indices.write(_npy_header("<u4", 0))
+        self.data.write(_npy_header("<u4", 0))
+
+    def add(self, doc_id, is_spam, word_table):
+        """
+        Adds a row. |word_table| maps word -> count, or word ->
+        (count, relative-freq) as in HttpEmail.
+        """
+        vocab = self.vocab
+        word_ids = array('I')
+        counts = array('I')
+        for word, count in word_counts(word_table):
+            word_id = vocab.get(word)
+            if word_id is None:
+                if not self.grow:
+                    continue
+                word_id = len(vocab)
+                vocab[word] = word_id
+            word_ids.append(word_id)
+            counts.append(count)
+
+        self.indices.write(word_ids.tobytes())
+        self.data.write(counts.tobytes())
+        self.indptr.append(self.indptr[-1] + len(word_ids))
+        self.labels.append(1 if is_spam else 0)
+        self.doc_ids.append(doc_id)
+
+    def close(self):
+        if self.indices is None:
+            return
+        nnz = self.indptr[-1]
+        for handle in [self.indices, self.data]:
+            handle.seek(0)
+            handle.write(_npy_header("<u4", nnz))
+            handle.close()
+        self.indices = None
+        self.data = None
+
+        _write_npy(self.directory.joinpath(INDPTR_NAME), "<i8", self.indptr)
+        _write_npy(self.directory.joinpath(LABELS_NAME), "|u1", self.labels)
+        _write_npy(self.directory.joinpath(DOC_IDS_NAME), "<i8", self.doc_ids)
+        with self.directory.joinpath(VOCAB_NAME).open(mode="w", encoding="utf-8") as handle:
+            for word in self.vocab:
+                handle.write(word)
+                handle.write("\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_cache(cache_dir, directory, shuffle_seed=None, vocab=None):
+    """
+    Writes the per-email cache in |cache_dir| out as a document-term
+    matrix in |directory|. Returns the number of rows.
+
+    Rows follow the doc_id order, or a shuffle of it seeded with
+    |shuffle_seed|, so that contiguous row ranges (see
+    DocTermMatrix.split) are random samples.
+    """
+    with DocTermWriter(directory, vocab) as writer:
+        for doc_id, is_spam, word_table in iterate_cache(cache_dir, shuffle_seed):
+            writer.add(doc_id, is_spam, word_table)
+        return len(writer.labels)
+
+
+class DocTermMatrix:
+    """
+    A document-term matrix written by DocTermWriter, memory mapped
+    unless |mmap| is False.
+
+    |matrix| is a udax.sparse.CsrMatrix, |labels| and |doc_ids|
+    numpy vectors with one entry per row and |vocab| the list of
+    words of the columns.
+    """
+
+    def __init__(self, directory, mmap=True):
+        import numpy as np
+        from udax.sparse import CsrMatrix
+
+        self.directory = Path(directory)
+        mode = "r" if mmap else None
+        load = lambda name: np.load(self.directory.joinpath(name), mmap_mode=mode)
+        with self.directory.joinpath(VOCAB_NAME).open(mode="r", encoding="utf-8", newline="\n") as handle:
+            self.vocab = handle.read().split("\n")[:-1]
+        indptr = load(INDPTR_NAME)
+        self.matrix = CsrMatrix(indptr, load(INDICES_NAME), load(DATA_NAME),
+                                (len(indptr) - 1, len(self.vocab)))
+        self.labels = load(LABELS_NAME)
+        self.doc_ids = load(DOC_IDS_NAME)
+        self._word_ids = None
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def word_ids(self):
+        """The word -> column dict of the vocabulary."""
+        if self._word_ids is None:
+            self._word_ids = {word: i for i, word in enumerate(self.vocab)}
+        return self._word_ids
+
+    def rows(self, start, stop):
+        """
+        Returns the (matrix, labels) of rows [start, stop). The
+        counts and labels are views of these, only the indptr of
+        the rows is copied.
+        """
+        return (self.matrix.row_slice(start, stop), self.labels[start:stop])
+
+    def split(self, test_fraction=0.25):
+        """
+        Splits the rows into ((train matrix, train labels),
+        (test matrix, test labels)), the test rows being the last
+        |test_fraction| of them, as the notebook does once it has
+        shuffled the data (see export_cache).
+        """
+        boundary = int(len(self) * (1 - test_fraction))
+        return (self.rows(0, boundary), self.rows(boundary, len(self)))
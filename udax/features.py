@@ -0,0 +1,285 @@
+"""
+Feature selection: ranking the words of the extracted emails by
+how much they tell spam from ham, so that the extractor, the
+trainer and the classifier can drop all but the best of them.
+
+Every word is described by four numbers, its count in the ham
+and in the spam emails (the global TABLE.ham and TABLE.spam of
+extract.py) and the number of ham and spam emails it appears in
+(its document frequencies, from the inverted index of
+udax.invindex or the per-email cache). The scores are computed
+over the 2x2 table of emails holding the word or not, by label:
+
+    chi2    the chi-square statistic of the table, how far the
+            word and the label are from independent
+    mi      the mutual information of the word and the label,
+            in bits
+    count   the number of times the word appears
+    df      the number of emails the word appears in
+
+A vocabulary is saved as a text file,
+
+    # udax vocab 1 <method>
+    <word> <score>
+    ...
+
+best word first, and read back as the list of its words.
+"""
+import math
+import time
+from pathlib import Path
+
+from udax.atomic import atomic_open
+from udax.common import word_counts
+from udax.tablecache import iterate_cache
+from udax.tokenizer import MAX_WORD_LENGTH
+
+
+VOCAB_MAGIC = "# udax vocab 1"
+
+HAM_COUNT = 0
+SPAM_COUNT = 1
+HAM_DF = 2
+SPAM_DF = 3
+
+
+# -------------------------------------
+# Word statistics
+# -------------------------------------
+
+class WordStats:
+    """
+    |words| maps word -> [ham count, spam count, ham df, spam df],
+    over |ham_documents| ham and |spam_documents| spam emails.
+    """
+
+    def __init__(self, words=None, ham_documents=0, spam_documents=0):
+        self.words = words if words is not None else {}
+        self.ham_documents = ham_documents
+        self.spam_documents = spam_documents
+
+    def __len__(self):
+        return len(self.words)
+
+    def _entry(self, word):
+        entry = self.words.get(word)
+        if entry is None:
+            entry = self.words[word] = [0, 0, 0, 0]
+        return entry
+
+    def add(self, word_table, is_spam):
+        """Counts an email in, given its word -> count table."""
+        count_field, df_field = (SPAM_COUNT, SPAM_DF) if is_spam else (HAM_COUNT, HAM_DF)
+        for word, count in word_counts(word_table):
+            entry = self._entry(word)
+            entry[count_field] += count
+            entry[df_field] += 1
+        if is_spam:
+            self.spam_documents += 1
+        else:
+            self.ham_documents += 1
+
+    @staticmethod
+    def from_cache(cache_dir, index_path=None):
+        """
+        Gathers the statistics of an extract.py cache: the counts
+        from its TABLE.spam and TABLE.ham, the document frequencies
+        from the inverted index at |index_path| when it exists.
+        Whatever is missing is counted from the per-email tables.
+        """
+        cache_dir = Path(cache_dir)
+        spam_path = cache_dir.joinpath("TABLE.spam")
+        ham_path = cache_dir.joinpath("TABLE.ham")
+        have_tables = spam_path.exists() and ham_path.exists()
+        have_index = index_path is not None and Path(index_path).exists()
+        if not have_tables or not have_index:
+            stats = WordStats()
+            for doc_id, is_spam, word_table in iterate_cache(cache_dir):
+                stats.add(word_table, is_spam)
+            if stats.ham_documents + stats.spam_documents == 0:
+                raise RuntimeError(f"No word tables in {cache_dir}, run extract.py first")
+            return stats
+
+        stats = WordStats()
+        for path, field in [(ham_path, HAM_COUNT), (spam_path, SPAM_COUNT)]:
+            with path.open(mode="r") as handle:
+                for line in handle:
+                    word, count = line.rsplit(' ', 1)
+                    stats._entry(word)[field] += int(count)
+
+        from udax.invindex import InvertedIndex
+        with InvertedIndex(index_path) as index:
+            stats.ham_documents = index.ham_documents
+            stats.spam_documents = index.spam_documents
+            for word, df, spam_df in index.frequencies():
+                entry = stats._entry(word)
+                entry[HAM_DF] = df - spam_df
+                entry[SPAM_DF] = spam_df
+        return stats
+
+    @staticmethod
+    def from_matrix(matrix, labels, vocab):
+        """
+        Gathers the statistics of the rows of a document-term count
+        |matrix| (see udax.docterm) with the boolean spam |labels|,
+        its columns being the words of the list |vocab|.
+        """
+        import numpy as np
+        from udax.sparse import CsrMatrix, column_sums
+
+        labels = np.asarray(labels, dtype=bool)
+        presence = CsrMatrix(matrix.indptr, matrix.indices, np.ones(len(matrix.data)), matrix.shape)
+        columns = [column_sums(matrix, ~labels), column_sums(matrix, labels),
+                   column_sums(presence, ~labels), column_sums(presence, labels)]
+        columns = [column.astype(np.int64).tolist() for column in columns]
+        words = {}
+        for i, word in enumerate(vocab):
+            entry = [column[i] for column in columns]
+            if entry[HAM_DF] + entry[SPAM_DF] > 0:
+                words[word] = entry
+        spam_documents = int(labels.sum())
+        return WordStats(words, len(labels) - spam_documents, spam_documents)
+
+
+# -------------------------------------
+# Scores
+# -------------------------------------
+
+def _table(entry, ham_documents, spam_documents):
+    """The 2x2 table: (spam with, ham with, spam without, ham without)."""
+    return (entry[SPAM_DF], entry[HAM_DF],
+            spam_documents - entry[SPAM_DF], ham_documents - entry[HAM_DF])
+
+
+def chi_square(entry, ham_documents, spam_documents):
+    a, b, c, d = _table(entry, ham_documents, spam_documents)
+    n = a + b + c + d
+    denominator = (a + b) * (c + d) * (a + c) * (b + d)
+    if denominator == 0:
+        return 0.0
+    return n * (a * d - b * c) ** 2 / denominator
+
+
+def mutual_information(entry, ham_documents, spam_documents):
+    a, b, c, d = _table(entry, ham_documents, spam_documents)
+    n = a + b + c + d
+    if n == 0:
+        return 0.0
+    score = 0.0
+    # (cell, its word marginal, its label marginal)
+    for cell, word_total, label_total in [(a, a + b, a + c), (b, a + b, b + d),
+                                          (c, c + d, a + c), (d, c + d, b + d)]:
+        if cell > 0:
+            score += cell / n * math.log2(n * cell / (word_total * label_total))
+    return score
+
+
+def total_count(entry, ham_documents, spam_documents):
+    return entry[HAM_COUNT] + entry[SPAM_COUNT]
+
+
+def document_frequency(entry, ham_documents, spam_documents):
+    return entry[HAM_DF] + entry[SPAM_DF]
+
+
+METHODS = {"chi2": chi_square, "mi": mutual_information, "count": total_count, "df": document_frequency}
+
+
+def rank_words(stats, method="chi2", min_count=0, min_df=0, max_length=MAX_WORD_LENGTH):
+    """
+    Returns the (word, score) of every word of |stats| appearing at
+    least |min_count| times in at least |min_df| emails, and shorter
+    than |max_length| (None for any length), best score first.
+    """
+    if method not in METHODS:
+        raise RuntimeError(f"Unknown feature selection method {method}, "
+                           f"expected one of {', '.join(METHODS)}")
+    score = METHODS[method]
+    ham_documents = stats.ham_documents
+    spam_documents = stats.spam_documents
+    ranked = []
+    for word, entry in stats.words.items():
+        if max_length is not None and len(word) >= max_length:
+            continue
+        if entry[HAM_COUNT] + entry[SPAM_COUNT] < min_count or entry[HAM_DF] + entry[SPAM_DF] < min_df:
+            continue
+        ranked.append((word, score(entry, ham_documents, spam_documents)))
+    # Ties are broken by word so that a ranking is reproducible.
+    ranked.sort(key=lambda item: (-item[1], item[0]))
+    return ranked
+
+
+# -------------------------------------
+# Vocabulary files
+# -------------------------------------
+
+def save_vocab(ranked, path, method):
+    """Writes the (word, score) of |ranked| to |path|, atomically."""
+    with atomic_open(path, mode="w", encoding="utf-8") as handle:
+        handle.write(f"{VOCAB_MAGIC} {method}\n")
+        for word, score in ranked:
+            handle.write(f"{word} {score!r}\n")
+
+
+def load_vocab(path):
+    """Reads the words of a vocabulary written by save_vocab, best first."""
+    words = []
+    with Path(path).open(mode="r", encoding="utf-8") as handle:
+        if not handle.readline().startswith(VOCAB_MAGIC):
+            raise RuntimeError(f"{path} is not a vocabulary")
+        for line in handle:
+            word, score = line.rsplit(' ', 1)
+            words.append(word)
+    return words
+
+
+# -------------------------------------
+# Evaluation
+# -------------------------------------
+
+def evaluate_sizes(directory, sizes, method="chi2", min_count=0, min_df=0, test_fraction=0.25):
+    """
+    Measures what pruning the vocabulary costs in accuracy, on the
+    document-term matrix of udax.docterm in |directory|: the words
+    are ranked on the training rows only (see DocTermMatrix.split),
+    then for every size of |sizes| (None for every ranked word) a
+    udax.bayes.NaiveBayes is trained on the best words and scored
+    on the held-out rows, the other words being dropped. Sizes past
+    the number of ranked words are cut down to it, and every size
+    is only measured once.
+
+    Returns a list of (size, accuracy, train seconds, test seconds).
+    """
+    import numpy as np
+    from udax.bayes import NaiveBayes
+    from udax.docterm import DocTermMatrix
+    from udax.sparse import keep_columns
+
+    matrix = DocTermMatrix(directory)
+    (train, train_labels), (test, test_labels) = matrix.split(test_fraction)
+    if train.shape[0] == 0 or test.shape[0] == 0:
+        raise RuntimeError(f"Not enough rows in {directory} for a held-out split")
+    ranked = rank_words(WordStats.from_matrix(train, train_labels, matrix.vocab),
+                        method, min_count, min_df)
+    word_ids = matrix.word_ids
+    ranked_ids = np.array([word_ids[word] for word, score in ranked], dtype=np.int64)
+    test_labels = np.asarray(test_labels, dtype=bool)
+
+    counts = []
+    for size in sizes:
+        count = len(ranked) if size is None else min(size, len(ranked))
+        if count not in counts:
+            counts.append(count)
+
+    results = []
+    for count in counts:
+        columns = ranked_ids[:count]
+        begin = time.perf_counter_ns()
+        model = NaiveBayes.train(keep_columns(train, columns), train_labels,
+                                 [matrix.vocab[i] for i in columns])
+        trained = time.perf_counter_ns()
+        predicted = model.predict(keep_columns(test, columns))
+        tested = time.perf_counter_ns()
+        results.append((len(columns), float((predicted == test_labels).mean()),
+                        (trained - begin) / 1e9, (tested - trained) / 1e9))
+    return results
@@ -0,0 +1,183 @@
+"""
+Word tables of fixed size, through the hashing trick: every
+word is hashed into one of a fixed number of buckets and only
+the bucket counts are kept, in a flat array of unsigned 32 bit
+integers. Memory no longer grows with the vocabulary (random
+tokens, base64 junk and URLs of spam included), at the price of
+words sharing the count of their bucket when they collide.
+
+The hash is the CRC-32 of the utf-8 word, stable across runs
+and processes unlike the builtin hash().
+
+A HashedTable can also keep the words with the highest counts
+by name, for inspection. They are counted word by word, not by
+bucket, in a udax.sketch.MisraGries summary of TRACKED_PER_TOP
+* |top| words, so a rare word never borrows the count of a
+frequent one it collides with.
+
+Saved tables are binary, little endian:
+
+    magic       8 bytes     UDAXHSH2
+    buckets     uint64
+    top         uint64      the |top| setting
+    words       uint64      number of words kept by name
+    counts      buckets uint32
+    words       one "<word> <count>" line (utf-8) per word
+"""
+import zlib
+import struct
+from array import array
+from pathlib import Path
+
+from udax.atomic import atomic_open
+from udax.common import check_byteorder, word_counts
+from udax.sketch import MisraGries
+
+
+HASHED_MAGIC = b"UDAXHSH2"
+HEADER = struct.Struct("<8sQQQ")
+
+default_buckets = 1 << 20
+
+# Words counted by name per word reported: the more there are,
+# the closer the counts of the summary get to the true ones.
+TRACKED_PER_TOP = 8
+
+
+def bucket(word, buckets):
+    """The bucket of |word| among |buckets|."""
+    return zlib.crc32(word.encode("utf-8")) % buckets
+
+
+class HashedTable:
+    """
+    A word -> count table over |buckets| buckets, keeping the
+    |top| words with the highest counts by name when |top| > 0.
+    """
+
+    def __init__(self, buckets=default_buckets, top=0):
+        if buckets <= 0:
+            raise RuntimeError(f"A hashed table needs at least one bucket, not {buckets}")
+        self.buckets = buckets
+        self.counts = array('I', bytes(4 * buckets))
+        self.top = top
+        self._top_words = MisraGries(TRACKED_PER_TOP * top) if top > 0 else None
+
+    @staticmethod
+    def from_word_table(word_table, buckets=default_buckets, top=0):
+        """
+        Hashes a word table, word -> count or word -> (count,
+        relative-freq) as in HttpEmail.
+        """
+        table = HashedTable(buckets, top)
+        table.add_table(word_table)
+        return table
+
+    def __getitem__(self, word):
+        """The count of |word|, that of every word in its bucket."""
+        return self.counts[bucket(word, self.buckets)]
+
+    def __len__(self):
+        """The number of buckets in use."""
+        return self.buckets - self.counts.count(0)
+
+    def total(self):
+        return sum(self.counts)
+
+    def add(self, word, count=1):
+        b = bucket(word, self.buckets)
+        self.counts[b] += count
+        if self._top_words is not None:
+            self._top_words.update({word: count})
+
+    def remove(self, word, count=1):
+        b = bucket(word, self.buckets)
+        if self.counts[b] < count:
+            raise RuntimeError(f"Cannot remove {count} of '{word}' from a hashed table")
+        self.counts[b] -= count
+        if self._top_words is not None:
+            kept = self._top_words.counts
+            if word in kept:
+                if kept[word] > count:
+                    kept[word] -= count
+                else:
+                    del kept[word]
+
+    def add_table(self, word_table):
+        """Adds a word -> count or word -> (count, relative-freq) table."""
+        buckets = self.buckets
+        counts = self.counts
+        track = self._top_words is not None
+        batch = {}
+        for word, count in word_counts(word_table):
+            b = zlib.crc32(word.encode("utf-8")) % buckets
+            counts[b] += count
+            if track:
+                batch[word] = batch.get(word, 0) + count
+        if track:
+            self._top_words.update(batch)
+
+    def remove_table(self, word_table):
+        for word, count in word_counts(word_table):
+            self.remove(word, count)
+
+    def merge(self, other):
+        """Adds the counts (and top words) of another HashedTable of the same size."""
+        if other.buckets != self.buckets:
+            raise RuntimeError(f"Cannot merge a table of {other.buckets} buckets into one of {self.buckets}")
+        counts = self.counts
+        for b, count in enumerate(other.counts):
+            if count > 0:
+                counts[b] += count
+        if self._top_words is not None and other._top_words is not None:
+            # Misra-Gries summaries merge by adding one into the other.
+            self._top_words.update(other._top_words.counts)
+            self._top_words.error += other._top_words.error
+
+    def top_words(self, n=None):
+        """
+        Returns up to |n| (by default |top|) of the words kept by
+        name as (word, count) pairs, highest count first. Counts
+        are those of the words themselves, whatever their bucket
+        holds; they may fall short of the true counts by at most
+        the |error| of the MisraGries summary, never exceed them.
+        """
+        if self._top_words is None:
+            return []
+        n = self.top if n is None else n
+        words = list(self._top_words.counts.items())
+        words.sort(key=lambda item: (-item[1], item[0]))
+        return [(word, count) for word, count in words[:n] if count > 0]
+
+    def nonzero(self):
+        """Returns the (bucket, count) pairs of the buckets in use, e.g. as sparse features."""
+        return [(b, count) for b, count in enumerate(self.counts) if count > 0]
+
+    def save(self, path):
+        check_byteorder("hashed tables")
+        words = self.top_words()
+        with atomic_open(path, mode="wb") as handle:
+            handle.write(HEADER.pack(HASHED_MAGIC, self.buckets, self.top, len(words)))
+            handle.write(self.counts.tobytes())
+            for word, count in words:
+                handle.write(f"{word} {count}\n".encode("utf-8"))
+
+    @staticmethod
+    def load(path):
+        check_byteorder("hashed tables")
+        with Path(path).open(mode="rb") as handle:
+            header = handle.read(HEADER.size)
+            if len(header) != HEADER.size or header[:len(HASHED_MAGIC)] != HASHED_MAGIC:
+                raise RuntimeError(f"{path} is not a hashed table")
+            magic, buckets, top, word_count = HEADER.unpack(header)
+            table = HashedTable(buckets, top)
+            table.counts = array('I')
+            table.counts.frombytes(handle.read(4 * buckets))
+            if len(table.counts) != buckets:
+                raise RuntimeError(f"{path} is truncated")
+            lines = handle.read().decode("utf-8").split("\n")[:word_count]
+        if table._top_words is not None:
+            for line in lines:
+                word, count = line.rsplit(' ', 1)
+                table._top_words.counts[word] = int(count)
+        return table
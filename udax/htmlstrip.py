@@ -0,0 +1,167 @@
+"""
+A fast replacement for running text through HTMLParser only
+to collect what it hands to handle_data.
+
+strip_html finds the markup with str.find and a handful of
+precompiled patterns instead of parsing every tag and its
+attributes in python, and returns the same data chunks the
+parser would have: the text between the markup, with the
+character references unescaped, and the raw contents of
+<script> and <style>. Comments, declarations, processing
+instructions and tags are dropped.
+
+Markup that is never closed follows what the parser does once
+it is closed: it keeps the markup as data up to the next '>'.
+Over malformed markup the chunks may be split differently, at a
+'<' or after a '>', but their text is the same. The patterns
+follow the HTMLParser of Python 3.11; bench.htmlstrip compares
+both over a corpus and a fuzz set of broken markup, and the
+HTMLParser engine of HttpEmail remains available for those who
+need its exact output.
+"""
+import re
+from html import unescape
+
+
+_CDATA_ELEMENTS = ("script", "style")
+_CDATA_END = {name: re.compile(r"</\s*%s\s*>" % name, re.I) for name in _CDATA_ELEMENTS}
+
+_COMMENT_CLOSE = re.compile(r"--\s*>")
+# <![name ... ]]> marked sections, or <![if ...]> and the like
+# of MS Office.
+_SECTION_NAME = re.compile(r"[a-zA-Z][-_.a-zA-Z0-9]*\s*")
+_SECTION_CLOSE = re.compile(r"]\s*]\s*>")
+_MS_SECTION_CLOSE = re.compile(r"]\s*>")
+_SECTIONS = {"temp", "cdata", "ignore", "include", "rcdata"}
+_MS_SECTIONS = {"if", "else", "endif"}
+# How far HTMLParser takes a start tag to run: its name, then
+# attributes with quoted or bare values.
+_START_TAG = re.compile(r"""
+  <[a-zA-Z][^\t\n\r\f />\x00]*
+  (?:[\s/]*
+    (?:(?<=['"\s/])[^\s/>][^\s/=>]*
+      (?:\s*=+\s*
+        (?:'[^']*'
+          |"[^"]*"
+          |(?!['"])[^>\s]*
+         )
+        \s*
+       )?(?:\s|/(?!>))*
+     )*
+   )?
+  \s*
+""", re.VERBOSE)
+_TAG_NAME = re.compile(r"[^\t\n\r\f />\x00]*")
+
+
+def _start_tag_end(text, i):
+    """
+    Returns (end, is_tag) for the start tag opening at |i|: the end
+    (past the '>') of the tag, or, when something other than an
+    attribute stops it short of a '>', the end of what HTMLParser
+    then keeps as raw data instead. |end| is -1 when the tag is never
+    closed, e.g. at the end of the text or in a quoted value.
+    """
+    j = _START_TAG.match(text, i).end()
+    following = text[j:j + 1]
+    if following == ">":
+        return (j + 1, True)
+    if following == "/":
+        return (j + 2, True) if text.startswith("/>", j) else (-1, True)
+    if following == "" or following == "=" or (following.isascii() and following.isalpha()):
+        return (-1, True)
+    return (j, False)
+
+
+def _marked_section_end(text, i):
+    """
+    The end of the marked section opening at |i|, or -1 when it is
+    never closed. HTMLParser gives up on unknown sections with an
+    error; they are taken as bogus comments here.
+    """
+    m = _SECTION_NAME.match(text, i + 3)
+    if m is not None and m.end() == len(text):
+        return -1
+    name = m.group().strip().lower() if m is not None else None
+    if name in _SECTIONS:
+        close = _SECTION_CLOSE.search(text, i + 3)
+    elif name in _MS_SECTIONS:
+        close = _MS_SECTION_CLOSE.search(text, i + 3)
+    else:
+        return text.find(">", i + 2) + 1 or -1
+    return close.end() if close is not None else -1
+
+
+def _emit(chunks, data):
+    if len(data) > 0:
+        chunks.append(unescape(data) if "&" in data else data)
+
+
+def strip_html(text):
+    """
+    Returns the list of data chunks HTMLParser would hand to
+    handle_data for |text| (fed and closed in one go).
+    """
+    chunks = []
+    n = len(text)
+    i = 0           # start of the pending data
+    search = 0      # where to look for the next '<'
+    while True:
+        j = text.find("<", search)
+        if j == -1 or j + 1 >= n:
+            break
+
+        c = text[j + 1]
+        end = -1
+        markup = True
+        cdata = None
+        if c.isascii() and c.isalpha():
+            end, is_tag = _start_tag_end(text, j)
+            if end != -1 and not is_tag:
+                # Kept as is, references and all.
+                _emit(chunks, text[i:j])
+                chunks.append(text[j:end])
+                i = search = end
+                continue
+            if end != -1 and text[end - 2] != "/":
+                name = _TAG_NAME.match(text, j + 1).group().lower()
+                if name in _CDATA_ELEMENTS:
+                    cdata = name
+        elif c == "/":
+            end = text.find(">", j + 2) + 1 or -1
+        elif text.startswith("<!--", j):
+            m = _COMMENT_CLOSE.search(text, j + 4)
+            end = m.end() if m is not None else -1
+        elif text.startswith("<![", j):
+            end = _marked_section_end(text, j)
+        elif c == "!" or c == "?":
+            end = text.find(">", j + 2) + 1 or -1
+        else:
+            markup = False
+
+        if end == -1:
+            if markup:
+                # Once closed, the parser gives up on markup that never
+                # ends and keeps it as data up to the next '>' (markup
+                # within included), then carries on after it.
+                k = text.find(">", j + 1)
+                search = k + 1 if k != -1 else j + 1
+            else:
+                # Not markup, a '<' of the text.
+                search = j + 1
+            continue
+
+        _emit(chunks, text[i:j])
+        i = search = end
+        if cdata is not None:
+            m = _CDATA_END[cdata].search(text, end)
+            if m is None:
+                # The parser waits for the end tag until it
+                # is closed, then drops what it was holding.
+                return chunks
+            if m.start() > end:
+                chunks.append(text[end:m.start()])
+            i = search = m.end()
+
+    _emit(chunks, text[i:])
+    return chunks
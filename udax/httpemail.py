@@ -3,44 +3,23 @@ A specialized module to handle reading emails
 in the form of HTTP responses.
 """
 import sys
+import time
 from pathlib import Path
 from collections import Counter
 from html.parser import HTMLParser
-import string
-import re
 
-
-STR_EXTRANEOUS = string.punctuation + string.digits + "\t\r\n"
-
-
-def surjective_map(subject, domain, target):
-    """
-    Maps all characters in the |domain| string to
-    a single character |target|, hence a surjective
-    mapping, of the |subject| string.
-
-    ex. subject = '{a,b,c}!'
-        domain = string.punctuation
-        target = '.'
-
-        returns '.a.b.c..'
-
-    I couldn't find anything in the python standard
-    library that does exactly this, but I may be missing
-    something ¯\_(ツ)_/¯ (btw regex is about 4x slower)
-    """
-    buf = list(subject)
-    for i, c in enumerate(buf):
-        if c in domain:
-            buf[i] = target
-    return ''.join(buf)
+from udax.tokenizer import default_tokenizer, translate_tokenize, translate_tokenize_bytes
+from udax.mime import scan_message, is_blank
+from udax.htmlstrip import strip_html
+from udax.hashing import HashedTable, default_buckets
 
 
 class ConcatParser(HTMLParser):
     
-    def __init__ (self, stopwords=[], errcb=None):
+    def __init__ (self, stopwords=[], errcb=None, tokenizer=None):
         super(ConcatParser, self).__init__()
         self.errcb = errcb
+        self.tokenizer = tokenizer or default_tokenizer
         self.words = []
         self.parts = []
         
@@ -51,7 +30,7 @@ class ConcatParser(HTMLParser):
         pass
     
     def handle_data(self, data):
-        words = surjective_map(data.lower(), STR_EXTRANEOUS, ' ').split()
+        words = self.tokenizer(data)
         self.words.extend(words)
         self.parts.append(data)
         
@@ -64,23 +43,201 @@ class ConcatParser(HTMLParser):
         return ' '.join(self.parts)
 
 
+class CountingParser(ConcatParser):
+    """A ConcatParser that only keeps the word counts of the data."""
+
+    def __init__(self, errcb=None, tokenizer=None):
+        super(CountingParser, self).__init__(errcb=errcb, tokenizer=tokenizer)
+        self.counts = Counter()
+        self.update = self.counts.update
+
+    def handle_data(self, data):
+        self.update(self.tokenizer(data))
+
+
+# How the body of an email is turned into text:
+#
+#   fast        text/plain parts are tokenized as they are,
+#               every other part goes through udax.htmlstrip
+#   htmlparser  every part goes through ConcatParser, an
+#               html.parser.HTMLParser
+ENGINES = ("fast", "htmlparser")
+default_engine = "fast"
+
+
+def _content_type(line):
+    """The lowercase media type of a Content-Type header line."""
+    value = line[13:].decode("latin-1")
+    return value.split(";", 1)[0].strip().lower()
+
+
+def _check_engine(engine):
+    if engine not in ENGINES:
+        raise RuntimeError(f"Unknown engine {engine}, expected one of {', '.join(ENGINES)}")
+
+
+def _timed(fn, timings, stage):
+    """Wraps |fn| to add the time spent in it to timings[stage]."""
+    def timed_fn(data):
+        t_begin = time.perf_counter_ns()
+        result = fn(data)
+        timings[stage] += time.perf_counter_ns() - t_begin
+        return result
+    return timed_fn
+
+
+def _bytes_tokenizer(tokenizer):
+    """A tokenizer of latin-1 bytes giving the same words as |tokenizer|."""
+    if tokenizer is translate_tokenize:
+        return translate_tokenize_bytes
+    return lambda payload: tokenizer(payload.decode("latin-1"))
+
+
+def _read_buffer(path, buffer, timings):
+    """Returns the scan of the email, filling in the read and scan timings."""
+    t_begin = time.perf_counter_ns()
+    if buffer is None:
+        with path.open(mode="rb") as handle:
+            buffer = handle.read()
+    t_read = time.perf_counter_ns()
+    scan = scan_message(buffer)
+    if timings is not None:
+        timings["read"] = t_read - t_begin
+        timings["scan"] = time.perf_counter_ns() - t_read
+    return (scan, len(buffer))
+
+
+def _typed_parts(scan):
+    """
+    Returns the (content type, payload bytes) of every part of a
+    scanned email, the same parts _feed_parts hands the parser.
+    """
+    parts = []
+    split_indices = scan.split_indices
+    if len(split_indices) > 2:
+        for i in range(len(split_indices) - 1):
+            x = split_indices[i]
+            y = split_indices[i + 1]
+            content_type = ""
+            j = x + 1
+            while j < y:
+                line = scan.line(j)
+                j += 1
+                if is_blank(line):
+                    break
+                if content_type == "" and line[:13].lower() == b"content-type:":
+                    content_type = _content_type(line)
+            parts.append((content_type, scan.join(j, y)))
+    else:
+        parts.append((scan.content_type.strip().lower(), scan.join(split_indices[0], split_indices[1])))
+    return parts
+
+
+def _feed_parts(parser, scan):
+    """Feeds every part of a scanned email through |parser|."""
+    split_indices = scan.split_indices
+    charset = "latin-1"
+
+    if len(split_indices) > 2:
+        # If there is more than one email in the single
+        # file, we must get rid of the top HTTP headers
+        # once more.
+        for i in range(len(split_indices) - 1):
+            x = split_indices[i]
+            y = split_indices[i + 1]
+            j = x + 1
+            while j < y:
+                blank = scan.is_blank(j)
+                j += 1
+                if blank:
+                    break
+            parser.feed(scan.join(j, y).decode(charset))
+        parser.close()
+    else:
+        try:
+            begin = split_indices[0]
+            end = split_indices[1]
+            parser.feed(scan.join(begin, end).decode(charset))
+            parser.close()
+        except:
+            # NOTE(max): do we even need this anymore?
+            pass
+
+
+def _parse_scan(scan, engine, parser, tokenize_bytes):
+    """
+    Returns the (words, body) of a scanned email with |engine|.
+    The htmlparser engine runs every part through |parser|, a
+    ConcatParser. The fast engine takes the same parts, tokenizing
+    text/plain ones directly with |tokenize_bytes| and stripping
+    the others with udax.htmlstrip before the parser's tokenizer.
+    """
+    if engine != "fast":
+        _feed_parts(parser, scan)
+        return (parser.words, parser.current_email)
+
+    words = []
+    chunks = []
+    for content_type, payload in _typed_parts(scan):
+        if content_type == "text/plain":
+            if len(payload) > 0:
+                words.extend(tokenize_bytes(payload))
+                chunks.append(payload.decode("latin-1"))
+        else:
+            data = strip_html(payload.decode("latin-1"))
+            if len(data) > 0:
+                words.extend(parser.tokenizer(" ".join(data)))
+                chunks.extend(data)
+    return (words, " ".join(chunks))
+
+
 class HttpEmail:
 
-    def __init__(self, path, stopwords=[], errcb=None):
+    def __init__(self, path, stopwords=[], errcb=None, tokenizer=None, buffer=None,
+                 instrument=False, engine=default_engine):
+        """
+        Reads the email at |path|, or when |buffer| is given, the
+        email held in it (e.g. a slice of a udax.corpus pack), in
+        which case |path| only names it. |engine| is one of ENGINES.
+
+        With |instrument|, the time spent in every stage of reading
+        the email is recorded in |timings| (stage -> ns, see
+        udax.instrument.STAGES) and its size in bytes in |size|.
+        """
+        _check_engine(engine)
         self.path = Path(path)
-        self.parser = ConcatParser(errcb)
+        self.engine = engine
+        self.parser = ConcatParser(errcb, tokenizer=tokenizer)
+        self.tokenize_bytes = _bytes_tokenizer(self.parser.tokenizer)
         self.body = None
         self.words = None           # standalone list of words
         self.stopwords = stopwords
         self.word_table = {}        # map <word> -> (<count>, <relative-freq>) 
+        self.size = None
+        self.timings = None
+
+        if instrument:
+            self.timings = {"read": 0, "scan": 0, "parse": 0, "tokenize": 0, "count": 0}
+            self._instrument_tokenizer()
 
-        self._load_email()
+        self._load_email(buffer)
+        t_begin = time.perf_counter_ns()
         self._gen_word_frequencies()
+        if self.timings is not None:
+            self.timings["count"] = time.perf_counter_ns() - t_begin
 
     def print_word_table(self, fd=sys.stdout): 
         for word, statistic in self.word_table.items():
             fd.write(f"{word} {statistic[0]} {statistic[1]}\n")
 
+    def hashed_table(self, buckets=default_buckets, top=0):
+        """Returns the word table hashed into a udax.hashing.HashedTable."""
+        return HashedTable.from_word_table(self.word_table, buckets, top)
+
+    def _instrument_tokenizer(self):
+        self.parser.tokenizer = _timed(self.parser.tokenizer, self.timings, "tokenize")
+        self.tokenize_bytes = _timed(self.tokenize_bytes, self.timings, "tokenize")
+
     def _gen_word_frequencies(self):
         total_words = len(self.words)
         if total_words == 0:
@@ -90,84 +247,118 @@ class HttpEmail:
             relative_freq = count / total_words
             self.word_table[word] = (count, relative_freq)
 
-    def _load_email(self):
-        encoded_message = []
-        with self.path.open(mode="rb") as handle:
-            encoded_message = self._filter_message_headers(handle.readlines())
-
-        sender,       \
-        content_type, \
-        boundary,     \
-        split_indices = self._extract_metadata(encoded_message)
-        charset = "latin-1"
-
-        if len(split_indices) > 2:
-            # If there is more than one email in the single
-            # file, we must get rid of the top HTTP headers
-            # once more.
-            for i in range(len(split_indices) - 1):
-                x = split_indices[i]
-                y = split_indices[i + 1]
-                j = x + 1
-                while j < y:
-                    line = encoded_message[j].decode(charset).strip()
-                    j += 1
-                    if len(line) == 0:
-                        break
-                lineset = encoded_message[j:y]
-                self.parser.feed(b"".join(lineset).decode(charset))
-            self.parser.close()
+    def _load_email(self, buffer=None):
+        timings = self.timings
+        scan, self.size = _read_buffer(self.path, buffer, timings)
+        t_scan = time.perf_counter_ns()
+
+        self.words, self.body = _parse_scan(scan, self.engine, self.parser, self.tokenize_bytes)
+
+        if timings is not None:
+            timings["parse"] = time.perf_counter_ns() - t_scan - timings["tokenize"]
+
+
+class EmailCounts:
+    """
+    The lean, counts only counterpart of HttpEmail, for when all
+    that is needed of an email is how often each word appears
+    (extract.py, the table caches, the classifier).
+
+    Every part is tokenized straight into |counts|, word -> count
+    in the order the words first appear, as in HttpEmail.word_table,
+    without the body text, the list of words or the relative
+    frequencies ever being held. Those are derived on access
+    instead: word_table from the counts, body and words by reading
+    the email once more with HttpEmail.
+    """
+
+    __slots__ = ("path", "engine", "counts", "total", "size", "timings",
+                 "_errcb", "_tokenizer", "_buffer")
+
+    def __init__(self, path, errcb=None, tokenizer=None, buffer=None,
+                 instrument=False, engine=default_engine):
+        """
+        Same arguments as HttpEmail. A |buffer| is kept so that the
+        body and words can be read from it again.
+        """
+        _check_engine(engine)
+        self.path = Path(path)
+        self.engine = engine
+        self.size = None
+        self.timings = None
+        self._errcb = errcb
+        self._tokenizer = tokenizer
+        self._buffer = buffer
+
+        timings = None
+        if instrument:
+            timings = {"read": 0, "scan": 0, "parse": 0, "tokenize": 0, "count": 0}
+            self.timings = timings
+        scan, self.size = _read_buffer(self.path, buffer, timings)
+        t_scan = time.perf_counter_ns()
+
+        tokenizer = tokenizer or default_tokenizer
+        if engine == "fast":
+            counts = Counter()
+            update = counts.update
+            tokenize_bytes = _bytes_tokenizer(tokenizer)
+            if timings is not None:
+                update = _timed(update, timings, "count")
+                tokenizer = _timed(tokenizer, timings, "tokenize")
+                tokenize_bytes = _timed(tokenize_bytes, timings, "tokenize")
+            for content_type, payload in _typed_parts(scan):
+                if content_type == "text/plain":
+                    update(tokenize_bytes(payload))
+                else:
+                    data = strip_html(payload.decode("latin-1"))
+                    if len(data) > 0:
+                        update(tokenizer(" ".join(data)))
         else:
-            try:
-                begin = split_indices[0]
-                end = split_indices[1]
-                lineset = encoded_message[begin:end]
-                self.parser.feed(b"".join(lineset).decode(charset))
-                self.parser.close()
-            except:
-                # NOTE(max): do we even need this anymore?
-                pass
-        self.words = self.parser.words
-        self.body = self.parser.current_email
-
-    def _filter_message_headers(self, encoded_message):
-        new_encoded_message = []
-        i = 0
-        while i < len(encoded_message):
-            sline = encoded_message[i].decode("latin-1")
-            if "-----Original Message-----" in sline:
-                while i < len(encoded_message) and len(encoded_message[i].decode("latin-1").strip()) != 0:
-                    i += 1
-            if i < len(encoded_message):
-                new_encoded_message.append(encoded_message[i])
-            i += 1
-        return new_encoded_message
-            
-    def _extract_metadata(self, encoded_message):
-        sender = ""
-        content_type = ""
-        boundary = None
-        body_index = None
-        
-        # [0] = body start
-        # [-1] = file end
-        split_indices = []
-        
-        for i, line in enumerate(encoded_message):
-            sline = line.decode('latin-1')
-            if str.encode("From: ") in line:
-                sender = sline[6:].strip()
-            if content_type == '' and str.encode("Content-Type: ") in line:
-                content_type = sline[14:sline.find(';')]
-            if 'boundary' in sline and sline.find('=') != -1:
-                boundary = sline[sline.find('=')+1:][1:-2]
-                continue
-            if boundary and boundary in sline:
-                split_indices.append(i)
-            if not body_index and sline.strip() == "":
-                body_index = i
-        if len(split_indices) == 0:
-            split_indices.append(body_index)
-        split_indices.append(len(encoded_message)-1)
-        return (sender, content_type, boundary, split_indices)
+            parser = CountingParser(errcb, tokenizer=tokenizer)
+            if timings is not None:
+                parser.update = _timed(parser.update, timings, "count")
+                parser.tokenizer = _timed(parser.tokenizer, timings, "tokenize")
+            _feed_parts(parser, scan)
+            counts = parser.counts
+
+        self.counts = counts
+        self.total = sum(counts.values())
+        if timings is not None:
+            timings["parse"] = time.perf_counter_ns() - t_scan - timings["tokenize"] - timings["count"]
+
+    @property
+    def word_table(self):
+        """word -> (count, relative-freq) as in HttpEmail, built on every access."""
+        total = self.total
+        return {word: (count, count / total) for word, count in self.counts.items()}
+
+    @property
+    def words(self):
+        """The list of words, read anew on every access."""
+        return self._reread().words
+
+    @property
+    def body(self):
+        """The body text, read anew on every access."""
+        return self._reread().body
+
+    def _reread(self):
+        return HttpEmail(self.path, errcb=self._errcb, tokenizer=self._tokenizer,
+                         buffer=self._buffer, engine=self.engine)
+
+    def prune(self, vocab):
+        """
+        Drops the counts of the words outside |vocab| (a set). The
+        total stays that of the whole email, so the relative
+        frequencies of the words kept do not change.
+        """
+        self.counts = {word: count for word, count in self.counts.items() if word in vocab}
+
+    def print_word_table(self, fd=sys.stdout):
+        """Writes the same lines as HttpEmail.print_word_table."""
+        total = self.total
+        fd.write("".join([f"{word} {count} {count / total}\n" for word, count in self.counts.items()]))
 
+    def hashed_table(self, buckets=default_buckets, top=0):
+        """Returns the counts hashed into a udax.hashing.HashedTable."""
+        return HashedTable.from_word_table(self.counts, buckets, top)
@@ -0,0 +1,242 @@
+"""
+Opt-in instrumentation of the extraction pipeline.
+
+HttpEmail(..., instrument=True) records how long each stage
+of reading an email took (see STAGES) along with its size
+in bytes and number of tokens. ExtractStats aggregates those
+over a run into fixed size histograms, from which percentiles
+are read, and keeps the slowest targets for a closer look,
+e.g. with profile_targets.
+
+Progress is the throttled replacement of printing a line per
+target, for when nobody is watching every single one.
+"""
+import sys
+import time
+import heapq
+import cProfile
+import pstats
+
+
+# The stages of HttpEmail, in order.
+#
+#   read        reading the file (nothing when given a buffer)
+#   scan        udax.mime.scan_message, finding the headers,
+#               the metadata and the part boundaries
+#   parse       HTMLParser.feed or udax.htmlstrip, depending
+#               on the engine, less the tokenizer
+#   tokenize    the tokenizer called by the parser
+#   count       Counter over the words, the word table
+STAGES = ["read", "scan", "parse", "tokenize", "count"]
+
+
+class Histogram:
+    """
+    A log-linear histogram of non negative integers (e.g. ns):
+    every power of two is split into 16 buckets, so a value is
+    known to within 1/16th whatever its magnitude, in a fixed
+    amount of memory.
+    """
+
+    SUB_BITS = 4
+    SUB_BUCKETS = 1 << SUB_BITS
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def _bucket(self, value):
+        if value < self.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - self.SUB_BITS - 1
+        return self.SUB_BUCKETS * (shift + 1) + (value >> shift) - self.SUB_BUCKETS
+
+    def _bounds(self, bucket):
+        if bucket < self.SUB_BUCKETS:
+            return (bucket, bucket + 1)
+        shift = bucket // self.SUB_BUCKETS - 1
+        low = (bucket % self.SUB_BUCKETS + self.SUB_BUCKETS) << shift
+        return (low, low + (1 << shift))
+
+    def add(self, value):
+        b = self._bucket(value)
+        self.counts[b] = self.counts.get(b, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def mean(self):
+        return self.total / self.count if self.count > 0 else 0
+
+    def percentile(self, p):
+        """The value at percentile |p| (0-100), as the middle of its bucket."""
+        if self.count == 0:
+            return 0
+        rank = p / 100 * self.count
+        seen = 0
+        for b in sorted(self.counts):
+            seen += self.counts[b]
+            if seen >= rank:
+                low, high = self._bounds(b)
+                return min((low + high - 1) / 2, self.max)
+        return self.max
+
+    def buckets(self, per_power=1):
+        """
+        Yields (low, high, count) for the non empty ranges of the
+        histogram, coarsened to |per_power| ranges per power of two.
+        """
+        step = self.SUB_BUCKETS // per_power
+        merged = {}
+        for b, count in self.counts.items():
+            key = b if b < self.SUB_BUCKETS else b - (b % step)
+            merged[key] = merged.get(key, 0) + count
+        for key in sorted(merged):
+            low, high = self._bounds(key)
+            if key >= self.SUB_BUCKETS:
+                high = low + (high - low) * step
+            yield (low, high, merged[key])
+
+
+def _format_ns(ns):
+    if ns >= 1e9:
+        return "%.2fs" % (ns / 1e9)
+    if ns >= 1e6:
+        return "%.2fms" % (ns / 1e6)
+    return "%.1fus" % (ns / 1e3)
+
+
+class ExtractStats:
+    """Aggregates the per-target instrumentation of a run."""
+
+    def __init__(self, slowest=10):
+        self.slowest = slowest
+        self.histograms = {stage: Histogram() for stage in ["total"] + STAGES}
+        self.targets = 0
+        self.bytes = 0
+        self.tokens = 0
+        self._slowest = []          # heap of (elapsed, name)
+        self.begin = time.monotonic_ns()
+
+    def add(self, name, elapsed, timings, size, tokens):
+        """
+        Records a target, the time it took overall (|elapsed| ns)
+        and per stage (|timings|, stage -> ns), its |size| in bytes
+        and its number of |tokens|.
+        """
+        self.targets += 1
+        self.bytes += size
+        self.tokens += tokens
+        self.histograms["total"].add(elapsed)
+        for stage, ns in timings.items():
+            self.histograms[stage].add(ns)
+
+        if len(self._slowest) < self.slowest:
+            heapq.heappush(self._slowest, (elapsed, name))
+        elif self.slowest > 0 and elapsed > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, (elapsed, name))
+
+    def slowest_targets(self):
+        """The (elapsed, name) of the slowest targets, slowest first."""
+        return sorted(self._slowest, reverse=True)
+
+    def report(self, fd=sys.stdout):
+        wall = (time.monotonic_ns() - self.begin) / 1e9
+        fd.write("Extracted %d targets, %.1f MB, %d tokens in %.2fs: %.1f targets/s, %.2f MB/s\n" % \
+                 (self.targets,                                                                   \
+                  self.bytes / 1e6,                                                               \
+                  self.tokens,                                                                    \
+                  wall,                                                                           \
+                  self.targets / wall if wall > 0 else 0,                                         \
+                  self.bytes / 1e6 / wall if wall > 0 else 0))
+
+        fd.write("%-10s %10s %10s %10s %10s %10s %10s %7s\n" % \
+                 ("stage", "mean", "p50", "p90", "p99", "max", "sum", "share"))
+        total = self.histograms["total"].total
+        for stage, histogram in self.histograms.items():
+            if histogram.count == 0:
+                continue
+            fd.write("%-10s %10s %10s %10s %10s %10s %10s %6.1f%%\n" % \
+                     (stage,                                          \
+                      _format_ns(histogram.mean()),                   \
+                      _format_ns(histogram.percentile(50)),           \
+                      _format_ns(histogram.percentile(90)),           \
+                      _format_ns(histogram.percentile(99)),           \
+                      _format_ns(histogram.max),                      \
+                      _format_ns(histogram.total),                    \
+                      100 * histogram.total / total if total > 0 else 0))
+
+        histogram = self.histograms["total"]
+        if histogram.count > 0:
+            fd.write("Time per target:\n")
+            peak = max(count for low, high, count in histogram.buckets())
+            for low, high, count in histogram.buckets():
+                fd.write("  %10s - %-10s %8d %s\n" % \
+                         (_format_ns(low), _format_ns(high), count, "#" * max(1, 40 * count // peak)))
+
+        if len(self._slowest) > 0:
+            fd.write(f"Slowest {len(self._slowest)} targets:\n")
+            for elapsed, name in self.slowest_targets():
+                fd.write(f"  {_format_ns(elapsed):>10} {name}\n")
+
+
+def profile_targets(fn, targets, fd=sys.stdout, limit=25, path=None):
+    """
+    Runs fn(target) for every target under cProfile, prints the
+    |limit| most expensive functions by cumulative time and, with
+    |path|, dumps the raw stats there (for pstats, snakeviz, ...).
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    for target in targets:
+        fn(target)
+    profiler.disable()
+    if path is not None:
+        profiler.dump_stats(str(path))
+    stats = pstats.Stats(profiler, stream=fd)
+    stats.sort_stats("cumulative").print_stats(limit)
+
+
+class Progress:
+    """
+    A progress line printed at most every |interval| seconds, in
+    place when stdout is a terminal.
+    """
+
+    def __init__(self, total, interval=1.0, fd=sys.stdout):
+        self.total = total
+        self.interval = interval
+        self.fd = fd
+        self.tty = fd.isatty()
+        self.begin = time.monotonic()
+        self.last = self.begin
+        self.printed = False
+
+    def update(self, count, force=False):
+        now = time.monotonic()
+        if not force and now - self.last < self.interval:
+            return
+        self.last = now
+        elapsed = now - self.begin
+        rate = count / elapsed if elapsed > 0 else 0
+        eta = (self.total - count) / rate if rate > 0 else 0
+        line = "%d/%d targets (%.1f%%), %.1f targets/s, eta %dm %ds" % \
+               (count,                                                 \
+                self.total,                                            \
+                100 * count / self.total if self.total > 0 else 100,   \
+                rate,                                                  \
+                eta // 60,                                             \
+                eta % 60)
+        if self.tty:
+            self.fd.write(f"\r{line}\x1b[K")
+        else:
+            self.fd.write(f"{line}\n")
+        self.fd.flush()
+        self.printed = True
+
+    def finish(self, count):
+        self.update(count, force=True)
+        if self.tty:
+            self.fd.write("\n")
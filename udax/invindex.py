@@ -0,0 +1,311 @@
+"""
+An on-disk inverted index of the extracted emails: for every
+word, the sorted numeric ids of the emails it appears in and
+how many times, so that "which emails say both |a| and |b|"
+or "in how many spam emails does |a| appear" is answered by
+reading a few posting lists instead of every email.
+
+The file is laid out as follows, all little endian and every
+section 8 byte aligned:
+
+    magic           8 bytes     UDAXINV1
+    word_count      uint64      V
+    documents       uint64      the number of emails
+    spam_documents  uint64      how many of them are spam
+    id_total        uint64      one past the largest numeric id
+    postings_start  uint64      where the posting lists start
+    offsets         V + 1 uint64, where every word starts in
+                    the word blob, the last one being its size
+    entries         V * 4 uint64, for every word the offset and
+                    byte size of its posting list, its document
+                    frequency and its spam document frequency
+    labels          id_total bytes, 0 for ham, 1 for spam and
+                    ABSENT for ids not in the index
+    words           the words, utf-8, sorted bytewise and not
+                    separated
+    postings        for every word in turn, its (id gap, count)
+                    pairs as LEB128 varints; the first gap is
+                    the first id itself
+
+Words are looked up by binary search over the sorted blob, as
+in udax.model, and only the posting lists a query asks for are
+read (and paged in) from the memory mapped file. Only the
+standard library is used here.
+"""
+import mmap
+import heapq
+import struct
+from array import array
+from pathlib import Path
+from itertools import accumulate
+
+from udax.atomic import atomic_open
+from udax.common import check_byteorder, word_counts
+
+
+INDEX_MAGIC = b"UDAXINV1"
+HEADER = struct.Struct("<8s5Q")
+ENTRY_WIDTH = 4
+
+HAM = 0
+SPAM = 1
+ABSENT = 255
+
+
+def _padding(size):
+    return b"\0" * (-size % 8)
+
+
+def _encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varints(data):
+    numbers = []
+    value = 0
+    shift = 0
+    for byte in data:
+        if byte & 0x80:
+            value |= (byte & 0x7f) << shift
+            shift += 7
+        else:
+            numbers.append(value | (byte << shift))
+            value = 0
+            shift = 0
+    return numbers
+
+
+# -------------------------------------
+# Building
+# -------------------------------------
+
+def build_index(documents, path):
+    """
+    Writes the inverted index of |documents|, an iterable of
+    (doc_id, is_spam, word -> count) in increasing doc_id order
+    (see udax.tablecache.iterate_cache), to |path|, atomically.
+    Returns (words, documents).
+    """
+    check_byteorder("the inverted index")
+    postings = {}       # word -> bytearray of (gap, count) varints
+    last_ids = {}       # word -> the last id in its posting list
+    frequencies = {}    # word -> [df, spam df]
+    labels = bytearray()
+    spam_documents = 0
+    document_count = 0
+    previous = -1
+
+    for doc_id, is_spam, word_table in documents:
+        if doc_id <= previous:
+            raise RuntimeError(f"Document {doc_id} comes after {previous}, the ids must increase")
+        previous = doc_id
+        document_count += 1
+        if len(labels) <= doc_id:
+            labels.extend(b"\xff" * (doc_id + 1 - len(labels)))
+        labels[doc_id] = SPAM if is_spam else HAM
+        if is_spam:
+            spam_documents += 1
+
+        for word, count in word_counts(word_table):
+            posting = postings.get(word)
+            if posting is None:
+                posting = postings[word] = bytearray()
+                frequencies[word] = [0, 0]
+                gap = doc_id
+            else:
+                gap = doc_id - last_ids[word]
+            last_ids[word] = doc_id
+            _encode_varint(gap, posting)
+            _encode_varint(count, posting)
+            frequency = frequencies[word]
+            frequency[0] += 1
+            if is_spam:
+                frequency[1] += 1
+
+    encoded = sorted((word.encode("utf-8"), word) for word in postings)
+    offsets = array('Q', [0])
+    entries = array('Q')
+    position = 0
+    for key, word in encoded:
+        offsets.append(offsets[-1] + len(key))
+        size = len(postings[word])
+        entries.extend((position, size, frequencies[word][0], frequencies[word][1]))
+        position += size
+
+    postings_start = HEADER.size + 8 * len(offsets) + 8 * len(entries) + \
+                     len(labels) + len(_padding(len(labels))) + \
+                     offsets[-1] + len(_padding(offsets[-1]))
+
+    with atomic_open(path, mode="wb") as handle:
+        handle.write(HEADER.pack(INDEX_MAGIC, len(encoded), document_count, spam_documents,
+                                 len(labels), postings_start))
+        handle.write(offsets.tobytes())
+        handle.write(entries.tobytes())
+        handle.write(labels)
+        handle.write(_padding(len(labels)))
+        for key, word in encoded:
+            handle.write(key)
+        handle.write(_padding(offsets[-1]))
+        for key, word in encoded:
+            handle.write(postings[word])
+    return (len(encoded), document_count)
+
+
+# -------------------------------------
+# Querying
+# -------------------------------------
+
+class InvertedIndex:
+    """
+    Read only access to an index written by build_index. The file
+    is memory mapped, so opening it costs next to nothing and a
+    query only touches the pages of the words it asks about.
+    """
+
+    def __init__(self, path):
+        check_byteorder("the inverted index")
+        self.path = Path(path)
+        with self.path.open(mode="rb") as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size or self._map[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            self._map.close()
+            raise RuntimeError(f"{self.path} is not an inverted index")
+
+        magic, self.word_count, self.documents, self.spam_documents, self.id_total, \
+                self._postings_start = HEADER.unpack_from(self._map)
+
+        view = memoryview(self._map)
+        start = HEADER.size
+        end = start + 8 * (self.word_count + 1)
+        self._offsets = view[start:end].cast('Q')
+        start, end = end, end + 8 * ENTRY_WIDTH * self.word_count
+        self._entries = view[start:end].cast('Q')
+        start, end = end, end + self.id_total
+        self._labels = view[start:end]
+        self._words_start = end + len(_padding(self.id_total))
+        view.release()
+
+    def __len__(self):
+        return self.word_count
+
+    @property
+    def ham_documents(self):
+        return self.documents - self.spam_documents
+
+    def word(self, i):
+        start = self._words_start
+        return self._map[start + self._offsets[i]:start + self._offsets[i + 1]].decode("utf-8")
+
+    def lookup(self, word):
+        """Returns the position of |word| in the index, or None."""
+        key = word.encode("utf-8")
+        start = self._words_start
+        offsets = self._offsets
+        lo = 0
+        hi = self.word_count
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if self._map[start + offsets[mid]:start + offsets[mid + 1]] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.word_count and self._map[start + offsets[lo]:start + offsets[lo + 1]] == key:
+            return lo
+        return None
+
+    def doc_frequency(self, word):
+        """Returns the (documents, spam documents) |word| appears in."""
+        i = self.lookup(word)
+        if i is None:
+            return (0, 0)
+        entry = ENTRY_WIDTH * i
+        return (self._entries[entry + 2], self._entries[entry + 3])
+
+    def postings(self, word):
+        """
+        Returns the (ids, counts) of the emails |word| appears in,
+        two lists in increasing id order.
+        """
+        i = self.lookup(word)
+        if i is None:
+            return ([], [])
+        entry = ENTRY_WIDTH * i
+        start = self._postings_start + self._entries[entry]
+        numbers = _decode_varints(self._map[start:start + self._entries[entry + 1]])
+        return (list(accumulate(numbers[0::2])), numbers[1::2])
+
+    def doc_ids(self, word):
+        return self.postings(word)[0]
+
+    def all_of(self, words):
+        """The sorted ids of the emails every one of |words| appears in."""
+        if len(words) == 0:
+            return []
+        # Cheapest first: the smallest list bounds the result, and an
+        # absent word ends the query before any list is decoded.
+        frequencies = sorted((self.doc_frequency(word)[0], word) for word in words)
+        if frequencies[0][0] == 0:
+            return []
+        result = self.doc_ids(frequencies[0][1])
+        for df, word in frequencies[1:]:
+            ids = set(self.doc_ids(word))
+            result = [doc_id for doc_id in result if doc_id in ids]
+            if len(result) == 0:
+                break
+        return result
+
+    def any_of(self, words):
+        """The sorted ids of the emails at least one of |words| appears in."""
+        result = []
+        for doc_id in heapq.merge(*[self.doc_ids(word) for word in words]):
+            if len(result) == 0 or result[-1] != doc_id:
+                result.append(doc_id)
+        return result
+
+    def is_spam(self, doc_id):
+        label = self._labels[doc_id] if 0 <= doc_id < self.id_total else ABSENT
+        if label == ABSENT:
+            raise RuntimeError(f"Document {doc_id} is not in the index")
+        return label == SPAM
+
+    def label_counts(self, doc_ids):
+        """Returns the (ham, spam) breakdown of |doc_ids|."""
+        labels = self._labels
+        spam = sum(1 for doc_id in doc_ids if labels[doc_id] == SPAM)
+        return (len(doc_ids) - spam, spam)
+
+    def frequencies(self):
+        """Yields (word, df, spam df) for every word, in bytewise word order."""
+        entries = self._entries
+        for i in range(self.word_count):
+            entry = ENTRY_WIDTH * i
+            yield (self.word(i), entries[entry + 2], entries[entry + 3])
+
+    def top_frequencies(self, n, label=None):
+        """
+        Returns the (word, df, spam df) of the |n| words found in
+        the most documents, or in the most "spam" or "ham"
+        documents when |label| is given.
+        """
+        if label == "spam":
+            key = lambda entry: entry[2]
+        elif label == "ham":
+            key = lambda entry: entry[1] - entry[2]
+        else:
+            key = lambda entry: entry[1]
+        return heapq.nlargest(n, self.frequencies(), key=key)
+
+    def close(self):
+        self._offsets.release()
+        self._entries.release()
+        self._labels.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,94 @@
+"""
+A manifest of the targets extracted into a cache, so a
+later run can tell which targets are new, changed or gone
+and only do the work for those.
+"""
+import os
+import hashlib
+from pathlib import Path
+
+from udax.atomic import atomic_open
+from udax.tokenizer import TOKENIZER_VERSION
+
+
+MANIFEST_MAGIC = "# udax manifest 1"
+
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with Path(path).open(mode="rb") as handle:
+        while True:
+            chunk = handle.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def stat_target(path, use_hash=False):
+    """
+    Returns the manifest entry of the target at |path|, in the
+    form (size, mtime_ns, digest, tokenizer_version). Without
+    |use_hash| the digest is "-" and changes are detected by
+    size and modification time alone.
+    """
+    st = os.stat(path)
+    digest = file_digest(path) if use_hash else "-"
+    return (st.st_size, st.st_mtime_ns, digest, TOKENIZER_VERSION)
+
+
+def is_same_target(old, new):
+    """
+    Whether the manifest entry |old| still describes the target
+    whose entry is now |new|. When both carry a digest, the
+    digest and size decide and the modification time is ignored.
+    """
+    size, mtime_ns, digest, tokenizer_version = old
+    if tokenizer_version != new[3] or size != new[0]:
+        return False
+    if digest != "-" and new[2] != "-":
+        return digest == new[2]
+    return mtime_ns == new[1]
+
+
+class Manifest:
+    """
+    Maps target names to the entry (see stat_target) they had
+    when extracted, along with the digests of the global tables
+    that were written together with the manifest.
+
+    The file is plain text, one record per line:
+
+        table <name> <digest>
+        target <name> <size> <mtime_ns> <digest> <tokenizer-version>
+    """
+
+    def __init__(self):
+        self.targets = {}
+        self.tables = {}
+
+    @staticmethod
+    def load(path):
+        """Loads the manifest at |path|, or an empty one when there is none."""
+        manifest = Manifest()
+        path = Path(path)
+        if not path.exists():
+            return manifest
+        with path.open(mode="r", encoding="utf-8") as handle:
+            if handle.readline().rstrip("\n") != MANIFEST_MAGIC:
+                raise RuntimeError(f"{path} is not a manifest")
+            for line in handle:
+                entry = line.split()
+                if entry[0] == "table":
+                    manifest.tables[entry[1]] = entry[2]
+                elif entry[0] == "target":
+                    manifest.targets[entry[1]] = (int(entry[2]), int(entry[3]), entry[4], int(entry[5]))
+        return manifest
+
+    def save(self, path):
+        with atomic_open(path, mode="w", encoding="utf-8") as handle:
+            handle.write(MANIFEST_MAGIC + "\n")
+            for name, digest in self.tables.items():
+                handle.write(f"table {name} {digest}\n")
+            for name, (size, mtime_ns, digest, tokenizer_version) in self.targets.items():
+                handle.write(f"target {name} {size} {mtime_ns} {digest} {tokenizer_version}\n")
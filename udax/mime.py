@@ -0,0 +1,212 @@
+"""
+A single pass scanner over the raw bytes of an email
+that finds the lines, headers and part boundaries the
+HttpEmail class needs, without decoding every line.
+"""
+import re
+from io import BytesIO
+from bisect import bisect_right
+from itertools import accumulate
+
+
+ORIGINAL_MESSAGE = b"-----Original Message-----"
+
+# The characters str.strip removes from a latin-1
+# decoded line, so a line is blank in bytes exactly
+# when its decoded form is blank.
+LATIN1_WHITESPACE = bytes(b for b in range(256) if chr(b).isspace())
+
+# Lines holding any of these are the only ones the
+# scanner has to look at in python.
+HEADER_NEEDLES = (ORIGINAL_MESSAGE, b"From: ", b"Content-Type: ", b"boundary")
+
+_BLANK_SPACE = re.escape(LATIN1_WHITESPACE.replace(b"\n", b""))
+_BLANK_LINE = re.compile(rb"^(?:[%s]*\n|[%s]+\Z)" % (_BLANK_SPACE, _BLANK_SPACE), re.M)
+
+
+def is_blank(line):
+    return len(line.strip(LATIN1_WHITESPACE)) == 0
+
+
+def _find_lines(buffer, needle, ends):
+    """Indices of the lines, ending at |ends|, that contain |needle|."""
+    lines = []
+    pos = buffer.find(needle)
+    while pos != -1:
+        r = bisect_right(ends, pos)
+        lines.append(r)
+        pos = buffer.find(needle, ends[r])
+    return lines
+
+
+class MimeScan:
+    """
+    The result of scan_message. Lines are the lines of the
+    message (as split by readlines) that survive the header
+    filter, and are referred to by their index within the
+    surviving lines, as are the split indices.
+
+    The |starts| and |ends| lists hold the byte offsets of
+    each line within |buffer|, and |breaks| the indices of
+    the lines that do not directly follow the previous line
+    in |buffer| because dropped lines sit in between.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.starts = []
+        self.ends = []
+        self.breaks = []
+        self.sender = ""
+        self.content_type = ""
+        self.boundary = None
+
+        # [0] = body start
+        # [-1] = file end
+        self.split_indices = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def line(self, i):
+        return self.buffer[self.starts[i]:self.ends[i]]
+
+    def is_blank(self, i):
+        return is_blank(self.line(i))
+
+    def join(self, begin, end):
+        """
+        Same as b"".join(lines[begin:end]), slice semantics
+        included, copied out of the buffer a run at a time.
+        """
+        lines = range(len(self.starts))[begin:end]
+        if len(lines) == 0:
+            return b""
+        first = lines[0]
+        last = lines[-1]
+        runs = []
+        for i in self.breaks:
+            if first < i <= last:
+                runs.append(self.buffer[self.starts[first]:self.ends[i - 1]])
+                first = i
+        runs.append(self.buffer[self.starts[first]:self.ends[last]])
+        if len(runs) == 1:
+            return runs[0]
+        return b"".join(runs)
+
+
+def scan_message(buffer):
+    """
+    Scans the raw |buffer| of an email and returns a MimeScan.
+
+    Quoted "Original Message" headers are dropped, that is,
+    every line from the marker up to (not including) the next
+    blank line. On the remaining lines, the sender, the first
+    content type and the multipart boundary are picked up, and
+    the indices of the lines holding the boundary are recorded
+    as split indices. Without a boundary, the first blank line
+    (where the body begins) is the only split index. Either way
+    the index of the last line closes the list.
+
+    Only the lines holding a header of interest, a boundary or
+    the blank line ending a header block are visited; the rest
+    of the buffer is only ever searched from C.
+    """
+    scan = MimeScan(buffer)
+    length = len(buffer)
+
+    # End offset of every line of the message, which is all
+    # that is needed to find the line a match falls in.
+    ends = list(accumulate(map(len, BytesIO(buffer).readlines())))
+
+    def start_of(r):
+        return ends[r - 1] if r > 0 else 0
+
+    # Dropped (first, last) line ranges, last exclusive.
+    dropped = []
+
+    def kept_index(r):
+        i = r
+        for first, last in dropped:
+            if last <= r:
+                i -= last - first
+        return i
+
+    sender = ""
+    content_type = ""
+    # (line, boundary) for every line that sets the boundary.
+    boundaries = []
+
+    # Searching for each needle separately keeps the scan
+    # over the buffer in memchr speed territory, which a regex
+    # alternation is not.
+    header_lines = set()
+    for needle in HEADER_NEEDLES:
+        header_lines.update(_find_lines(buffer, needle, ends))
+
+    skip_end = 0
+    for r in sorted(header_lines):
+        if r < skip_end:
+            continue
+        line = buffer[start_of(r):ends[r]]
+
+        if ORIGINAL_MESSAGE in line:
+            blank = _BLANK_LINE.search(buffer, ends[r])
+            skip_end = bisect_right(ends, blank.start()) if blank else len(ends)
+            dropped.append((r, skip_end))
+            continue
+
+        if b"From: " in line:
+            sender = line[6:].decode("latin-1").strip()
+        if content_type == "" and b"Content-Type: " in line:
+            content_type = line[14:line.find(b";")].decode("latin-1")
+        if b"boundary" in line:
+            eq = line.find(b"=")
+            if eq != -1:
+                boundaries.append((r, line[eq + 1:][1:-2]))
+
+    # Each boundary is in effect from the line after the one
+    # setting it up to the line setting the next one, which
+    # themselves never count as splits.
+    split_indices = scan.split_indices
+    for k, (r, boundary) in enumerate(boundaries):
+        if not boundary:
+            continue
+        stop = start_of(boundaries[k + 1][0]) if k + 1 < len(boundaries) else length
+        pos = ends[r]
+        while True:
+            hit = buffer.find(boundary, pos, stop)
+            if hit == -1:
+                break
+            r = bisect_right(ends, hit)
+            pos = ends[r]
+            if any(first <= r < last for first, last in dropped):
+                continue
+            split_indices.append(kept_index(r))
+
+    if len(split_indices) == 0:
+        # Dropped lines are never blank, so the first blank
+        # lines of the buffer are also the first kept ones.
+        # Like the body index of old, a blank first line does
+        # not count if another blank line follows.
+        body_index = None
+        for match in _BLANK_LINE.finditer(buffer):
+            body_index = kept_index(bisect_right(ends, match.start()))
+            if body_index:
+                break
+        split_indices.append(body_index)
+
+    starts = [0] + ends[:-1] if len(ends) > 0 else []
+    for first, last in reversed(dropped):
+        del starts[first:last]
+        del ends[first:last]
+    scan.starts = starts
+    scan.ends = ends
+    scan.breaks = [kept_index(last) for first, last in dropped]
+    split_indices.append(len(starts) - 1)
+
+    scan.sender = sender
+    scan.content_type = content_type
+    if len(boundaries) > 0:
+        scan.boundary = boundaries[-1][1].decode("latin-1")
+    return scan
@@ -0,0 +1,151 @@
+"""
+A compiled Naive-Bayes model: everything udax.bayes needs to
+classify a message, in one file that is memory mapped rather
+than parsed, so that loading it costs next to nothing.
+
+The file is laid out as follows, all little endian and every
+section 8 byte aligned:
+
+    magic           8 bytes     UDAXNBM1, or UDAXNBP1 for a
+                                pruned model
+    word_count      uint64      V
+    log_prior       2 float64   ham, spam
+    log_unseen      2 float64   ham, spam
+    offsets         V + 1 uint64, where every word starts in
+                    the word blob, the last one being its size
+    log_likelihood  V * 2 float64, the ham and spam weights of
+                    every word
+    words           the words, utf-8, sorted bytewise and not
+                    separated
+
+Words are looked up by binary search over the sorted blob. A
+pruned model (see udax.features) drops the words it does not
+hold instead of scoring them with log_unseen.
+Only the standard library is used here, so classifying does
+not pay for importing numpy.
+"""
+import math
+import mmap
+import struct
+from pathlib import Path
+
+from udax.atomic import atomic_open
+from udax.common import check_byteorder, word_counts
+
+
+MODEL_MAGIC = b"UDAXNBM1"
+PRUNED_MAGIC = b"UDAXNBP1"
+HEADER = struct.Struct("<8sQ4d")
+
+
+def compile_model(model, path):
+    """
+    Writes |model| (a udax.bayes.NaiveBayes) to |path|, atomically.
+    Returns the number of words written.
+    """
+    check_byteorder("compiled models")
+    encoded = sorted((word.encode("utf-8"), i) for i, word in enumerate(model.vocab))
+
+    offsets = [0]
+    for word, i in encoded:
+        offsets.append(offsets[-1] + len(word))
+    order = [i for word, i in encoded]
+    weights = model.log_likelihood.T[order]
+
+    with atomic_open(path, mode="wb") as handle:
+        handle.write(HEADER.pack(PRUNED_MAGIC if model.pruned else MODEL_MAGIC, len(encoded),
+                                 model.log_prior[0], model.log_prior[1],
+                                 model.log_unseen[0], model.log_unseen[1]))
+        handle.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        handle.write(weights.astype("<f8").tobytes())
+        for word, i in encoded:
+            handle.write(word)
+    return len(encoded)
+
+
+class CompiledModel:
+    """Read only access to a model written by compile_model."""
+
+    def __init__(self, path):
+        check_byteorder("compiled models")
+        self.path = Path(path)
+        with self.path.open(mode="rb") as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size or self._map[:len(MODEL_MAGIC)] not in [MODEL_MAGIC, PRUNED_MAGIC]:
+            self._map.close()
+            raise RuntimeError(f"{self.path} is not a compiled model")
+
+        self.pruned = self._map[:len(PRUNED_MAGIC)] == PRUNED_MAGIC
+        magic, self.word_count, ham_prior, spam_prior, ham_unseen, spam_unseen = \
+                HEADER.unpack_from(self._map)
+        self.log_prior = (ham_prior, spam_prior)
+        self.log_unseen = (ham_unseen, spam_unseen)
+
+        view = memoryview(self._map)
+        start = HEADER.size
+        end = start + 8 * (self.word_count + 1)
+        self._offsets = view[start:end].cast('Q')
+        start, end = end, end + 16 * self.word_count
+        self._weights = view[start:end].cast('d')
+        self._words_start = end
+        view.release()
+
+    def __len__(self):
+        return self.word_count
+
+    def word(self, i):
+        start = self._words_start
+        return self._map[start + self._offsets[i]:start + self._offsets[i + 1]]
+
+    def lookup(self, word):
+        """Returns the position of |word| in the model, or None."""
+        key = word.encode("utf-8")
+        lo = 0
+        hi = self.word_count
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if self.word(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.word_count and self.word(lo) == key:
+            return lo
+        return None
+
+    def log_scores(self, word_table):
+        """
+        Returns the (ham, spam) log scores of a message given its
+        word table, word -> count or word -> (count, relative-freq)
+        as in HttpEmail.
+        """
+        ham, spam = self.log_prior
+        unseen_ham, unseen_spam = self.log_unseen
+        weights = self._weights
+        pruned = self.pruned
+        for word, count in word_counts(word_table):
+            i = self.lookup(word)
+            if i is None and pruned:
+                continue
+            log_count = math.log(count)
+            if i is None:
+                ham += unseen_ham + log_count
+                spam += unseen_spam + log_count
+            else:
+                ham += weights[2 * i] + log_count
+                spam += weights[2 * i + 1] + log_count
+        return (ham, spam)
+
+    def is_spam(self, word_table):
+        ham, spam = self.log_scores(word_table)
+        return spam > ham
+
+    def close(self):
+        self._offsets.release()
+        self._weights.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
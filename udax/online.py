@@ -0,0 +1,194 @@
+"""
+A Naive-Bayes model kept as its sufficient statistics, the
+spam and ham word counts, so that it can be updated one
+email at a time instead of retrained.
+
+Adding or removing an email only touches the words of that
+email, and so does scoring one: the model scores exactly as
+udax.bayes.NaiveBayes.from_tables would on the same counts.
+
+Models are saved as a single text file,
+
+    # udax counts 1
+    <word> <ham-count> <spam-count>
+    ...
+
+replaced atomically, so a crash mid-save leaves the previous
+model intact.
+"""
+import math
+from pathlib import Path
+
+from udax.atomic import atomic_open
+from udax.common import word_counts
+from udax.tablecache import TableCache, INDEX_NAME, read_text_table
+from udax.tokenizer import MAX_WORD_LENGTH
+
+
+COUNTS_MAGIC = "# udax counts 1"
+
+
+class OnlineNaiveBayes:
+    """
+    |ham_table| and |spam_table| map word -> count. Words at least
+    |max_length| long are kept in the tables but, as in training
+    the notebook, left out of the model.
+    """
+
+    def __init__(self, ham_table=None, spam_table=None, max_length=MAX_WORD_LENGTH):
+        self.tables = (ham_table if ham_table is not None else {},
+                       spam_table if spam_table is not None else {})
+        self.max_length = max_length
+        self.totals = [0, 0]
+        for label in [0, 1]:
+            for word, count in self.tables[label].items():
+                if self._counted(word):
+                    self.totals[label] += count
+
+    def _counted(self, word):
+        return self.max_length is None or len(word) < self.max_length
+
+    # -------------------------------------
+    # Loading
+    # -------------------------------------
+
+    @staticmethod
+    def from_tables(spam_path, ham_path, max_length=MAX_WORD_LENGTH):
+        """Loads the global TABLE.spam and TABLE.ham of extract.py."""
+        tables = []
+        for path in [ham_path, spam_path]:
+            table = {}
+            with Path(path).open(mode="r") as handle:
+                for line in handle:
+                    word, count = line.rsplit(' ', 1)
+                    table[word] = int(count)
+            tables.append(table)
+        return OnlineNaiveBayes(tables[0], tables[1], max_length)
+
+    @staticmethod
+    def from_cache(directory, max_length=MAX_WORD_LENGTH):
+        """
+        Counts the per-email tables of a cache directory, either
+        the {target}.table text files or a binary udax.tablecache.
+        """
+        directory = Path(directory)
+        model = OnlineNaiveBayes(max_length=max_length)
+        if directory.joinpath(INDEX_NAME).exists():
+            with TableCache(directory) as cache:
+                for doc_id in cache.doc_ids:
+                    model.add(cache.word_table(doc_id), cache.is_spam(doc_id))
+            return model
+
+        for path in sorted(directory.glob("*.table")):
+            # {numeric-id}.{spam|ham}.table
+            model.add(read_text_table(path), "spam" == path.name.split('.')[1])
+        return model
+
+    @staticmethod
+    def load(path, max_length=MAX_WORD_LENGTH):
+        """Loads a model written by save."""
+        ham_table = {}
+        spam_table = {}
+        with Path(path).open(mode="r") as handle:
+            if handle.readline().rstrip("\n") != COUNTS_MAGIC:
+                raise RuntimeError(f"{path} is not a saved model")
+            for line in handle:
+                word, ham, spam = line.rsplit(' ', 2)
+                if int(ham) > 0:
+                    ham_table[word] = int(ham)
+                if int(spam) > 0:
+                    spam_table[word] = int(spam)
+        return OnlineNaiveBayes(ham_table, spam_table, max_length)
+
+    def save(self, path):
+        ham_table, spam_table = self.tables
+        with atomic_open(path) as handle:
+            handle.write(f"{COUNTS_MAGIC}\n")
+            for word, count in ham_table.items():
+                handle.write(f"{word} {count} {spam_table.get(word, 0)}\n")
+            for word, count in spam_table.items():
+                if word not in ham_table:
+                    handle.write(f"{word} 0 {count}\n")
+
+    # -------------------------------------
+    # Updating
+    # -------------------------------------
+
+    def add(self, word_table, is_spam):
+        """Counts a labelled email in, given its word table."""
+        label = 1 if is_spam else 0
+        table = self.tables[label]
+        for word, count in word_counts(word_table):
+            table[word] = table.get(word, 0) + count
+            if self._counted(word):
+                self.totals[label] += count
+
+    def remove(self, word_table, is_spam):
+        """
+        Counts an email added earlier (e.g. with the wrong label)
+        back out. The counts do not remember which emails were
+        added: removing one that never was subtracts its words
+        from those of the others, unnoticed, unless some count
+        would go negative, in which case a RuntimeError is raised
+        and nothing changes.
+        """
+        label = 1 if is_spam else 0
+        table = self.tables[label]
+        counts = list(word_counts(word_table))
+        for word, count in counts:
+            if table.get(word, 0) < count:
+                raise RuntimeError(f"Cannot remove {count} of '{word}' from the "
+                                   f"{'spam' if is_spam else 'ham'} counts")
+        for word, count in counts:
+            remaining = table[word] - count
+            if remaining == 0:
+                del table[word]
+            else:
+                table[word] = remaining
+            if self._counted(word):
+                self.totals[label] -= count
+
+    def relabel(self, word_table, is_spam):
+        """Moves an email counted with the other label over to |is_spam|."""
+        self.remove(word_table, not is_spam)
+        self.add(word_table, is_spam)
+
+    # -------------------------------------
+    # Scoring
+    # -------------------------------------
+
+    def log_scores(self, word_table):
+        """Returns the (ham, spam) log scores of an email given its word table."""
+        ham_table, spam_table = self.tables
+        ham_total, spam_total = self.totals
+        if ham_total == 0 or spam_total == 0:
+            raise RuntimeError("Both ham and spam need training words")
+
+        log_total = math.log(ham_total + spam_total)
+        log_ham_total = math.log(ham_total)
+        log_spam_total = math.log(spam_total)
+        ham = log_ham_total - log_total
+        spam = log_spam_total - log_total
+        for word, count in word_counts(word_table):
+            log_count = math.log(count)
+            ham_count = 0
+            spam_count = 0
+            if self._counted(word):
+                ham_count = ham_table.get(word, 0)
+                spam_count = spam_table.get(word, 0)
+            ham += math.log1p(ham_count) - log_ham_total + log_count
+            spam += math.log1p(spam_count) - log_spam_total + log_count
+        return (ham, spam)
+
+    def is_spam(self, word_table):
+        ham, spam = self.log_scores(word_table)
+        return spam > ham
+
+    def to_model(self, selected=None):
+        """
+        Returns the udax.bayes.NaiveBayes of the current counts, e.g.
+        to compile it, pruned to the words of |selected| if given.
+        """
+        from udax.bayes import NaiveBayes
+        ham_table, spam_table = self.tables
+        return NaiveBayes.from_tables(spam_table, ham_table, self.max_length, selected)
@@ -0,0 +1,152 @@
+"""
+Overlapping the I/O of the extraction loop with its parsing.
+
+Prefetcher reads the upcoming targets on a few threads, at most
+|depth| ahead of the one being parsed, and hands them back in
+order. AsyncWriter takes the files to write off the parsing
+thread onto its own, through a queue of at most |depth| files.
+Both spend their time in the kernel with the GIL released, so
+the disk (or network) and the parser run at once.
+
+Whenever the parser has to wait on either, because the next
+target is not read yet or the write queue is full, it is a
+stall: StallStats counts them and the time lost, which tells
+whether the depths, or the number of readers, are too small.
+"""
+import sys
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StallStats:
+    """How often, and how long, the parsing waited on I/O."""
+
+    def __init__(self):
+        self.reads = 0
+        self.read_stalls = 0
+        self.read_wait = 0          # ns
+        self.writes = 0
+        self.write_stalls = 0
+        self.write_wait = 0         # ns
+
+    def merge(self, other):
+        self.reads += other.reads
+        self.read_stalls += other.read_stalls
+        self.read_wait += other.read_wait
+        self.writes += other.writes
+        self.write_stalls += other.write_stalls
+        self.write_wait += other.write_wait
+
+    def report(self, fd=sys.stdout):
+        fd.write("Read-ahead: %d/%d targets not read in time, %.2fs waited\n" % \
+                 (self.read_stalls, self.reads, self.read_wait / 1e9))
+        if self.writes > 0:
+            fd.write("Writer: queue full for %d/%d writes, %.2fs waited\n" % \
+                     (self.write_stalls, self.writes, self.write_wait / 1e9))
+
+
+class Prefetcher:
+    """
+    Iterates over (item, read(item)) for every item of |items|, in
+    order, with up to |depth| reads in flight on |threads| threads.
+    """
+
+    def __init__(self, read, items, depth=64, threads=4, stats=None):
+        self.read = read
+        self.items = iter(items)
+        self.depth = max(1, depth)
+        self.stats = stats if stats is not None else StallStats()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, threads))
+        self.pending = deque()      # (item, future)
+
+    def _fill(self):
+        while len(self.pending) < self.depth:
+            item = next(self.items, None)
+            if item is None:
+                return
+            self.pending.append((item, self.executor.submit(self.read, item)))
+
+    def __iter__(self):
+        stats = self.stats
+        try:
+            self._fill()
+            while len(self.pending) > 0:
+                item, future = self.pending.popleft()
+                self._fill()
+                if not future.done():
+                    t_begin = time.monotonic_ns()
+                    result = future.result()
+                    stats.read_stalls += 1
+                    stats.read_wait += time.monotonic_ns() - t_begin
+                else:
+                    result = future.result()
+                stats.reads += 1
+                yield (item, result)
+        finally:
+            for item, future in self.pending:
+                future.cancel()
+            self.executor.shutdown(wait=True)
+
+
+class AsyncWriter:
+    """
+    Writes text files on a background thread, fed through a queue
+    of at most |depth| files. An error while writing, of any kind,
+    is raised again by the next call to write, flush or close; the
+    thread keeps draining the queue meanwhile, so none of them can
+    block on a writer that has died.
+    """
+
+    def __init__(self, depth=256, stats=None):
+        self.queue = queue.Queue(maxsize=max(1, depth))
+        self.stats = stats if stats is not None else StallStats()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name="udax-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            entry = self.queue.get()
+            try:
+                if entry is None:
+                    return
+                if self.error is None:
+                    path, text = entry
+                    with path.open(mode="w") as handle:
+                        handle.write(text)
+            except BaseException as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            if isinstance(error, OSError):
+                raise RuntimeError(f"Failed to write the cache: {error}")
+            raise error
+
+    def write(self, path, text):
+        self._check()
+        stats = self.stats
+        stats.writes += 1
+        try:
+            self.queue.put_nowait((path, text))
+        except queue.Full:
+            t_begin = time.monotonic_ns()
+            self.queue.put((path, text))
+            stats.write_stalls += 1
+            stats.write_wait += time.monotonic_ns() - t_begin
+
+    def flush(self):
+        """Waits until every queued file is written."""
+        self.queue.join()
+        self._check()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self._check()
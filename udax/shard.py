@@ -0,0 +1,146 @@
+"""
+Splitting the extraction of data/trec over several nodes that
+share the storage.
+
+Shard i of N takes the targets whose numeric id (the one
+sanitize.py embossed on the filename) falls in the i-th of N
+contiguous, equal ranges of ids. Every node lists the same
+directory, so the split is the same everywhere, and because
+the ranges are contiguous, merging the partial tables of the
+shards in shard order inserts every word exactly where a
+single run over all the targets would have.
+
+Every shard writes its cache segment and partial TABLE files
+into a directory of its own, and its ShardManifest last, so a
+shard without one never finished. check_shards refuses a set
+of shards to merge with one missing, one twice, or that do not
+agree on how they were extracted.
+"""
+from pathlib import Path
+
+from udax.atomic import atomic_open
+from udax.manifest import file_digest
+
+
+SHARD_MAGIC = "# udax shard 1"
+SHARD_NAME = "SHARD"
+
+
+def parse_shard(text):
+    """Parses "i/N" into (i, N)."""
+    index, _, count = text.partition("/")
+    try:
+        index = int(index)
+        count = int(count)
+    except ValueError:
+        raise RuntimeError(f"Invalid shard {text}, expected i/N, e.g. 0/4")
+    if count <= 0 or index < 0 or index >= count:
+        raise RuntimeError(f"Invalid shard {text}, expected 0 <= i < N")
+    return (index, count)
+
+
+def shard_range(index, count, id_total):
+    """The [first, end) numeric ids of shard |index| of |count| over ids [0, |id_total|)."""
+    return (index * id_total // count, (index + 1) * id_total // count)
+
+
+def shard_dirname(index, count):
+    return f"shard-{index:04d}-of-{count:04d}"
+
+
+class ShardManifest:
+    """
+    Describes the outputs of a shard. Plain text, one "key value"
+    line per field, then one "table <name> <digest>" line per
+    partial TABLE file.
+    """
+
+    FIELDS = [("index", int), ("count", int), ("first_id", int), ("end_id", int),
+              ("id_total", int), ("targets", int), ("cache_format", str),
+              ("engine", str), ("tokenizer_version", int), ("vocab", str)]
+
+    def __init__(self, **fields):
+        for name, kind in self.FIELDS:
+            setattr(self, name, fields.get(name))
+        self.tables = {}
+        self.directory = None
+
+    @staticmethod
+    def load(directory):
+        directory = Path(directory)
+        path = directory.joinpath(SHARD_NAME)
+        if not path.exists():
+            raise RuntimeError(f"{directory} has no {SHARD_NAME} manifest, the shard is incomplete")
+        manifest = ShardManifest()
+        manifest.directory = directory
+        kinds = dict(ShardManifest.FIELDS)
+        with path.open(mode="r", encoding="utf-8") as handle:
+            if handle.readline().rstrip("\n") != SHARD_MAGIC:
+                raise RuntimeError(f"{path} is not a shard manifest")
+            for line in handle:
+                entry = line.split()
+                if entry[0] == "table":
+                    manifest.tables[entry[1]] = entry[2]
+                elif entry[0] in kinds:
+                    setattr(manifest, entry[0], kinds[entry[0]](entry[1]))
+        for name, kind in ShardManifest.FIELDS:
+            if getattr(manifest, name) is None:
+                raise RuntimeError(f"{path} is missing {name}")
+        return manifest
+
+    def save(self, directory):
+        """Saves the manifest along with the digests of the |tables| in |directory|."""
+        directory = Path(directory)
+        for name in self.tables:
+            self.tables[name] = file_digest(directory.joinpath(name))
+        with atomic_open(directory.joinpath(SHARD_NAME), mode="w", encoding="utf-8") as handle:
+            handle.write(SHARD_MAGIC + "\n")
+            for name, kind in self.FIELDS:
+                handle.write(f"{name} {getattr(self, name)}\n")
+            for name, digest in self.tables.items():
+                handle.write(f"table {name} {digest}\n")
+
+    def verify(self):
+        """Checks the partial TABLE files are the ones the manifest was saved with."""
+        for name, digest in self.tables.items():
+            path = self.directory.joinpath(name)
+            if not path.exists() or file_digest(path) != digest:
+                raise RuntimeError(f"{path} does not match the shard manifest")
+
+    def __str__(self):
+        return f"shard {self.index}/{self.count}"
+
+
+def check_shards(manifests):
+    """
+    Returns the |manifests| in shard order once they are known to
+    be the complete set of shards of one and the same run.
+    """
+    if len(manifests) == 0:
+        raise RuntimeError("No shards to merge")
+
+    first = manifests[0]
+    for manifest in manifests[1:]:
+        for name in ["count", "id_total", "cache_format", "engine", "tokenizer_version", "vocab"]:
+            if getattr(manifest, name) != getattr(first, name):
+                raise RuntimeError(f"{manifest} ({manifest.directory}) has {name} {getattr(manifest, name)}, "
+                                   f"{first} ({first.directory}) has {getattr(first, name)}")
+
+    by_index = {}
+    for manifest in manifests:
+        if manifest.index in by_index:
+            raise RuntimeError(f"Duplicate {manifest}: {by_index[manifest.index].directory} "
+                               f"and {manifest.directory}")
+        by_index[manifest.index] = manifest
+
+    missing = [index for index in range(first.count) if index not in by_index]
+    if len(missing) > 0:
+        raise RuntimeError(f"Missing shards {', '.join(f'{index}/{first.count}' for index in missing)}")
+
+    ordered = [by_index[index] for index in range(first.count)]
+    for manifest in ordered:
+        expected = shard_range(manifest.index, manifest.count, manifest.id_total)
+        if (manifest.first_id, manifest.end_id) != expected:
+            raise RuntimeError(f"{manifest} covers ids [{manifest.first_id}, {manifest.end_id}), "
+                               f"expected [{expected[0]}, {expected[1]})")
+    return ordered
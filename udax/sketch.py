@@ -0,0 +1,43 @@
+"""
+Bounded memory summaries of word streams, for corpora whose
+vocabulary does not fit in a Counter.
+"""
+import heapq
+
+
+class MisraGries:
+    """
+    The Misra-Gries heavy hitters summary: at most |capacity|
+    words are counted at a time. Every word occurring more than
+    N / (capacity + 1) times in a stream of N words is kept, and
+    the count kept for a word is at most N / (capacity + 1) below
+    its true count (never above it).
+
+    Words are added a batch at a time, as a word -> count table,
+    following the mergeable summaries of Agarwal et al.: the batch
+    is added in, then if more than |capacity| words are counted
+    the (capacity + 1)th largest count is taken off all of them.
+    """
+
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise RuntimeError(f"A Misra-Gries summary needs a capacity of at least 1, not {capacity}")
+        self.capacity = capacity
+        self.counts = {}
+        self.total = 0              # number of words seen
+        self.error = 0              # bound on how far below the true counts are
+
+    def update(self, count_table):
+        counts = self.counts
+        for word, count in count_table.items():
+            counts[word] = counts.get(word, 0) + count
+            self.total += count
+        if len(counts) > self.capacity:
+            cut = heapq.nlargest(self.capacity + 1, counts.values())[-1]
+            self.counts = {word: count - cut for word, count in counts.items() if count > cut}
+            self.error += cut
+
+    def most_common(self, n=None):
+        if n is None:
+            return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])
@@ -0,0 +1,117 @@
+"""
+A minimal compressed sparse row (CSR) matrix over numpy
+arrays, enough to hold document-term counts and multiply
+them against dense weights without pulling in scipy.
+
+Row i spans indices[indptr[i]:indptr[i + 1]] (the column
+ids) and the matching slice of data (the values). Any
+object with the same indptr/indices/data/shape attributes,
+a scipy.sparse.csr_matrix included, can be handed to the
+functions of this module.
+"""
+import numpy as np
+
+
+class CsrMatrix:
+
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        # Any integer type will do, so memory mapped column ids
+        # (e.g. udax.docterm's uint32) are used as they are.
+        self.indices = np.asarray(indices)
+        if self.indices.dtype.kind not in "iu":
+            self.indices = self.indices.astype(np.int64)
+        self.data = np.asarray(data)
+        self.shape = (int(shape[0]), int(shape[1]))
+        if len(self.indptr) != self.shape[0] + 1:
+            raise RuntimeError(f"indptr has {len(self.indptr)} entries for {self.shape[0]} rows")
+        if len(self.indices) != len(self.data):
+            raise RuntimeError(f"{len(self.indices)} column ids for {len(self.data)} values")
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def row_ids(self):
+        """The row of every stored value."""
+        return row_ids(self)
+
+    def row_nnz(self):
+        """The number of stored values of every row."""
+        return np.diff(self.indptr)
+
+    def dot(self, dense):
+        return dot(self, dense)
+
+    def row_slice(self, start, stop):
+        """
+        Returns rows [start, stop) as a CsrMatrix whose indices and
+        data are views of these; only the indptr is copied.
+        """
+        indptr = self.indptr[start:stop + 1]
+        first = indptr[0]
+        last = indptr[-1]
+        return CsrMatrix(indptr - first, self.indices[first:last], self.data[first:last],
+                         (len(indptr) - 1, self.shape[1]))
+
+
+def row_ids(matrix):
+    return np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+
+
+def keep_columns(matrix, columns):
+    """
+    Returns a CsrMatrix of only the |columns| (column ids) of
+    |matrix|, column j of the result being columns[j]. The values
+    of the other columns are dropped.
+    """
+    columns = np.asarray(columns, dtype=np.int64)
+    mapping = np.full(matrix.shape[1], -1, dtype=np.int64)
+    mapping[columns] = np.arange(len(columns))
+    mapped = mapping[matrix.indices]
+    kept = mapped >= 0
+    indptr = np.zeros(matrix.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_ids(matrix)[kept], minlength=matrix.shape[0]), out=indptr[1:])
+    return CsrMatrix(indptr, mapped[kept], matrix.data[kept], (matrix.shape[0], len(columns)))
+
+
+def row_sums(matrix, values=None):
+    """
+    Sums |values| (the stored values by default) over every
+    row, returning a dense vector.
+    """
+    if values is None:
+        values = matrix.data
+    return np.bincount(row_ids(matrix), weights=values, minlength=matrix.shape[0])
+
+
+def column_sums(matrix, rows=None):
+    """
+    Sums the stored values over every column, taking only the
+    rows selected by the boolean mask |rows| when given.
+    """
+    indices = matrix.indices
+    data = matrix.data
+    if rows is not None:
+        selected = np.repeat(np.asarray(rows, dtype=bool), np.diff(matrix.indptr))
+        indices = indices[selected]
+        data = data[selected]
+    return np.bincount(indices, weights=data, minlength=matrix.shape[1])
+
+
+def dot(matrix, dense):
+    """
+    Returns matrix @ dense for a (rows, columns) sparse matrix
+    and a dense (columns,) or (columns, k) array.
+    """
+    dense = np.asarray(dense, dtype=np.float64)
+    rows = row_ids(matrix)
+    data = matrix.data.astype(np.float64, copy=False)
+    if dense.ndim == 1:
+        return np.bincount(rows, weights=data * dense[matrix.indices], minlength=matrix.shape[0])
+
+    result = np.empty((matrix.shape[0], dense.shape[1]))
+    gathered = dense[matrix.indices]
+    for k in range(dense.shape[1]):
+        result[:, k] = np.bincount(rows, weights=data * gathered[:, k], minlength=matrix.shape[0])
+    return result
@@ -0,0 +1,149 @@
+"""
+Out of core aggregation of word -> count tables.
+
+A SpillingTable counts words in a dict like the global tables
+of extract.py, until the dict is estimated to outgrow its memory
+budget. It is then written out as a run, sorted by word, to a
+spill directory and emptied. items() merges the runs and what
+is left in memory (a k-way merge, heapq.merge) into a single
+stream sorted by word, where the counts of every word are
+summed, so the table is never held in memory as a whole.
+
+Runs are text, one "word count" line each like the TABLE files.
+At most |fanin| runs are kept: once there are that many, they are
+merged into one, so the merge never holds more files open.
+"""
+import sys
+import heapq
+import shutil
+import tempfile
+from pathlib import Path
+
+from udax.common import word_counts
+
+
+# Rough cost in bytes of an entry of a word -> count dict,
+# beyond the characters of the word: the str and int objects
+# and the dict slot.
+ENTRY_BYTES = 128
+
+default_fanin = 64
+
+
+def _read_run(path):
+    with path.open(mode="r", encoding="utf-8") as handle:
+        for line in handle:
+            word, count = line.rsplit(' ', 1)
+            yield (word, int(count))
+
+
+def _write_run(path, items):
+    with path.open(mode="w", encoding="utf-8") as handle:
+        for word, count in items:
+            handle.write(f"{word} {count}\n")
+
+
+def merge_runs(iterables):
+    """
+    Merges iterables of (word, count), each sorted by word, into
+    one sorted by word where every word appears once with the sum
+    of its counts.
+    """
+    current = None
+    total = 0
+    for word, count in heapq.merge(*iterables):
+        if word == current:
+            total += count
+            continue
+        if current is not None:
+            yield (current, total)
+        current = word
+        total = count
+    if current is not None:
+        yield (current, total)
+
+
+class SpillingTable:
+    """
+    A word -> count table kept within |budget| bytes (roughly) of
+    memory by spilling sorted runs into a temporary directory made
+    under |directory|.
+    """
+
+    def __init__(self, directory, budget, fanin=default_fanin):
+        if budget <= 0:
+            raise RuntimeError(f"The memory budget must be positive, got {budget}")
+        self.directory = Path(directory)
+        self.budget = budget
+        self.fanin = max(2, fanin)
+        self.table = {}
+        self.bytes = 0              # estimated size of |table|
+        self.runs = []
+        self.spills = 0             # runs written, merged ones included
+        self.spilled = 0            # entries written to runs
+        self._spill_dir = None
+
+    def add(self, word, count):
+        table = self.table
+        if word in table:
+            table[word] += count
+            return
+        table[word] = count
+        self.bytes += ENTRY_BYTES + len(word)
+        if self.bytes > self.budget:
+            self.spill()
+
+    def add_table(self, word_table):
+        """Adds a word -> count or word -> (count, relative-freq) table."""
+        table = self.table
+        for word, count in word_counts(word_table):
+            if word in table:
+                table[word] += count
+            else:
+                table[word] = count
+                self.bytes += ENTRY_BYTES + len(word)
+        if self.bytes > self.budget:
+            self.spill()
+
+    def _run_path(self):
+        if self._spill_dir is None:
+            self._spill_dir = Path(tempfile.mkdtemp(prefix="spill-", dir=self.directory))
+        self.spills += 1
+        return self._spill_dir.joinpath(f"run-{self.spills:06d}")
+
+    def spill(self):
+        """Writes the in-memory counts out as a sorted run and empties them."""
+        if len(self.table) == 0:
+            return
+        path = self._run_path()
+        _write_run(path, sorted(self.table.items()))
+        self.spilled += len(self.table)
+        self.runs.append(path)
+        self.table = {}
+        self.bytes = 0
+
+        if len(self.runs) >= self.fanin:
+            path = self._run_path()
+            _write_run(path, merge_runs([_read_run(run) for run in self.runs]))
+            for run in self.runs:
+                run.unlink()
+            self.runs = [path]
+
+    def items(self):
+        """Yields every (word, count), sorted by word."""
+        iterables = [_read_run(run) for run in self.runs]
+        iterables.append(sorted(self.table.items()))
+        return merge_runs(iterables)
+
+    def close(self):
+        """Removes the runs, the table is empty afterwards."""
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+        self.runs = []
+        self.table = {}
+        self.bytes = 0
+
+    def report(self, name, fd=sys.stdout):
+        fd.write("%s: %d runs spilled (%d entries), %.1f MB budget\n" % \
+                 (name, self.spills, self.spilled, self.budget / 1e6))
@@ -0,0 +1,263 @@
+"""
+A compact binary form of the per-email word tables
+cached in data/trec-cache.
+
+Instead of one text table per email, the cache is made
+of three files:
+
+    tables.vocab    every word once, one per line (utf-8),
+                    the line number being the word id
+    tables.records  packed (doc_id, word_id, count) records
+                    of unsigned 32 bit little endian integers
+    tables.index    one (doc_id, first_record, is_spam) entry
+                    of unsigned 64 bit integers per document,
+                    sorted by doc_id, closed by a sentinel
+                    entry whose first_record is the record
+                    count
+
+Both binary files start with a 16 byte header (8 byte
+magic and padding) and are read through mmap, so looking
+a document up costs a binary search and a slice.
+
+The doc_id is the numeric id sanitize.py gave the target.
+"""
+import sys
+import mmap
+import random
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+from udax.common import check_byteorder, word_counts
+
+
+VOCAB_NAME = "tables.vocab"
+RECORDS_NAME = "tables.records"
+INDEX_NAME = "tables.index"
+
+RECORDS_MAGIC = b"UDAXREC1"
+INDEX_MAGIC = b"UDAXIDX1"
+HEADER_SIZE = 16
+
+RECORD_WIDTH = 3
+INDEX_WIDTH = 3
+
+
+class TableCacheWriter:
+    """
+    Writes the binary cache into |directory|. Documents must be
+    added in increasing doc_id order, and the writer closed for
+    the index and vocabulary to be written out.
+    """
+
+    def __init__(self, directory):
+        check_byteorder("the binary table cache")
+        self.directory = Path(directory)
+        self.vocab = {}             # map <word> -> <word-id>
+        self.index = array('Q')
+        self.record_count = 0
+        self.last_doc_id = -1
+
+        self.records = self.directory.joinpath(RECORDS_NAME).open(mode="wb")
+        self.records.write(RECORDS_MAGIC.ljust(HEADER_SIZE, b"\0"))
+
+    def add(self, doc_id, is_spam, word_table):
+        """
+        Adds a document. |word_table| maps word -> count, or
+        word -> (count, relative-freq) as in HttpEmail.
+        """
+        if doc_id <= self.last_doc_id:
+            raise RuntimeError(f"Document {doc_id} added after document {self.last_doc_id}")
+        self.last_doc_id = doc_id
+
+        vocab = self.vocab
+        word_ids = array('I')
+        counts = array('I')
+        for word, count in word_counts(word_table):
+            word_id = vocab.get(word)
+            if word_id is None:
+                word_id = len(vocab)
+                vocab[word] = word_id
+            word_ids.append(word_id)
+            counts.append(count)
+
+        n = len(word_ids)
+        records = array('I', bytes(4 * RECORD_WIDTH * n))
+        records[0::RECORD_WIDTH] = array('I', [doc_id]) * n
+        records[1::RECORD_WIDTH] = word_ids
+        records[2::RECORD_WIDTH] = counts
+        self.records.write(records.tobytes())
+
+        self.index.extend((doc_id, self.record_count, 1 if is_spam else 0))
+        self.record_count += n
+
+    def close(self):
+        if self.records is None:
+            return
+        self.records.close()
+        self.records = None
+
+        self.index.extend((2 ** 64 - 1, self.record_count, 0))
+        with self.directory.joinpath(INDEX_NAME).open(mode="wb") as handle:
+            handle.write(INDEX_MAGIC.ljust(HEADER_SIZE, b"\0"))
+            handle.write(self.index.tobytes())
+
+        with self.directory.joinpath(VOCAB_NAME).open(mode="w", encoding="utf-8") as handle:
+            for word in self.vocab:
+                handle.write(word)
+                handle.write("\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _map(path, magic):
+    with path.open(mode="rb") as handle:
+        mapping = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    if mapping[:len(magic)] != magic:
+        mapping.close()
+        raise RuntimeError(f"{path} is not a binary table cache file")
+    return mapping
+
+
+class TableCache:
+    """Read only access to a binary cache written by TableCacheWriter."""
+
+    def __init__(self, directory):
+        check_byteorder("the binary table cache")
+        self.directory = Path(directory)
+        self._records_map = _map(self.directory.joinpath(RECORDS_NAME), RECORDS_MAGIC)
+        self._index_map = _map(self.directory.joinpath(INDEX_NAME), INDEX_MAGIC)
+        self.records = memoryview(self._records_map)[HEADER_SIZE:].cast('I')
+        self.index = memoryview(self._index_map)[HEADER_SIZE:].cast('Q')
+        self.doc_ids = self.index[0::INDEX_WIDTH][:-1]
+
+        with self.directory.joinpath(VOCAB_NAME).open(mode="r", encoding="utf-8", newline="\n") as handle:
+            self.words = handle.read().split("\n")[:-1]
+        self._word_ids = None
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __contains__(self, doc_id):
+        return self._find(doc_id) is not None
+
+    def _find(self, doc_id):
+        i = bisect_left(self.doc_ids, doc_id)
+        if i < len(self.doc_ids) and self.doc_ids[i] == doc_id:
+            return i
+        return None
+
+    def _entry(self, doc_id):
+        i = self._find(doc_id)
+        if i is None:
+            raise KeyError(doc_id)
+        return i * INDEX_WIDTH
+
+    def is_spam(self, doc_id):
+        return self.index[self._entry(doc_id) + 2] == 1
+
+    def counts(self, doc_id):
+        """
+        Returns the (word_ids, counts) of a document as two
+        memoryviews straight over the mapped records. They must
+        be released (or dropped) before the cache is closed.
+        """
+        e = self._entry(doc_id)
+        first = self.index[e + 1] * RECORD_WIDTH
+        end = self.index[e + 1 + INDEX_WIDTH] * RECORD_WIDTH
+        return (self.records[first + 1:end:RECORD_WIDTH],
+                self.records[first + 2:end:RECORD_WIDTH])
+
+    def word_table(self, doc_id):
+        """Returns the word -> count table of a document."""
+        word_ids, counts = self.counts(doc_id)
+        words = self.words
+        return {words[w]: c for w, c in zip(word_ids, counts)}
+
+    def word_id(self, word):
+        if self._word_ids is None:
+            self._word_ids = {word: i for i, word in enumerate(self.words)}
+        return self._word_ids.get(word)
+
+    def close(self):
+        self.records.release()
+        self.index.release()
+        self.doc_ids.release()
+        self._records_map.close()
+        self._index_map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_text_table(path):
+    """Reads a text table written by HttpEmail.print_word_table into word -> count."""
+    table = {}
+    with Path(path).open(mode="r") as handle:
+        for line in handle:
+            word, count, relative_freq = line.rsplit(' ', 2)
+            table[word] = int(count)
+    return table
+
+
+def convert_text_tables(source, destination):
+    """
+    Converts the {target}.table text files of the |source| cache
+    directory into a binary cache in |destination|. Returns the
+    number of documents converted.
+    """
+    source = Path(source)
+    destination = Path(destination)
+    destination.mkdir(parents=True, exist_ok=True)
+
+    tables = []
+    for path in source.glob("*.table"):
+        # {numeric-id}.{spam|ham}.table
+        name_data = path.name.split('.')
+        tables.append((int(name_data[0]), "spam" == name_data[1], path))
+    tables.sort()
+
+    with TableCacheWriter(destination) as writer:
+        for doc_id, is_spam, path in tables:
+            writer.add(doc_id, is_spam, read_text_table(path))
+    return len(tables)
+
+
+def iterate_cache(cache_dir, shuffle_seed=None):
+    """
+    Yields the (doc_id, is_spam, word -> count) of every document
+    of the per-email cache in |cache_dir|, binary or text, in
+    doc_id order or shuffled with |shuffle_seed|.
+    """
+    cache_dir = Path(cache_dir)
+    if cache_dir.joinpath(INDEX_NAME).exists():
+        with TableCache(cache_dir) as cache:
+            doc_ids = list(cache.doc_ids)
+            if shuffle_seed is not None:
+                random.Random(shuffle_seed).shuffle(doc_ids)
+            for doc_id in doc_ids:
+                yield (doc_id, cache.is_spam(doc_id), cache.word_table(doc_id))
+        return
+
+    # {numeric id}.{spam|ham}.table, the global TABLE files aside.
+    paths = sorted(path for path in cache_dir.glob("*.table") if path.name[0].isdigit())
+    if shuffle_seed is not None:
+        random.Random(shuffle_seed).shuffle(paths)
+    for path in paths:
+        name_data = path.name.split('.')
+        yield (int(name_data[0]), "spam" == name_data[1], read_text_table(path))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(f"usage: python -m udax.tablecache <text-cache-dir> <binary-cache-dir>")
+        sys.exit(1)
+    print("Converted %d tables" % convert_text_tables(sys.argv[1], sys.argv[2]))
+
@@ -0,0 +1,129 @@
+"""
+The spam/ham labels of a TREC dataset, read from its
+full/index file into a bitset.
+
+TREC 05 and 06 name their messages data/<corpus>/<target>
+and TREC 07 names them data/inmail.<target>. Both are
+keyed here by a single integer, corpus * stride + target,
+with the corpus always 0 for TREC 07.
+
+Parsing the text index is only done once: the bitsets are
+cached next to it (full/index.bits) and reused as long as
+the index file keeps its size and modification time.
+"""
+import re
+import struct
+from pathlib import Path
+
+
+STANDARD = "standard"
+TREC7 = "trec7"
+
+BITS_MAGIC = b"UDAXBIT2"
+BITS_HEADER = struct.Struct("<8sQqQQ")
+
+_PATTERNS = {
+    STANDARD: re.compile(rb"^(\S+) \S*?/(\d+)/(\d+)[ \t\r]*$", re.M),
+    TREC7: re.compile(rb"^(\S+) \S*?\.(\d+)[ \t\r]*$", re.M),
+}
+
+
+class TrecIndex:
+    """
+    Spam flags of a dataset, in |bits|, along with the messages
+    the index lists at all, in |present|, so that a message
+    missing from the index is an error rather than ham.
+    """
+
+    def __init__(self, stride, bits, present):
+        self.stride = stride
+        self.bits = bits
+        self.present = present
+
+    def is_spam(self, corpus, target=None):
+        """
+        TREC 05/06: is_spam(corpus, target)
+        TREC 07:    is_spam(target)
+        """
+        if target is None:
+            name = f"{corpus}"
+            corpus, target = 0, corpus
+        else:
+            name = f"{corpus}/{target}"
+        k = corpus * self.stride + target
+        i = k >> 3
+        if target >= self.stride or i >= len(self.present) or ((self.present[i] >> (k & 7)) & 1) == 0:
+            raise RuntimeError(f"Message {name} is missing from the index")
+        return ((self.bits[i] >> (k & 7)) & 1) == 1
+
+
+def parse_index(index_file, layout):
+    """Parses the text index of a dataset with the given layout."""
+    entries = []
+    with Path(index_file).open(mode="rb") as handle:
+        data = handle.read()
+    matches = _PATTERNS[layout].findall(data)
+    lines = sum(1 for line in data.split(b"\n") if len(line.strip()) > 0)
+    if len(matches) != lines:
+        raise RuntimeError(f"{lines - len(matches)} lines of {index_file} are not "
+                           f"'<label> <path>' entries of the {layout} layout")
+
+    stride = 1
+    if layout == STANDARD:
+        for label, corpus, target in matches:
+            entries.append((label == b"spam", int(corpus), int(target)))
+    else:
+        for label, target in matches:
+            entries.append((label == b"spam", 0, int(target)))
+    for is_spam, corpus, target in entries:
+        stride = max(stride, target + 1)
+
+    size = 0
+    for is_spam, corpus, target in entries:
+        size = max(size, corpus * stride + target + 1)
+    bits = bytearray((size + 7) >> 3)
+    present = bytearray(len(bits))
+    for is_spam, corpus, target in entries:
+        # Later entries win, like they did with the lists.
+        k = corpus * stride + target
+        present[k >> 3] |= 1 << (k & 7)
+        if is_spam:
+            bits[k >> 3] |= 1 << (k & 7)
+        else:
+            bits[k >> 3] &= ~(1 << (k & 7)) & 0xff
+    return TrecIndex(stride, bytes(bits), bytes(present))
+
+
+def load_index(index_file, layout):
+    """
+    Returns the TrecIndex of |index_file|, from its binary cache
+    when that is still fresh, otherwise by parsing it (and then
+    caching it, if the dataset directory is writable).
+    """
+    index_file = Path(index_file)
+    bits_file = index_file.with_name(index_file.name + ".bits")
+    st = index_file.stat()
+
+    try:
+        with bits_file.open(mode="rb") as handle:
+            header = handle.read(BITS_HEADER.size)
+            if len(header) == BITS_HEADER.size:
+                magic, size, mtime_ns, stride, length = BITS_HEADER.unpack(header)
+                if magic == BITS_MAGIC and size == st.st_size and mtime_ns == st.st_mtime_ns:
+                    bits = handle.read(length)
+                    present = handle.read(length)
+                    if len(bits) == length and len(present) == length:
+                        return TrecIndex(stride, bits, present)
+    except FileNotFoundError:
+        pass
+
+    index = parse_index(index_file, layout)
+    try:
+        with bits_file.open(mode="wb") as handle:
+            handle.write(BITS_HEADER.pack(BITS_MAGIC, st.st_size, st.st_mtime_ns, index.stride, len(index.bits)))
+            handle.write(index.bits)
+            handle.write(index.present)
+    except OSError:
+        # A read only dataset simply goes uncached.
+        pass
+    return index
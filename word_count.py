@@ -1,25 +1,61 @@
-import nltk
+import argparse
 import pandas as pd
+from collections import Counter
+from udax.sketch import MisraGries
 
-df = pd.read_csv('filtered_data.csv', index_col=0)
-df = df.sample(frac=1).reset_index(drop=True)
+# filtered_data.csv is read this many rows at
+# a time, so only one chunk is ever in memory.
+default_chunksize = 10000
 
-from collections import Counter
+outputs = {
+    True: 'most_common_spam.txt',
+    False: 'most_common_ham.txt',
+}
+
+
+def count_words (path, chunksize=default_chunksize, approx=None):
+    """
+    Counts the words of the spam and ham messages of |path| in a
+    single pass over it. Returns label -> Counter, or label ->
+    MisraGries summary of |approx| counters when |approx| is set.
+    """
+    if approx is None:
+        counts = {True: Counter(), False: Counter()}
+    else:
+        counts = {True: MisraGries(approx), False: MisraGries(approx)}
 
-# all_ham_words = df[df['label'] == False]['message'].tolist()
-# all_ham_words = " ".join([str(word) for word in all_ham_words])
+    chunks = pd.read_csv(path, index_col=0, dtype={'message': str}, chunksize=chunksize)
+    for chunk in chunks:
+        for label in [True, False]:
+            messages = chunk[chunk['label'] == label]['message'].tolist()
+            if len(messages) == 0:
+                continue
+            words = " ".join([str(word) for word in messages]).split(" ")
+            if approx is None:
+                counts[label].update(words)
+            else:
+                counts[label].update(Counter(words))
+    return counts
 
-# ham_word_count = Counter(all_ham_words.split(" ")).most_common()
-# fout = open('most_common_ham.txt', 'w+')
-# for word, count in ham_word_count:
-#     fout.write(f"{word} {count}\n")
-# fout.close()
 
-all_spam_words = df[df['label'] == True]['message'].tolist()
-all_spam_words = " ".join([str(word) for word in all_spam_words])
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes the most common words of the spam and ham "
+                                                 "messages of filtered_data.csv into most_common_spam.txt "
+                                                 "and most_common_ham.txt.")
+    parser.add_argument("--top", type=int, default=None,
+            help="only write the K most common words of each")
+    parser.add_argument("--chunksize", type=int, default=default_chunksize,
+            help="rows of filtered_data.csv read at a time")
+    parser.add_argument("--approx", type=int, default=None, metavar="COUNTERS",
+            help="count approximately in bounded memory, keeping at most this "
+                 "many words per label (Misra-Gries); counts are lower bounds")
+    args = parser.parse_args()
 
-spam_word_count = Counter(all_spam_words.split(" ")).most_common()
-fout = open('most_common_spam.txt', 'w+')
-for word, count in spam_word_count:
-    fout.write(f"{word} {count}\n")
-fout.close()
+    counts = count_words('filtered_data.csv', max(1, args.chunksize), args.approx)
+    for label, path in outputs.items():
+        with open(path, 'w+') as fout:
+            for word, count in counts[label].most_common(args.top):
+                fout.write(f"{word} {count}\n")
+        if args.approx is not None:
+            print(f"{path}: counts are at most {counts[label].error} below the true counts "
+                  f"of {counts[label].total} words")